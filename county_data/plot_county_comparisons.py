@@ -4,6 +4,11 @@ import matplotlib
 matplotlib.use('Agg')  # Use non-interactive backend
 import matplotlib.pyplot as plt
 import os
+import sys
+
+# Shared CSV loader lives in src/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import input_loader
 
 def create_combined_box_plot_robust():
     """
@@ -28,7 +33,7 @@ def create_combined_box_plot_robust():
         try:
             # Read the CSV file
             folder_path = f'./county_data/{county_name}/'
-            df = pd.read_csv(f'{folder_path}/customized_combined_output_AFTER.csv')
+            df = input_loader.read_csv(f'{folder_path}/customized_combined_output_AFTER.csv')
             
             # Create DataFrame with specified columns
             df_to_plot = df[columns_to_plot].copy()
@@ -129,7 +134,7 @@ def create_combined_box_plot_fixed_scale():
         try:
             # Read the CSV file
             folder_path = f'./county_data/{county_name}/'
-            df = pd.read_csv(f'{folder_path}/customized_combined_output_AFTER.csv')
+            df = input_loader.read_csv(f'{folder_path}/customized_combined_output_AFTER.csv')
             
             # Create DataFrame with specified columns
             df_to_plot = df[columns_to_plot].copy()
@@ -234,7 +239,7 @@ def create_individual_plots():
         try:
             # Read the CSV file
             folder_path = f'./county_data/{county}/'
-            df = pd.read_csv(f'{folder_path}/customized_combined_output_AFTER.csv')
+            df = input_loader.read_csv(f'{folder_path}/customized_combined_output_AFTER.csv')
             
             # Create DataFrame with specified columns
             df_to_plot = df[columns_to_plot].copy()
@@ -1,19 +1,36 @@
 #!/usr/bin/env python3
 import pandas as pd
-import glob
 import os
+import sys
 
-def combine_travel_time_results(county_name):
+# Shared result readers live in src/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import result_io
+import results_store
+
+def combine_travel_time_results(county_name, results_store_path=None):
     """
     Combines Option 1, 2, and 3 aggregated results into a single file
     for box plot visualization.
+    
+    With results_store_path, the latest completed run of each option is read
+    from the results store instead of the aggregated files.
     """
     folder = f'county_data/{county_name}/'
     
+    if results_store_path:
+        with results_store.ResultsStore(results_store_path) as store:
+            missing = [option for option in (1, 2, 3) if store.latest_run(county_name, option) is None]
+            if missing:
+                print(f"Missing runs for {county_name} in {results_store_path}: options {missing}")
+                return None
+            df1, df2, df3 = (store.aggregates(county_name, option) for option in (1, 2, 3))
+        return _write_combined(folder, df1, df2, df3)
+    
     # Find the most recent aggregated files for each option
-    option1_files = sorted(glob.glob(f'{folder}Option1_aggregated_*.csv'))
-    option2_files = sorted(glob.glob(f'{folder}Option2_aggregated_*.csv'))
-    option3_files = sorted(glob.glob(f'{folder}Option3_aggregated_*.csv'))
+    option1_files = result_io.find_result_files(folder, 'Option1_aggregated_')
+    option2_files = result_io.find_result_files(folder, 'Option2_aggregated_')
+    option3_files = result_io.find_result_files(folder, 'Option3_aggregated_')
     
     if not option1_files or not option2_files or not option3_files:
         print(f"Missing aggregated files for {county_name}!")
@@ -23,10 +40,12 @@ def combine_travel_time_results(county_name):
         return None
     
     # Read the most recent file for each option
-    df1 = pd.read_csv(option1_files[-1])
-    df2 = pd.read_csv(option2_files[-1])
-    df3 = pd.read_csv(option3_files[-1])
-    
+    df1 = result_io.read_table(option1_files[-1])
+    df2 = result_io.read_table(option2_files[-1])
+    df3 = result_io.read_table(option3_files[-1])
+    return _write_combined(folder, df1, df2, df3)
+
+def _write_combined(folder, df1, df2, df3):
     # Rename columns to match expected format
     df1 = df1.rename(columns={'min_travel_time': 'Option1_aggregated_min_travel_time'})
     df2 = df2.rename(columns={'min_travel_time': 'Option2_aggregated_min_travel_time'})
@@ -54,6 +73,7 @@ if __name__ == '__main__':
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("--county_name", type=str, required=True)
+    parser.add_argument("--results_store", type=str, nargs='?', const=results_store.DEFAULT_STORE_PATH, default=None)
     args = parser.parse_args()
     
-    combine_travel_time_results(args.county_name.capitalize())
\ No newline at end of file
+    combine_travel_time_results(args.county_name.capitalize(), results_store_path=args.results_store)
\ No newline at end of file
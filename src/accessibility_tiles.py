@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""Export the tract- and parcel-level accessibility of counties as vector tiles with a map viewer.
+
+Reads the results of `hca evaluate` (customized_combined_output.csv), the
+latest Option 3 aggregated file and the Option 3 parcel centroids of each
+county, and the SVI tract shapes of the state, and writes to the output folder:
+
+    accessibility.mbtiles   gzipped Mapbox Vector Tiles (MBTiles 1.3, for tile servers and GIS tools)
+    tiles/{z}/{x}/{y}.pbf   the same tiles as files, read by the viewer
+    index.html              a MapLibre GL viewer of the tiles
+
+The tiles have two layers (see vector_tiles for the tiling):
+
+    tracts   tract polygons at every zoom, simplified per zoom; nearest-hospital
+             minutes of Options 1 and 2 (opt1_min, opt2_min), the mean and the
+             worst top-x mean of the tract's parcels (opt3_mean, opt3_worst,
+             as in file_evaluator), their differences and the SVI vehicle counts
+    parcels  parcel centroids from --parcel_min_zoom; nearest-hospital minutes
+             (min_tt, median_tt) and the difference to the tract's Option 1 and 2
+             times. Below --max_zoom nearby parcels are merged into one point
+             with mean values and a count.
+
+Values are quantized before tiling (minutes to integers, scores to 2 decimals),
+which keeps the tiles small. Browsers do not load tiles from file:// pages, so
+the viewer is opened through a local web server (--serve); the MapLibre library
+and the optional OpenStreetMap background come from the web.
+
+    python src/accessibility_tiles.py --county_name Bladen --state_name NorthCarolina --serve
+"""
+import argparse
+import functools
+import http.server
+import json
+import os
+import shutil
+import time
+
+import pandas as pd
+
+import input_loader
+import instrumentation
+import result_io
+import vector_tiles
+
+DEFAULT_MIN_ZOOM = 6
+DEFAULT_MAX_ZOOM = 14
+DEFAULT_PARCEL_MIN_ZOOM = 10
+DEFAULT_PORT = 8000
+# Tile attribute -> decimals kept (0: integer)
+TRACT_ATTRIBUTES = {'poly_idx': 0, 'E_NOVEH': 0, 'M_NOVEH': 0, 'parcels': 0, 'opt1_min': 0, 'opt2_min': 0,
+                    'opt3_mean': 0, 'opt3_worst': 0, 'opt3_worst_median': 0, 'opt3_worst_minus_opt1': 0,
+                    'opt3_worst_minus_opt2': 0, 'pp_score': 2}
+PARCEL_ATTRIBUTES = {'min_tt': 0, 'median_tt': 0, 'minus_opt1': 0, 'minus_opt2': 0}
+
+
+def load_county_results(county_name):
+    """Tract table (one row per tract, TRACT_ATTRIBUTES columns) and parcel table (latitude, longitude,
+    PARCEL_ATTRIBUTES columns) of a county."""
+    folder_path = f'county_data/{county_name}/'
+    combined_path = os.path.join(folder_path, 'customized_combined_output.csv')
+    option3_files = result_io.find_result_files(folder_path, 'Option3_aggregated_')
+    if not os.path.exists(combined_path) or len(option3_files) == 0:
+        raise FileNotFoundError(f"No evaluated results in {folder_path}; run `hca route` for Options 1-3 "
+                                "and `hca evaluate` first")
+    combined = input_loader.read_csv(combined_path)
+    tracts = pd.DataFrame({
+        'poly_idx': combined['poly_idx'],
+        'E_NOVEH': combined['E_NOVEH'],
+        'M_NOVEH': combined['M_NOVEH'],
+        'parcels': combined['num_parcels'],
+        'opt1_min': combined['Option1_aggregated_min_travel_time'],
+        'opt2_min': combined['Option2_aggregated_min_travel_time'],
+        'opt3_worst': combined['avg_top_x'],
+        'opt3_worst_median': combined['median_top_x'],
+        'opt3_worst_minus_opt1': combined['avg_top_x'] - combined['Option1_aggregated_min_travel_time'],
+        'opt3_worst_minus_opt2': combined['avg_top_x'] - combined['Option2_aggregated_min_travel_time'],
+        'pp_score': combined['pp_score_n'],
+    })
+
+    # Latest Option 3 run (file_evaluator combines the first file it finds; normally there is one)
+    aggregated = result_io.read_table(option3_files[-1], columns=['to_id', 'min_travel_time', 'median_travel_time'])
+    centroids = input_loader.read_csv(os.path.join(folder_path, 'Option3_residential_parcel_centroids.csv'),
+                                      usecols=['new_index', 'poly_idx', 'latitude', 'longitude'])
+    parcels = centroids.merge(aggregated, left_on='new_index', right_on='to_id', how='inner')
+    parcels = parcels.merge(tracts[['poly_idx', 'opt1_min', 'opt2_min']], on='poly_idx', how='left')
+    parcels = pd.DataFrame({
+        'latitude': parcels['latitude'],
+        'longitude': parcels['longitude'],
+        'poly_idx': parcels['poly_idx'],
+        'min_tt': parcels['min_travel_time'],
+        'median_tt': parcels['median_travel_time'],
+        'minus_opt1': parcels['min_travel_time'] - parcels['opt1_min'],
+        'minus_opt2': parcels['min_travel_time'] - parcels['opt2_min'],
+    })
+    opt3_mean = parcels.groupby('poly_idx')['min_tt'].mean().rename('opt3_mean')
+    tracts = tracts.merge(opt3_mean, left_on='poly_idx', right_index=True, how='left')
+    return tracts, parcels
+
+
+def load_tract_shapes(state_name, county_names):
+    """SVI tract polygons (lon/lat) of the counties with poly_idx numbered as in geopandas_analysis."""
+    svi_path = f'state_data/SVI_{state_name}_SHP.shp'
+    where = input_loader.sql_in('COUNTY', [f"{name} County" for name in county_names])
+    shapes = input_loader.read_layer(svi_path, columns=['COUNTY', 'GEOID'], where=where)
+    shapes['poly_idx'] = shapes.index + 1
+    return shapes.to_crs(4326)
+
+
+def build_tiles(tracts, parcels, shapes, min_zoom=DEFAULT_MIN_ZOOM, max_zoom=DEFAULT_MAX_ZOOM,
+                parcel_min_zoom=DEFAULT_PARCEL_MIN_ZOOM):
+    """{(z, x, y): tile bytes} of the tract and parcel layers."""
+    tract_values = vector_tiles.quantize(tracts.set_index('poly_idx', drop=False), TRACT_ATTRIBUTES)
+    tract_shapes = shapes[['poly_idx', 'geometry'] + (['GEOID'] if 'GEOID' in shapes.columns else [])]
+    tract_shapes = tract_shapes.merge(tract_values.reset_index(drop=True), on='poly_idx', how='inner')
+    tract_geometries = vector_tiles.geometries_to_world(tract_shapes.geometry.values)
+    tract_attributes = pd.DataFrame(tract_shapes.drop(columns='geometry'))
+
+    parcel_x, parcel_y = vector_tiles.lonlat_to_world(parcels['longitude'], parcels['latitude'])
+    parcel_attributes = vector_tiles.quantize(parcels, PARCEL_ATTRIBUTES)
+
+    tract_tiles, parcel_tiles = {}, {}
+    for zoom in range(min_zoom, max_zoom + 1):
+        with instrumentation.span('tracts', rows=len(tract_shapes), zoom=zoom):
+            tract_tiles.update(vector_tiles.polygon_layer_tiles('tracts', tract_geometries, tract_attributes, zoom))
+        if zoom >= parcel_min_zoom:
+            with instrumentation.span('parcels', rows=len(parcels), zoom=zoom):
+                parcel_tiles.update(vector_tiles.point_layer_tiles('parcels', parcel_x, parcel_y, parcel_attributes,
+                                                                   zoom, detail_zoom=max_zoom))
+    return vector_tiles.merge_layers(tract_tiles, parcel_tiles)
+
+
+def tile_metadata(name, shapes, min_zoom, max_zoom, parcel_min_zoom):
+    """MBTiles metadata, including the vector_layers description of the two layers."""
+    west, south, east, north = shapes.total_bounds
+    fields = lambda attributes: {column: 'Number' for column in attributes}
+    vector_layers = [
+        {'id': 'tracts', 'fields': dict(fields(TRACT_ATTRIBUTES), GEOID='String'),
+         'minzoom': min_zoom, 'maxzoom': max_zoom},
+        {'id': 'parcels', 'fields': dict(fields(PARCEL_ATTRIBUTES), count='Number'),
+         'minzoom': parcel_min_zoom, 'maxzoom': max_zoom},
+    ]
+    return {
+        'name': name,
+        'format': 'pbf',
+        'type': 'overlay',
+        'version': '1',
+        'description': 'Nearest-hospital travel times of census tracts (Options 1-3) and residential parcels',
+        'minzoom': min_zoom,
+        'maxzoom': max_zoom,
+        'bounds': f"{west:.6f},{south:.6f},{east:.6f},{north:.6f}",
+        'center': f"{(west + east) / 2:.6f},{(south + north) / 2:.6f},{min(max(min_zoom, 9), max_zoom)}",
+        'json': json.dumps({'vector_layers': vector_layers}),
+    }
+
+
+VIEWER_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>__TITLE__</title>
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<link rel="stylesheet" href="https://unpkg.com/maplibre-gl@4.7.1/dist/maplibre-gl.css">
+<script src="https://unpkg.com/maplibre-gl@4.7.1/dist/maplibre-gl.js"></script>
+<style>
+  body { margin: 0; font: 13px sans-serif; }
+  #map { position: absolute; top: 0; bottom: 0; width: 100%; }
+  #panel { position: absolute; top: 10px; left: 10px; background: white; padding: 8px 10px;
+           border-radius: 4px; box-shadow: 0 1px 4px rgba(0, 0, 0, 0.3); }
+  #panel label { display: block; margin-top: 4px; }
+</style>
+</head>
+<body>
+<div id="map"></div>
+<div id="panel">
+  <b>__TITLE__</b>
+  <label>Tracts: <select id="attribute">
+    <option value="opt1_min">Option 1: tract centroid, minutes</option>
+    <option value="opt2_min">Option 2: tract population centre, minutes</option>
+    <option value="opt3_mean">Option 3: mean of parcels, minutes</option>
+    <option value="opt3_worst" selected>Option 3: worst top-x parcels, minutes</option>
+    <option value="opt3_worst_minus_opt1">Option 3 worst minus Option 1, minutes</option>
+    <option value="opt3_worst_minus_opt2">Option 3 worst minus Option 2, minutes</option>
+    <option value="E_NOVEH">Households without a vehicle</option>
+  </select></label>
+  <label><input type="checkbox" id="parcels" checked> Parcels (from zoom __PARCEL_MIN_ZOOM__)</label>
+  <label><input type="checkbox" id="background" checked> OpenStreetMap background</label>
+  <div id="legend"></div>
+</div>
+<script>
+const tileUrl = location.href.replace(/[^/]*$/, '') + 'tiles/{z}/{x}/{y}.pbf';
+const minutes = [0, '#1a9850', 10, '#91cf60', 20, '#d9ef8b', 30, '#fee08b', 45, '#fc8d59', 60, '#d73027'];
+const differences = [-15, '#2166ac', -5, '#92c5de', 0, '#f7f7f7', 5, '#f4a582', 15, '#b2182b'];
+const counts = [0, '#f7fcf5', 100, '#a1d99b', 300, '#41ab5d', 1000, '#00441b'];
+function ramp(attribute) {
+  return attribute.includes('minus') ? differences : attribute === 'E_NOVEH' ? counts : minutes;
+}
+function colour(attribute) {
+  return ['case', ['has', attribute], ['interpolate', ['linear'], ['get', attribute], ...ramp(attribute)], '#cccccc'];
+}
+function legend(attribute) {
+  const stops = ramp(attribute);
+  let html = '';
+  for (let i = 0; i < stops.length; i += 2) {
+    html += '<div><span style="display:inline-block;width:12px;height:12px;background:' + stops[i + 1] +
+            '"></span> ' + stops[i] + '</div>';
+  }
+  document.getElementById('legend').innerHTML = html;
+}
+const map = new maplibregl.Map({
+  container: 'map',
+  center: [__CENTER__],
+  zoom: __ZOOM__,
+  style: {
+    version: 8,
+    sources: {
+      osm: {type: 'raster', tiles: ['https://tile.openstreetmap.org/{z}/{x}/{y}.png'], tileSize: 256,
+            attribution: '&copy; OpenStreetMap contributors'},
+      accessibility: {type: 'vector', tiles: [tileUrl], minzoom: __MIN_ZOOM__, maxzoom: __MAX_ZOOM__,
+                      bounds: [__BOUNDS__]}
+    },
+    layers: [
+      {id: 'background', type: 'raster', source: 'osm'},
+      {id: 'tracts', type: 'fill', source: 'accessibility', 'source-layer': 'tracts',
+       paint: {'fill-color': colour('opt3_worst'), 'fill-opacity': 0.6}},
+      {id: 'tract-lines', type: 'line', source: 'accessibility', 'source-layer': 'tracts',
+       paint: {'line-color': '#555555', 'line-width': 0.5}},
+      {id: 'parcels', type: 'circle', source: 'accessibility', 'source-layer': 'parcels',
+       paint: {'circle-color': colour('min_tt'), 'circle-stroke-color': '#333333', 'circle-stroke-width': 0.3,
+               'circle-radius': ['interpolate', ['linear'], ['zoom'], __PARCEL_MIN_ZOOM__, 2, __MAX_ZOOM__, 4, 18, 7]}}
+    ]
+  }
+});
+map.addControl(new maplibregl.NavigationControl());
+legend('opt3_worst');
+document.getElementById('attribute').addEventListener('change', event => {
+  map.setPaintProperty('tracts', 'fill-color', colour(event.target.value));
+  legend(event.target.value);
+});
+for (const [box, layer] of [['parcels', 'parcels'], ['background', 'background']]) {
+  document.getElementById(box).addEventListener('change', event =>
+    map.setLayoutProperty(layer, 'visibility', event.target.checked ? 'visible' : 'none'));
+}
+map.on('click', event => {
+  const features = map.queryRenderedFeatures(event.point, {layers: ['parcels', 'tracts']});
+  if (!features.length) return;
+  const rows = Object.entries(features[0].properties).map(([key, value]) => '<tr><td>' + key + '</td><td>' +
+                                                                           value + '</td></tr>');
+  new maplibregl.Popup().setLngLat(event.lngLat)
+    .setHTML('<b>' + features[0].layer.id + '</b><table>' + rows.join('') + '</table>').addTo(map);
+});
+</script>
+</body>
+</html>
+"""
+
+
+def write_viewer(path, title, metadata, parcel_min_zoom):
+    west, south, east, north = metadata['bounds'].split(',')
+    longitude, latitude, zoom = metadata['center'].split(',')
+    html = VIEWER_TEMPLATE
+    for placeholder, value in [('__TITLE__', title), ('__CENTER__', f"{longitude}, {latitude}"), ('__ZOOM__', zoom),
+                               ('__MIN_ZOOM__', metadata['minzoom']), ('__MAX_ZOOM__', metadata['maxzoom']),
+                               ('__PARCEL_MIN_ZOOM__', parcel_min_zoom),
+                               ('__BOUNDS__', f"{west}, {south}, {east}, {north}")]:
+        html = html.replace(placeholder, str(value))
+    with open(path, 'w') as f:
+        f.write(html)
+
+
+def export_tiles(county_names, state_name, output_dir, min_zoom=DEFAULT_MIN_ZOOM, max_zoom=DEFAULT_MAX_ZOOM,
+                 parcel_min_zoom=DEFAULT_PARCEL_MIN_ZOOM):
+    """Write the MBTiles archive, the tile folder and the viewer of the counties to output_dir."""
+    start_time = time.time()
+    with instrumentation.span('read_results', counties=len(county_names)) as read_results:
+        results = [load_county_results(county_name) for county_name in county_names]
+        tracts = pd.concat([county_tracts for county_tracts, _ in results], ignore_index=True)
+        parcels = pd.concat([county_parcels for _, county_parcels in results], ignore_index=True)
+        shapes = load_tract_shapes(state_name, county_names)
+        read_results.rows = len(parcels)
+    print(f"==Read {len(tracts)} tracts and {len(parcels)} parcels. Elapsed time {time.time()-start_time} sec.")
+
+    tiles = build_tiles(tracts, parcels, shapes, min_zoom, max_zoom, parcel_min_zoom)
+    print(f"==Encoded {len(tiles)} tiles, {sum(map(len, tiles.values())) / 2**20:.1f} MB, "
+          f"zooms {min_zoom}-{max_zoom}. Elapsed time {time.time()-start_time} sec.")
+
+    title = f"Hospital accessibility: {', '.join(county_names)} ({state_name})"
+    metadata = tile_metadata(title, shapes, min_zoom, max_zoom, parcel_min_zoom)
+    with instrumentation.span('write', rows=len(tiles)):
+        os.makedirs(output_dir, exist_ok=True)
+        vector_tiles.write_mbtiles(os.path.join(output_dir, 'accessibility.mbtiles'), tiles, metadata)
+        # Tiles of an earlier export may be outside the new zooms or area
+        shutil.rmtree(os.path.join(output_dir, 'tiles'), ignore_errors=True)
+        vector_tiles.write_tile_folder(os.path.join(output_dir, 'tiles'), tiles)
+        write_viewer(os.path.join(output_dir, 'index.html'), title, metadata, parcel_min_zoom)
+    print(f"==Tiles written to {output_dir}. Elapsed time {time.time()-start_time} sec.")
+    return metadata
+
+
+def serve(folder, port=DEFAULT_PORT):
+    """Serve folder on localhost until interrupted."""
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory=folder)
+    with http.server.ThreadingHTTPServer(('127.0.0.1', port), handler) as server:
+        print(f"Viewer at http://127.0.0.1:{port}/index.html (Ctrl+C to stop)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Export tract and parcel accessibility as vector tiles "
+                                                            "with a map viewer.")
+    parser.add_argument("--county_name", type=str, nargs='+', required=True,
+                        help="Names of the counties (evaluated with `hca evaluate`)")
+    parser.add_argument("--state_name", type=str, required=True, help="Name of the state")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Output folder (default: county_data/<county>/accessibility_tiles for one county, "
+                             "county_data/accessibility_tiles for several)")
+    parser.add_argument("--min_zoom", type=int, default=DEFAULT_MIN_ZOOM,
+                        help=f"Lowest zoom of the tiles (default: {DEFAULT_MIN_ZOOM})")
+    parser.add_argument("--max_zoom", type=int, default=DEFAULT_MAX_ZOOM,
+                        help=f"Highest zoom, where every parcel is kept (default: {DEFAULT_MAX_ZOOM})")
+    parser.add_argument("--parcel_min_zoom", type=int, default=DEFAULT_PARCEL_MIN_ZOOM,
+                        help=f"Lowest zoom of the parcel layer (default: {DEFAULT_PARCEL_MIN_ZOOM})")
+    parser.add_argument("--serve", type=int, nargs='?', const=DEFAULT_PORT, default=None, metavar='PORT',
+                        help=f"Serve the viewer on localhost after the export (default port: {DEFAULT_PORT})")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+    if not 0 <= args.min_zoom <= args.max_zoom <= 22:
+        parser.error("--min_zoom and --max_zoom must satisfy 0 <= min_zoom <= max_zoom <= 22")
+    instrumentation.configure_from_args(args)
+
+    # Convert county_name to have first letter capital and rest lowercase
+    county_names = [county_name.capitalize() for county_name in args.county_name]
+    output_dir = args.output or (f'county_data/{county_names[0]}/accessibility_tiles' if len(county_names) == 1
+                                 else 'county_data/accessibility_tiles')
+    export_tiles(county_names, args.state_name, output_dir, args.min_zoom, args.max_zoom,
+                 min(max(args.parcel_min_zoom, args.min_zoom), args.max_zoom))
+    instrumentation.print_summary()
+    if args.serve is not None:
+        serve(output_dir, args.serve)
+
+
+if __name__ == '__main__':
+    main()
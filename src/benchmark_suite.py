@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""Benchmark every pipeline stage on synthetic counties of fixed sizes.
+
+For each scale (number of parcels) a deterministic synthetic county is
+generated once (see synthetic_county) and the stages are run on it in order:
+
+    prep            geopandas_analysis.prep_spatial_csv_files
+    route_option1   travel_time_analysis.find_tt_matrix, Option 1
+    route_option2   ... Option 2
+    route_option3   ... Option 3
+    evaluate        file_evaluator.create_aggregated_file
+    combine         county_data/post_process.combine_travel_time_results
+    plot            plots_histogram.plot_histogram on the Option 3 result
+
+Each stage runs in a fresh spawned process, so its wall time includes its
+imports and its peak RSS is its own; the stage's output goes to
+<work_dir>/logs/. Throughput is items per second: parcels for prep,
+hospital-origin pairs for routing and Option 3 origins for the later stages.
+Results are appended to a JSON history and compared with the previous run of
+the same scales, backend and seed; --fail_on_regression exits with status 1
+when a stage is more than --max_slowdown times slower.
+
+Routing uses the drive graph backend (csr) by default so the suite runs
+offline and without a JVM; --routing_backend r5 benchmarks r5py instead.
+
+    python src/benchmark_suite.py --scales 1000 100000
+    python src/benchmark_suite.py --scales 1000000 --stages prep route_option3
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import synthetic_county
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(SRC_DIR)
+STAGES = ['prep', 'route_option1', 'route_option2', 'route_option3', 'evaluate', 'combine', 'plot']
+DEFAULT_SCALES = [1000, 100000]
+DEFAULT_WORK_DIR = 'benchmark_data'
+DEFAULT_HISTORY_PATH = 'benchmark_history.json'
+DEFAULT_MAX_SLOWDOWN = 1.25
+
+
+def _peak_rss_mb():
+    """Peak resident set size of this process in MB (None where it cannot be measured)."""
+    # On Linux ru_maxrss is inherited from the parent across fork/exec, VmHWM is not
+    with contextlib.suppress(OSError):
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 2**10
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def _run_stage(stage, county_dir, county_name, state_name, osm_name, backend, log_path):
+    """Run one stage in the current (fresh) process; returns (seconds, peak RSS in MB, items or None)."""
+    os.chdir(county_dir)
+    os.environ['MPLBACKEND'] = 'Agg'
+    for path in (SRC_DIR, os.path.join(REPO_DIR, 'county_data')):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    items = None
+    with open(log_path, 'w') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        start_time = time.perf_counter()
+        if stage == 'prep':
+            import geopandas_analysis
+            geopandas_analysis.prep_spatial_csv_files(county_name, state_name)
+        elif stage.startswith('route_option'):
+            import travel_time_analysis
+            summary = travel_time_analysis.find_tt_matrix(county_name, state_name, int(stage[-1]), osm_name,
+                                                          use_daemon=False, routing_backend=backend)
+            items = summary['num_origins'] * summary['num_hospitals']
+        elif stage == 'evaluate':
+            import file_evaluator
+            file_evaluator.create_aggregated_file(county_name)
+        elif stage == 'combine':
+            import post_process
+            post_process.combine_travel_time_results(county_name)
+        elif stage == 'plot':
+            import plots_histogram
+            latest = sorted(glob.glob(f'county_data/{county_name}/Option3_aggregated_information_*'))[-1]
+            plots_histogram.plot_histogram(county_name, os.path.splitext(os.path.basename(latest))[0])
+        else:
+            raise ValueError(f"Unknown stage {stage!r}")
+        seconds = time.perf_counter() - start_time
+    return seconds, _peak_rss_mb(), items
+
+
+def _count_rows(path):
+    with open(path, 'rb') as f:
+        return sum(1 for _ in f) - 1
+
+
+def prepare_county(work_dir, num_parcels, seed):
+    """Generate (or reuse) the synthetic county of one scale; returns its folder."""
+    county_dir = os.path.abspath(os.path.join(work_dir, f'parcels_{num_parcels}'))
+    manifest_path = os.path.join(county_dir, 'synthetic.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            if json.load(f).get('seed') == seed:
+                return county_dir
+    start_time = time.time()
+    sizes = synthetic_county.generate(county_dir, num_parcels, seed=seed)
+    with open(manifest_path, 'w') as f:
+        json.dump(dict(sizes, seed=seed), f, indent=2)
+    print(f"==Synthetic county with {num_parcels} parcels written to {county_dir}. Elapsed time {time.time()-start_time} sec.")
+    return county_dir
+
+
+def run_suite(scales=DEFAULT_SCALES, stages=STAGES, work_dir=DEFAULT_WORK_DIR, backend='csr', seed=0):
+    """Run the stages at each scale; returns one result dict per (scale, stage)."""
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for num_parcels in scales:
+        county_dir = prepare_county(work_dir, num_parcels, seed)
+        os.makedirs(os.path.join(county_dir, 'logs'), exist_ok=True)
+        for stage in stages:
+            log_path = os.path.join(county_dir, 'logs', f'{stage}.log')
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                seconds, peak_rss_mb, items = executor.submit(
+                    _run_stage, stage, county_dir, synthetic_county.DEFAULT_COUNTY, synthetic_county.DEFAULT_STATE,
+                    synthetic_county.DEFAULT_OSM, backend, log_path).result()
+            if stage == 'prep':
+                items = num_parcels
+            elif items is None:
+                items = _count_rows(os.path.join(county_dir, 'county_data', synthetic_county.DEFAULT_COUNTY,
+                                                 'Option3_residential_parcel_centroids.csv'))
+            results.append({'scale': num_parcels, 'stage': stage, 'seconds': round(seconds, 3),
+                            'peak_rss_mb': None if peak_rss_mb is None else round(peak_rss_mb, 1),
+                            'items': items, 'items_per_second': round(items / seconds, 1) if seconds else None})
+            print(f"{num_parcels:>9} parcels  {stage:<14} {seconds:9.2f} sec  "
+                  f"{results[-1]['peak_rss_mb'] or float('nan'):8.1f} MB  {results[-1]['items_per_second']} items/s")
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare_with_previous(run, history, max_slowdown=DEFAULT_MAX_SLOWDOWN):
+    """Stages of run that are more than max_slowdown times slower than in the latest comparable run of history."""
+    previous = {}
+    for earlier in history:
+        if earlier['routing_backend'] == run['routing_backend'] and earlier['seed'] == run['seed']:
+            for result in earlier['results']:
+                previous[(result['scale'], result['stage'])] = result
+    regressions = []
+    for result in run['results']:
+        before = previous.get((result['scale'], result['stage']))
+        if before and before['seconds'] > 0 and result['seconds'] > max_slowdown * before['seconds']:
+            regressions.append({'scale': result['scale'], 'stage': result['stage'], 'seconds': result['seconds'],
+                                'previous_seconds': before['seconds'],
+                                'slowdown': round(result['seconds'] / before['seconds'], 2)})
+    return regressions
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Benchmark the pipeline stages on synthetic counties.")
+    parser.add_argument("--scales", type=int, nargs='+', default=DEFAULT_SCALES,
+                        help=f"Numbers of parcels to benchmark (default: {' '.join(map(str, DEFAULT_SCALES))})")
+    parser.add_argument("--stages", type=str, nargs='+', choices=STAGES, default=STAGES,
+                        help="Stages to run (default: all); later stages need the outputs of earlier ones")
+    parser.add_argument("--work_dir", type=str, default=DEFAULT_WORK_DIR,
+                        help=f"Folder for the synthetic counties and stage logs (default: {DEFAULT_WORK_DIR})")
+    parser.add_argument("--history", type=str, default=DEFAULT_HISTORY_PATH,
+                        help=f"JSON file the results are appended to (default: {DEFAULT_HISTORY_PATH})")
+    parser.add_argument("--routing_backend", type=str, choices=['r5', 'csr'], default='csr',
+                        help="Routing backend of the route stages (default: csr, runs offline)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic counties (default: 0)")
+    parser.add_argument("--max_slowdown", type=float, default=DEFAULT_MAX_SLOWDOWN,
+                        help=f"Slowdown against the previous run reported as a regression (default: {DEFAULT_MAX_SLOWDOWN})")
+    parser.add_argument("--fail_on_regression", action="store_true",
+                        help="Exit with status 1 if any stage regressed")
+    args = parser.parse_args(argv)
+
+    stages = [stage for stage in STAGES if stage in args.stages]
+    results = run_suite(args.scales, stages, args.work_dir, args.routing_backend, args.seed)
+    run = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': _git_commit(),
+           'python': platform.python_version(), 'platform': platform.platform(),
+           'routing_backend': args.routing_backend, 'seed': args.seed, 'results': results}
+    history = load_history(args.history)
+    regressions = compare_with_previous(run, history, args.max_slowdown)
+    history.append(run)
+    with open(args.history, 'w') as f:
+        json.dump(history, f, indent=2)
+    print(f"Results appended to {args.history}")
+    for regression in regressions:
+        print(f"REGRESSION: {regression['stage']} at {regression['scale']} parcels took {regression['seconds']} sec, "
+              f"{regression['slowdown']}x the previous {regression['previous_seconds']} sec")
+    if regressions and args.fail_on_regression:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""Spatial pruning of hospital candidates so each origin is routed only to plausible nearest hospitals.
+
+A car cannot cover a great-circle distance d faster than d / max_speed, so
+d / max_speed is a lower bound on the routed travel time. Pruning runs in two
+stages:
+
+1. Each origin is routed to its k great-circle-nearest hospitals (found with a
+   KD-tree on unit-sphere coordinates). The largest of those k times is an upper
+   bound on the origin's true k-th smallest travel time.
+2. Every other hospital whose lower bound does not exceed that upper bound
+   (plus a rounding slack) is routed as well. Hospitals beyond it cannot be
+   among the k nearest, so they are skipped.
+
+The k nearest travel times and hospital ids are therefore exact. Median, mean
+and quartiles over all hospitals are not: the aggregated file of a pruned run
+leaves them NaN and reports their values over the routed candidates in
+*_pruned columns (travel_time_aggregation.aggregate_travel_times(pruned=True)).
+exact_check=True also routes the full matrix and reports any origin whose k
+nearest differ.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+import travel_time_aggregation
+
+EARTH_RADIUS_KM = 6371.0088
+# Well above any posted speed limit in NC, so the lower bound always holds
+DEFAULT_MAX_SPEED_KMH = 140.0
+# r5 reports whole minutes; a hospital is only skipped if its bound clears the upper bound by this much
+ROUNDING_SLACK_MINUTES = 1.0
+
+
+def unit_sphere_xyz(points):
+    """3-D unit vectors of a point GeoDataFrame in geographic coordinates."""
+    lon = np.radians(points.geometry.x.to_numpy())
+    lat = np.radians(points.geometry.y.to_numpy())
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+
+def km_to_chord(km):
+    return 2 * np.sin(np.minimum(km / (2 * EARTH_RADIUS_KM), np.pi / 2))
+
+
+def route_pairs_by_hospital(hospitals, origins, hospital_positions, origin_positions, route):
+    """Route only the given (hospital, origin) pairs, one routing call per hospital.
+
+    Positions index into hospitals/origins. route(hospitals, origins) returns a
+    long-format (from_id, to_id, travel_time) matrix.
+    """
+    columns = ['from_id', 'to_id', 'travel_time']
+    if len(hospital_positions) == 0:
+        return pd.DataFrame(columns=columns)
+    results = []
+    order = np.argsort(hospital_positions, kind='stable')
+    hospital_positions = hospital_positions[order]
+    origin_positions = origin_positions[order]
+    boundaries = np.flatnonzero(np.diff(hospital_positions)) + 1
+    for positions in np.split(np.arange(len(hospital_positions)), boundaries):
+        hospital = hospitals.iloc[[hospital_positions[positions[0]]]]
+        results.append(route(hospital, origins.iloc[origin_positions[positions]]))
+    return pd.concat(results, ignore_index=True)[columns]
+
+
+def _pair_travel_times(travel_times, hospital_ids, origin_ids):
+    """Travel time of each (hospital_id, origin_id) pair looked up in a long-format matrix."""
+    lookup = travel_times.set_index(['from_id', 'to_id'])['travel_time']
+    index = pd.MultiIndex.from_arrays([hospital_ids, origin_ids])
+    return lookup.reindex(index).to_numpy(dtype=float)
+
+
+def route_pruned(hospitals, origins, route, k=3, max_speed_kmh=DEFAULT_MAX_SPEED_KMH, exact_check=False):
+    """Route origins to their candidate hospitals only; same output schema as route(hospitals, origins)."""
+    start_time = time.time()
+    num_hospitals, num_origins = len(hospitals), len(origins)
+    k = min(k, num_hospitals)
+    if k == 0 or num_origins == 0:
+        return route(hospitals, origins)
+    hospital_xyz = unit_sphere_xyz(hospitals)
+    origin_xyz = unit_sphere_xyz(origins)
+    tree = cKDTree(hospital_xyz)
+
+    # Stage 1: k great-circle-nearest hospitals per origin
+    _, nearest = tree.query(origin_xyz, k=k)
+    nearest = nearest.reshape(num_origins, k)
+    stage1_hospitals = nearest.ravel()
+    stage1_origins = np.repeat(np.arange(num_origins), k)
+    stage1 = route_pairs_by_hospital(hospitals, origins, stage1_hospitals, stage1_origins, route)
+    stage1_times = _pair_travel_times(stage1, hospitals['id'].to_numpy()[stage1_hospitals],
+                                      origins['id'].to_numpy()[stage1_origins]).reshape(num_origins, k)
+    # An unreachable stage-1 pair gives no usable bound, so that origin keeps every hospital
+    upper_bound = np.where(np.isnan(stage1_times).any(axis=1), np.inf, np.nanmax(stage1_times, axis=1, initial=0))
+
+    # Stage 2: hospitals whose great-circle lower bound does not rule them out
+    radius_km = (upper_bound + ROUNDING_SLACK_MINUTES) * max_speed_kmh / 60
+    # A chord longer than the sphere diameter reaches every hospital
+    radius_chord = np.full(num_origins, 2.0 + 1e-9)
+    finite = np.isfinite(radius_km)
+    radius_chord[finite] = km_to_chord(radius_km[finite])
+    within = tree.query_ball_point(origin_xyz, r=radius_chord)
+    counts = np.fromiter((len(candidates) for candidates in within), dtype=np.int64, count=num_origins)
+    candidate_hospitals = np.fromiter((h for candidates in within for h in candidates), dtype=np.int64,
+                                      count=counts.sum())
+    candidate_origins = np.repeat(np.arange(num_origins), counts)
+    stage1_keys = stage1_origins * num_hospitals + stage1_hospitals
+    new_pairs = ~np.isin(candidate_origins * num_hospitals + candidate_hospitals, stage1_keys)
+    stage2 = route_pairs_by_hospital(hospitals, origins, candidate_hospitals[new_pairs],
+                                     candidate_origins[new_pairs], route)
+    travel_times = pd.concat([stage1, stage2], ignore_index=True)
+
+    total_pairs = num_origins * num_hospitals
+    routed_pairs = len(stage1_hospitals) + int(new_pairs.sum())
+    print(f"==Candidate pruning routed {routed_pairs} of {total_pairs} pairs "
+          f"({total_pairs - routed_pairs} skipped, {100 * (1 - routed_pairs / total_pairs):.1f}%). "
+          f"Elapsed time {time.time()-start_time} sec.")
+
+    if exact_check:
+        check_pruned_result(travel_times, route(hospitals, origins), k)
+    return travel_times
+
+
+def check_pruned_result(pruned_travel_times, full_travel_times, k):
+    """Compare the k nearest travel times of a pruned matrix with those of the full matrix."""
+    pruned = travel_time_aggregation.aggregate_travel_times(pruned_travel_times, k=k).set_index('to_id')
+    full = travel_time_aggregation.aggregate_travel_times(full_travel_times, k=k).set_index('to_id')
+    columns = ['min_travel_time'] + [travel_time_aggregation.kth_min_column(n) for n in range(2, k + 1)]
+    pruned = pruned.reindex(full.index)[columns].to_numpy(dtype=float)
+    full = full[columns].to_numpy(dtype=float)
+    mismatched = ~((pruned == full) | (np.isnan(pruned) & np.isnan(full))).all(axis=1)
+    if mismatched.any():
+        print(f"Exact check FAILED: {int(mismatched.sum())} of {len(full)} origins have different k nearest travel times.")
+    else:
+        print(f"Exact check passed: k={k} nearest travel times match the full matrix for all {len(full)} origins.")
+    return not mismatched.any()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Departure times for transit runs and the day profile of a departure sweep.
+
+Transit travel times depend on when the trip starts, so transit runs take one
+or more departures. parse_departures turns command line specs into datetimes
+on a service date (a weekday within the calendar of the GTFS feeds):
+
+    weekday_am_peak, weekday_midday, weekday_pm_peak, weekday_evening
+                      named departures on the service date
+    weekend           11:00 on the first Saturday on or after the service date
+    07:45             a time of day on the service date
+    06:00-22:00/60    every 60 minutes from 06:00 to 22:00 (inclusive)
+    2024-06-11T08:15  an explicit date and time
+
+A sweep routes every departure against one loaded network (see
+travel_time_analysis.find_tt_matrix_sweep) and write_day_profile combines the
+per-departure aggregated files of an option into
+
+    Option{X}_departure_profile         to_id, departure, min_travel_time (and min_travel_time_p{p})
+    Option{X}_departure_profile_summary one row per departure: reachable origins, mean, median
+                                        and 90th percentile of the nearest-hospital time
+    Option{X}_departure_profile_origins one row per origin: best, median and worst nearest-hospital
+                                        time over the departures
+"""
+import datetime
+import re
+
+import pandas as pd
+
+import result_io
+
+# Name -> (weekday the departure falls on, None for the service date itself; time of day)
+DEPARTURE_PRESETS = {
+    'weekday_am_peak': (None, '07:30'),
+    'weekday_midday': (None, '12:00'),
+    'weekday_pm_peak': (None, '17:00'),
+    'weekday_evening': (None, '20:00'),
+    'weekend': (5, '11:00'),
+}
+_RANGE_PATTERN = re.compile(r'^(\d{1,2}:\d{2})-(\d{1,2}:\d{2})/(\d+)$')
+
+
+def _at(date, time_of_day):
+    return datetime.datetime.combine(date, datetime.time.fromisoformat(time_of_day.zfill(5)))
+
+
+def parse_departures(specs, service_date=None):
+    """Sorted unique departure datetimes of specs; specs other than full datetimes need service_date."""
+    departures = set()
+    for spec in specs:
+        if 'T' in spec:
+            departures.add(datetime.datetime.fromisoformat(spec))
+            continue
+        if service_date is None:
+            raise ValueError(f"Departure {spec!r} needs a service date (a weekday covered by the GTFS feeds)")
+        if spec in DEPARTURE_PRESETS:
+            weekday, time_of_day = DEPARTURE_PRESETS[spec]
+            date = service_date
+            if weekday is not None:
+                date = service_date + datetime.timedelta(days=(weekday - service_date.weekday()) % 7)
+            departures.add(_at(date, time_of_day))
+        elif _RANGE_PATTERN.match(spec):
+            start, end, step = _RANGE_PATTERN.match(spec).groups()
+            departure, last = _at(service_date, start), _at(service_date, end)
+            if int(step) <= 0 or last < departure:
+                raise ValueError(f"Empty departure range {spec!r}")
+            while departure <= last:
+                departures.add(departure)
+                departure += datetime.timedelta(minutes=int(step))
+        elif re.match(r'^\d{1,2}:\d{2}$', spec):
+            departures.add(_at(service_date, spec))
+        else:
+            raise ValueError(f"Unknown departure {spec!r}; use one of {sorted(DEPARTURE_PRESETS)}, "
+                             "HH:MM, HH:MM-HH:MM/MINUTES or YYYY-MM-DDTHH:MM")
+    return sorted(departures)
+
+
+def departure_folder_name(departure):
+    return departure.strftime('%Y%m%dT%H%M')
+
+
+def write_day_profile(folder, option, aggregated_paths, output_format=result_io.DEFAULT_OUTPUT_FORMAT):
+    """Combine the aggregated files of one option ({departure: path}) into the day profile files in folder."""
+    frames = []
+    for departure, path in sorted(aggregated_paths.items()):
+        aggregated = result_io.read_table(path)
+        columns = ['to_id'] + [column for column in aggregated.columns if column.startswith('min_travel_time')]
+        frames.append(aggregated[columns].assign(departure=departure.isoformat()))
+    profile = pd.concat(frames, ignore_index=True)
+    profile = profile[['to_id', 'departure'] + [column for column in profile.columns
+                                                if column not in ('to_id', 'departure')]]
+    result_io.write_table(profile, f"{folder}/Option{option}_departure_profile", output_format)
+
+    by_departure = profile.groupby('departure')['min_travel_time']
+    summary = pd.DataFrame({
+        'reachable_origins': by_departure.count(),
+        'mean_min_travel_time': by_departure.mean(),
+        'median_min_travel_time': by_departure.median(),
+        'p90_min_travel_time': by_departure.quantile(0.9),
+    }).reset_index()
+    summary.to_csv(f"{folder}/Option{option}_departure_profile_summary.csv", index=False)
+
+    by_origin = profile.groupby('to_id')['min_travel_time']
+    origins = pd.DataFrame({
+        'best_min_travel_time': by_origin.min(),
+        'median_min_travel_time': by_origin.median(),
+        'worst_min_travel_time': by_origin.max(),
+    }).reset_index()
+    result_io.write_table(origins, f"{folder}/Option{option}_departure_profile_origins", output_format)
+    return summary
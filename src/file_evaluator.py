@@ -1,51 +1,112 @@
 #!/usr/bin/env python3
-import geopandas
-import r5py
 import numpy as np
-import shapely
 import pandas as pd
 pd.set_option('display.max_columns', None)
-import folium
-import folium.plugins
-import matplotlib.pyplot as plt
-import datetime
 import os
-import time
-import random
-import osmnx as ox
-import warnings
-import networkx as nx
 import argparse
-import re
-import sys
 
-def create_aggregated_file(county_name):
+import input_loader
+import result_io
+import results_store
+
+TOP_X_COLUMNS = ['top_x_values', 'min_top_x', 'max_top_x', 'avg_top_x', 'median_top_x', 'range_top_x',
+                 'std_dev_top_x', 'num_parcels']
+
+def group_parcels_by_tract(tract_ids, parcel_tract_ids, values):
+    """Sort parcel values by tract (stable) and return (sorted values, parcel count and start per tract).
+
+    tract_ids are the unique tract ids of the output rows; parcels of other tracts are ignored.
+    """
+    codes = pd.Index(tract_ids).get_indexer(parcel_tract_ids)
+    known = codes >= 0
+    codes, values = codes[known], np.asarray(values, dtype=float)[known]
+    order = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes, minlength=len(tract_ids))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+    return codes[order], values[order], counts, starts
+
+def top_x_statistics(tract_ids, parcel_tract_ids, values, x):
+    """Statistics of the x highest parcel values of every tract, with vectorized segment reductions.
+
+    Same columns as the former row-wise pick_top_x_and_stats: top_x_values (list,
+    descending), min/max/avg/median/range/std_dev of those values, num_parcels.
+    Tracts with fewer than x parcels (or x <= 0) get an empty list and NaN statistics.
+    """
+    codes, values, counts, _ = group_parcels_by_tract(tract_ids, parcel_tract_ids, values)
+    # One sort: by tract, highest value first, unreachable (NaN) parcels last
+    order = np.lexsort((np.where(np.isnan(values), np.inf, -values), codes))
+    values = values[order]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+
+    x = np.asarray(x, dtype=float)
+    selected = (counts >= x) & (x > 0)
+    take = np.where(selected, x, 0).astype(np.int64)
+    # Positions of every tract's top-x slice, concatenated tract after tract
+    slice_starts = np.concatenate(([0], np.cumsum(take)[:-1])).astype(np.int64)
+    offsets = np.arange(take.sum()) - np.repeat(slice_starts, take)
+    top = values[np.repeat(starts, take) + offsets]
+
+    stats = {name: np.full(len(tract_ids), np.nan) for name in TOP_X_COLUMNS[1:-1]}
+    if selected.any():
+        segments = slice_starts[selected]
+        n = take[selected]
+        # Descending order: the first value of a slice is its maximum and the last its minimum
+        has_nan = np.add.reduceat(np.isnan(top), segments) > 0
+        maximum = np.maximum.reduceat(top, segments)
+        minimum = np.minimum.reduceat(top, segments)
+        mean = np.add.reduceat(top, segments) / n
+        std = np.sqrt(np.add.reduceat((top - np.repeat(mean, n)) ** 2, segments) / n)
+        median = (top[segments + (n - 1) // 2] + top[segments + n // 2]) / 2
+        stats['min_top_x'][selected] = minimum
+        stats['max_top_x'][selected] = maximum
+        stats['avg_top_x'][selected] = mean
+        stats['median_top_x'][selected] = np.where(has_nan, np.nan, median)
+        stats['range_top_x'][selected] = maximum - minimum
+        stats['std_dev_top_x'][selected] = std
+
+    result = pd.DataFrame({'top_x_values': [chunk.tolist() for chunk in np.split(top, np.cumsum(take)[:-1])]})
+    for name in TOP_X_COLUMNS[1:-1]:
+        result[name] = stats[name]
+    result['num_parcels'] = counts
+    return result
+
+def create_aggregated_file(county_name, results_store_path=None):
+    """Combine the Option 1-3 results of a county with the worst-case top-x statistics.
+
+    Results are read from the latest runs in the results store if results_store_path
+    is given, otherwise from the aggregated files in the county folder.
+    """
+    store = results_store.ResultsStore(results_store_path) if results_store_path else None
     # Define the folder path
     folder_path = f'./county_data/{county_name}/'
 
     # Step 1: Read "Option1_county_centroids.csv" into DF dataframe
     centroids_file = os.path.join(folder_path, 'Option1_county_centroids.csv')
-    DF = pd.read_csv(centroids_file)
+    DF = input_loader.read_csv(centroids_file)
 
     # Step 2: Initialize a dictionary to store merged dataframes
     merged_dfs = {}
+    option3_parcels = (np.array([]), np.array([]))
 
     # List of Option prefixes to process
     option_prefixes = ['Option1_aggregated_', 'Option2_aggregated_', 'Option3_aggregated_']
 
     # Step 3: Iterate over each option prefix
     for prefix in option_prefixes:
-        # Find matching file in folder
-        option_files = [file for file in os.listdir(folder_path) if file.startswith(prefix) and file.endswith('.csv')]
-        
-        # Check if file exists
-        if len(option_files) > 0:
+        if store is not None:
+            # Latest completed run of this option in the results store
+            option = int(prefix[len('Option')])
+            option_df = None
+            if store.latest_run(county_name, option) is not None:
+                option_df = store.aggregates(county_name, option).drop(columns='poly_idx')
+        else:
+            # Find matching file (Parquet or CSV) in folder
+            option_files = result_io.find_result_files(folder_path, prefix)
             # Take the first matching file (assuming there is only one)
-            option_file_path = os.path.join(folder_path, option_files[0])
-            
-            # Read the file into a dataframe
-            option_df = pd.read_csv(option_file_path)
-            
+            option_df = result_io.read_table(option_files[0]) if len(option_files) > 0 else None
+
+        # Check if results exist
+        if option_df is not None:
             if prefix == 'Option3_aggregated_':
                 # Create a new column with quotient of 'to_id' divided by 10000
                 option_df['new_column'] = (option_df['to_id'] / 10000).astype(int)
@@ -53,8 +114,16 @@ def create_aggregated_file(county_name):
                 # Merge based on 'new_column' and 'poly_idx'
                 merged_df = pd.merge(option_df, DF, left_on='new_column', right_on='poly_idx', how='inner')
                 
-                # Group by 'poly_idx' and aggregate 'min_travel_time' into a list
-                grouped = merged_df.groupby('poly_idx')['min_travel_time'].apply(list).reset_index()
+                # Collect 'min_travel_time' of every tract's parcels into a list (one sort instead of a groupby-apply)
+                parcel_poly_idx = merged_df['poly_idx'].to_numpy()
+                travel_times = merged_df['min_travel_time'].to_numpy(dtype=float)
+                tract_ids = np.unique(parcel_poly_idx)
+                _, sorted_times, counts, _ = group_parcels_by_tract(tract_ids, parcel_poly_idx, travel_times)
+                grouped = pd.DataFrame({
+                    'poly_idx': tract_ids,
+                    'min_travel_time': [chunk.tolist() for chunk in np.split(sorted_times, np.cumsum(counts)[:-1])],
+                })
+                option3_parcels = (parcel_poly_idx, travel_times)
                 
                 # Merge based on 'poly_idx'
                 DF = DF.merge(grouped, on='poly_idx', how='left')
@@ -76,51 +145,9 @@ def create_aggregated_file(county_name):
 
     print(f"DataFrame DF has been successfully exported to {csv_file_path}.")
 
-    # Step 5: Proceed with further processing or analysis with DF_with_additional_columns
-    # Function to pick top x values and calculate average and median
-    # Function to pick top x highest values and calculate statistics
-    def pick_top_x_and_stats(row):
-        min_travel_times = row['Option3_aggregated_min_travel_time_list']
-        x = row['E_NOVEH']
-        
-        # Sort in descending order and pick the top x values
-        sorted_min_travel_times = sorted(min_travel_times, reverse=True)
-        
-        if len(sorted_min_travel_times) >= x and x>0:
-            top_x_values = sorted_min_travel_times[:x]
-            
-            # Calculate statistics
-            min_value = np.min(top_x_values)
-            max_value = np.max(top_x_values)
-            avg_value = np.mean(top_x_values)
-            median_value = np.median(top_x_values)
-            range_value = max_value - min_value
-            std_deviation = np.std(top_x_values)
-            
-            return pd.Series({
-                'top_x_values': top_x_values,
-                'min_top_x': min_value,
-                'max_top_x': max_value,
-                'avg_top_x': avg_value,
-                'median_top_x': median_value,
-                'range_top_x': range_value,
-                'std_dev_top_x': std_deviation,
-                'num_parcels': len(sorted_min_travel_times)
-            })
-        else:
-            return pd.Series({
-                'top_x_values': [],
-                'min_top_x': np.nan,
-                'max_top_x': np.nan,
-                'avg_top_x': np.nan,
-                'median_top_x': np.nan,
-                'range_top_x': np.nan,
-                'std_dev_top_x': np.nan,
-                'num_parcels': len(sorted_min_travel_times)
-            })
-
-    # Apply function to pick top x values and calculate stats
-    result_df = DF_with_additional_columns.apply(pick_top_x_and_stats, axis=1)
+    # Step 5: Pick the top x (E_NOVEH) highest Option 3 travel times of each tract and calculate statistics
+    result_df = top_x_statistics(DF_with_additional_columns['poly_idx'].to_numpy(), *option3_parcels,
+                                 DF_with_additional_columns['E_NOVEH'].to_numpy())
 
     # Concatenate the result_df with DF
     DF_with_additional_columns = pd.concat([DF_with_additional_columns, result_df], axis=1)
@@ -131,16 +158,24 @@ def create_aggregated_file(county_name):
     DF_with_additional_columns.to_csv(csv_file_path, index=False)
 
     print(f"DataFrame DF has been successfully exported to {csv_file_path}.")
+    if store is not None:
+        store.close()
     
 
-if __name__=='__main__':
+def main(argv=None, prog=None):
     #arg parser
-    parser = argparse.ArgumentParser(description="A script that uses county name.")
+    parser = argparse.ArgumentParser(prog=prog, description="Combine the Option 1-3 results of a county.")
     parser.add_argument("--county_name", type=str, required=True, 
                         help="Name of the county")
-    args = parser.parse_args()
+    parser.add_argument("--results_store", type=str, nargs='?', const=results_store.DEFAULT_STORE_PATH, default=None,
+                        help="Read the latest runs from this results store instead of the result files "
+                             f"(default path: {results_store.DEFAULT_STORE_PATH})")
+    args = parser.parse_args(argv)
     # Convert county_name to have first letter capital and rest lowercase
     county_name = args.county_name.capitalize()
     # download_guilford_map_sp()
-    create_aggregated_file(county_name)
+    create_aggregated_file(county_name, results_store_path=args.results_store)
+
+if __name__=='__main__':
+    main()
 
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""Car routing on a drive graph read straight from the .osm.pbf, without r5py or a JVM.
+
+The drivable ways of the OSM file (motorway ... residential, service roads
+that are not driveways or parking aisles, no private access) become a SciPy
+CSR matrix whose entries are free-flow travel times in minutes: the way's
+maxspeed, or a default speed per highway class, over the great-circle
+length of each segment; one-way tags are respected. The graph is saved next
+to the OSM file as <name>.drive_graph.npz and reloaded in well under a
+second while the OSM file is unchanged.
+
+route(hospitals, origins) snaps both point sets to the nearest node of the
+largest strongly connected component and runs scipy.sparse.csgraph.dijkstra
+from the hospital nodes, returning the same long format as r5py
+(from_id, to_id, travel_time in whole minutes). As with r5py's default
+max_time, pairs beyond MAX_TRAVEL_TIME minutes, and points farther than
+MAX_SNAP_M from the network, get no travel time. The times are free-flow:
+no turn costs, signals or congestion.
+
+The OSM file is read with pyosmium (imported only when a graph is built). To
+compare with r5py on a prepared county:
+
+    python src/graph_routing.py --county_name Bladen --option 1 --osm NorthCarolina
+"""
+import argparse
+import functools
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyproj
+import scipy.sparse
+import scipy.sparse.csgraph
+import scipy.spatial
+
+import input_loader
+
+GRAPH_VERSION = 2
+TRANSPORT_MODES = ('CAR_FREE_FLOW',)
+MAX_TRAVEL_TIME = 120  # minutes, r5py's default max_time
+MAX_SNAP_M = 1600  # r5's default search radius for linking points to streets
+PROJECTED_CRS = 'EPSG:5070'
+EARTH_RADIUS_M = 6371008.8
+MPH_TO_KMH = 1.609344
+OSM_UNDEFINED_COORDINATE = 2**31 - 1  # osmium's coordinate of an unknown location
+
+# Free-flow speeds (km/h) of the drivable highway classes when a way has no usable maxspeed
+DEFAULT_SPEEDS_KMH = {
+    'motorway': 105, 'motorway_link': 65, 'trunk': 90, 'trunk_link': 55,
+    'primary': 75, 'primary_link': 50, 'secondary': 65, 'secondary_link': 45,
+    'tertiary': 55, 'tertiary_link': 40, 'unclassified': 45, 'residential': 40,
+    'living_street': 15, 'road': 40, 'service': 20,
+}
+EXCLUDED_SERVICE = {'alley', 'driveway', 'emergency_access', 'parking', 'parking_aisle', 'private'}
+NO_ACCESS = {'no', 'private'}
+
+
+def default_graph_path(osm_path):
+    return osm_path[:-len('.osm.pbf')] + '.drive_graph.npz' if osm_path.endswith('.osm.pbf') else osm_path + '.drive_graph.npz'
+
+
+# --- OSM reading --------------------------------------------------------------------------------
+
+def _read_ways(osm_path):
+    """Node ids, lon/lat and speed (km/h) and direction (0 both, 1 forward, -1 backward) of every drivable way.
+
+    The file is read with pyosmium, which resolves the node locations of the ways
+    (nodes missing from an extract get NaN coordinates) and raises on anything
+    it cannot decode.
+    """
+    import osmium
+    refs, coordinates, speeds, directions = [], [], [], []
+    ways = (osmium.FileProcessor(osm_path, osmium.osm.NODE | osmium.osm.WAY).with_locations()
+            .with_filter(osmium.filter.EntityFilter(osmium.osm.WAY))
+            .with_filter(osmium.filter.KeyFilter('highway')))
+    for way in ways:
+        speed, direction = drive_attributes({tag.k: tag.v for tag in way.tags})
+        if speed is None:
+            continue
+        nodes = np.array([(node.ref, node.x, node.y) for node in way.nodes], dtype=np.int64).reshape(-1, 3)
+        refs.append(nodes[:, 0])
+        coordinates.append(nodes[:, 1:])
+        speeds.append(speed)
+        directions.append(direction)
+    return refs, coordinates, np.array(speeds, dtype=float), np.array(directions, dtype=np.int8)
+
+
+# --- Drive graph -------------------------------------------------------------------------------
+
+def _parse_speed(maxspeed):
+    """km/h of a maxspeed tag ('55 mph', '80', '80 km/h'), or None if it is not a plain number."""
+    parts = maxspeed.split(';')[0].strip().split()
+    try:
+        value = float(parts[0])
+    except (IndexError, ValueError):
+        return None
+    return value * MPH_TO_KMH if len(parts) > 1 and parts[1] == 'mph' else value
+
+
+def drive_attributes(tags):
+    """(speed in km/h, direction) of a way, or (None, None) if cars cannot use it."""
+    highway = tags.get('highway')
+    if highway not in DEFAULT_SPEEDS_KMH or tags.get('area') == 'yes':
+        return None, None
+    if (tags.get('access') in NO_ACCESS or tags.get('motor_vehicle') in NO_ACCESS
+            or tags.get('motorcar') in NO_ACCESS or tags.get('service') in EXCLUDED_SERVICE):
+        return None, None
+    speed = _parse_speed(tags['maxspeed']) if 'maxspeed' in tags else None
+    if not speed or speed <= 0:
+        speed = DEFAULT_SPEEDS_KMH[highway]
+    oneway = tags.get('oneway')
+    if oneway in ('-1', 'reverse'):
+        direction = -1
+    elif oneway in ('yes', 'true', '1') or (oneway is None and (
+            highway == 'motorway' or tags.get('junction') in ('roundabout', 'circular'))):
+        direction = 1
+    else:
+        direction = 0
+    return speed, direction
+
+
+def _haversine_m(lon1, lat1, lon2, lat2):
+    lon1, lat1, lon2, lat2 = (np.radians(values) for values in (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def build_graph_arrays(osm_path):
+    """CSR arrays (minutes) and node coordinates of the drive graph of an OSM file."""
+    start_time = time.time()
+    refs, coordinates, speeds, directions = _read_ways(osm_path)
+    if not refs:
+        raise ValueError(f"{osm_path} contains no drivable ways")
+    print(f"=={len(refs)} drivable ways read. Elapsed time {time.time()-start_time} sec.")
+    way_lengths = np.array([len(way_refs) for way_refs in refs])
+    all_refs = np.concatenate(refs)
+    node_ids, first, nodes = np.unique(all_refs, return_index=True, return_inverse=True)
+    # Locations in 1e-7 degrees, undefined for nodes missing from the file
+    x, y = np.concatenate(coordinates)[first].T
+    located = (x != OSM_UNDEFINED_COORDINATE) & (y != OSM_UNDEFINED_COORDINATE)
+    longitude = np.where(located, x * 1e-7, np.nan)
+    latitude = np.where(located, y * 1e-7, np.nan)
+    print(f"=={int(located.sum())} of {len(node_ids)} nodes located. Elapsed time {time.time()-start_time} sec.")
+
+    # Consecutive refs of the same way form a segment
+    segment_starts = np.ones(len(all_refs), dtype=bool)
+    segment_starts[np.cumsum(way_lengths) - 1] = False
+    u = nodes[segment_starts]
+    v = nodes[np.flatnonzero(segment_starts) + 1]
+    speed = np.repeat(speeds, way_lengths - 1)
+    direction = np.repeat(directions, way_lengths - 1)
+    minutes = _haversine_m(longitude[u], latitude[u], longitude[v], latitude[v]) / (speed * 1000 / 60)
+    keep = (u != v) & ~np.isnan(minutes)
+    forward = keep & (direction >= 0)
+    backward = keep & (direction <= 0)
+    tails = np.concatenate([u[forward], v[backward]])
+    heads = np.concatenate([v[forward], u[backward]])
+    # Explicit zeros are not edges to csgraph, so zero-length segments get a tiny positive time
+    weights = np.maximum(np.concatenate([minutes[forward], minutes[backward]]), 1e-6)
+
+    # Keep the fastest of parallel edges
+    order = np.lexsort((weights, heads, tails))
+    tails, heads, weights = tails[order], heads[order], weights[order]
+    first = np.ones(len(tails), dtype=bool)
+    first[1:] = (tails[1:] != tails[:-1]) | (heads[1:] != heads[:-1])
+    graph = scipy.sparse.csr_matrix((weights[first], (tails[first], heads[first])),
+                                    shape=(len(node_ids), len(node_ids)))
+    print(f"=={graph.nnz} directed edges. Elapsed time {time.time()-start_time} sec.")
+    return graph, longitude, latitude
+
+
+class DriveGraph:
+    """CSR drive graph with a KD-tree of the nodes that points may snap to."""
+
+    def __init__(self, graph, longitude, latitude):
+        self.graph = graph
+        self.longitude = longitude
+        self.latitude = latitude
+        self._to_projected = pyproj.Transformer.from_crs(input_loader.POINT_CRS, PROJECTED_CRS, always_xy=True)
+        # Only nodes of the largest strongly connected component can be reached from and reach the rest
+        _, labels = scipy.sparse.csgraph.connected_components(graph, directed=True, connection='strong')
+        located = ~np.isnan(longitude)
+        self.snap_nodes = np.flatnonzero(located & (labels == np.bincount(labels[located]).argmax()))
+        x, y = self._to_projected.transform(longitude[self.snap_nodes], latitude[self.snap_nodes])
+        self.tree = scipy.spatial.cKDTree(np.column_stack([x, y]))
+
+    @classmethod
+    def load(cls, osm_path, graph_path=None, rebuild=False):
+        """Read the saved graph of osm_path, or build and save it if missing, stale or rebuild is set."""
+        graph_path = graph_path or default_graph_path(osm_path)
+        stat = os.stat(osm_path)
+        signature = np.array([GRAPH_VERSION, stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+        if not rebuild and os.path.exists(graph_path):
+            saved = np.load(graph_path)
+            if np.array_equal(saved['signature'], signature):
+                graph = scipy.sparse.csr_matrix((saved['data'], saved['indices'], saved['indptr']),
+                                                shape=(len(saved['longitude']),) * 2)
+                return cls(graph, saved['longitude'], saved['latitude'])
+        graph, longitude, latitude = build_graph_arrays(osm_path)
+        np.savez(graph_path, signature=signature, data=graph.data, indices=graph.indices, indptr=graph.indptr,
+                 longitude=longitude, latitude=latitude)
+        print(f"Drive graph saved to {graph_path}")
+        return cls(graph, longitude, latitude)
+
+    def snap(self, points):
+        """Nearest snappable node of each point and the distance to it in metres."""
+        x, y = self._to_projected.transform(points.geometry.x.to_numpy(), points.geometry.y.to_numpy())
+        distances, positions = self.tree.query(np.column_stack([x, y]))
+        return self.snap_nodes[positions], distances
+
+    def route(self, hospitals, origins):
+        """Travel times from hospitals to origins in r5py's long format (from_id, to_id, travel_time)."""
+        hospital_nodes, hospital_distances = self.snap(hospitals)
+        origin_nodes, origin_distances = self.snap(origins)
+        times = np.full((len(hospitals), len(origins)), np.nan)
+        routable = np.flatnonzero(hospital_distances <= MAX_SNAP_M)
+        if len(routable) and len(origins):
+            sources, rows = np.unique(hospital_nodes[routable], return_inverse=True)
+            distances = scipy.sparse.csgraph.dijkstra(self.graph, directed=True, indices=sources,
+                                                      limit=MAX_TRAVEL_TIME)
+            times[routable] = distances[rows][:, origin_nodes]
+        times[:, origin_distances > MAX_SNAP_M] = np.nan
+        times[~np.isfinite(times)] = np.nan
+        return pd.DataFrame({
+            'from_id': np.repeat(hospitals['id'].to_numpy(), len(origins)),
+            'to_id': np.tile(origins['id'].to_numpy(), len(hospitals)),
+            'travel_time': np.round(times).ravel(),
+        })
+
+
+@functools.lru_cache(maxsize=None)
+def load_drive_graph(osm_path):
+    """DriveGraph of osm_path, loaded once per process."""
+    return DriveGraph.load(osm_path)
+
+
+def compare_with_r5(county_name, option, osm_filename):
+    """Route one prepared county with both backends and report time and differences."""
+    import travel_time_analysis
+
+    osm_path = f"state_data/osm/{osm_filename}.osm.pbf"
+    file_path, id_col = travel_time_analysis.origin_file(county_name, option)
+    origins = input_loader.read_points_csv(file_path, id_col)
+    hospitals = input_loader.read_points_csv(f"county_data/{county_name}/hospitals_within_buffer.csv", 'ID')
+
+    start_time = time.time()
+    graph = DriveGraph.load(osm_path)
+    graph_start = time.time() - start_time
+    start_time = time.time()
+    csr_times = graph.route(hospitals, origins)
+    csr_seconds = time.time() - start_time
+
+    start_time = time.time()
+    transport_network = travel_time_analysis.build_transport_network(osm_path)
+    r5_start = time.time() - start_time
+    start_time = time.time()
+    r5_times = travel_time_analysis.compute_travel_times(transport_network, hospitals, origins)
+    r5_seconds = time.time() - start_time
+
+    print(f"{len(hospitals)} hospitals x {len(origins)} origins")
+    print(f"csr: start {graph_start:.1f} sec, routing {csr_seconds:.2f} sec")
+    print(f"r5:  start {r5_start:.1f} sec, routing {r5_seconds:.2f} sec")
+    both = r5_times.merge(csr_times, on=['from_id', 'to_id'], suffixes=('_r5', '_csr'))
+    difference = (both['travel_time_csr'] - both['travel_time_r5']).dropna()
+    print(f"pairs routed by r5: {both['travel_time_r5'].notna().sum()}, by csr: {both['travel_time_csr'].notna().sum()}")
+    print("csr - r5 travel time (minutes):")
+    print(difference.describe())
+    nearest_r5 = r5_times.loc[r5_times.groupby('to_id')['travel_time'].idxmin().dropna(), ['to_id', 'from_id']]
+    nearest_csr = csr_times.loc[csr_times.groupby('to_id')['travel_time'].idxmin().dropna(), ['to_id', 'from_id']]
+    same = nearest_r5.merge(nearest_csr, on='to_id', suffixes=('_r5', '_csr'))
+    print(f"same nearest hospital for {(same['from_id_r5'] == same['from_id_csr']).mean():.1%} of origins")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the CSR drive graph backend with r5py on a prepared county.")
+    parser.add_argument("--county_name", type=str, required=True, help="Name of the county")
+    parser.add_argument("--option", type=int, choices=[1, 2, 3], default=1, help="Origin option to route")
+    parser.add_argument("--osm", type=str, required=True, help="Name of the OSM file (without .osm.pbf)")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the drive graph before comparing")
+    args = parser.parse_args()
+    if args.rebuild:
+        DriveGraph.load(f"state_data/osm/{args.osm}.osm.pbf", rebuild=True)
+    compare_with_r5(args.county_name.capitalize(), args.option, args.osm)
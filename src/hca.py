@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Single command for the healthcare accessibility pipeline.
+
+    python src/hca.py prep --county_name Bladen --state_name NorthCarolina
+    python src/hca.py route --county_name Bladen --state_name NorthCarolina --option 1 2 3 --osm NorthCarolina
+    python src/hca.py evaluate --county_name Bladen
+    python src/hca.py plot --county_name Bladen --results_store --option 3
+    python src/hca.py tiles --county_name Bladen --state_name NorthCarolina --serve
+    python src/hca.py merge-svi --shapefile state_data/tl_2025_37_tract.shp --csv state_data/NorthCarolina.csv
+    python src/hca.py benchmark --scales 1000 100000
+
+Each subcommand is the main() of its script, and only that script is
+imported, so a subcommand pays only for the libraries it uses (r5py and its
+JVM for route, geopandas for prep, pandas for evaluate). startup-check times
+`hca evaluate --help` in fresh interpreters and fails above a budget, so
+heavy imports do not creep back into the small jobs:
+
+    python src/hca.py startup-check --budget 1.0
+"""
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Subcommand -> (module, folder of the script, description)
+COMMANDS = {
+    'prep': ('geopandas_analysis', SRC_DIR, "Prepare the Option 1-3 origin and hospital files of counties"),
+    'route': ('travel_time_analysis', SRC_DIR, "Compute hospital travel times for counties and options"),
+    'evaluate': ('file_evaluator', SRC_DIR, "Combine the Option 1-3 results of a county"),
+    'plot': ('plots_histogram', SRC_DIR, "Plot travel time histograms of an aggregated result"),
+    'tiles': ('accessibility_tiles', SRC_DIR, "Export tract and parcel accessibility as vector tiles with a map viewer"),
+    'merge-svi': ('svi_tract_merge', os.path.join(os.path.dirname(SRC_DIR), 'state_data'),
+                  "Merge census tract shapes with SVI data"),
+    'benchmark': ('benchmark_suite', SRC_DIR, "Time every stage on synthetic counties"),
+}
+DEFAULT_STARTUP_BUDGET = 1.0  # seconds for `hca evaluate --help`, interpreter start included
+# Libraries that `hca evaluate --help` must not import
+HEAVY_MODULES = ['r5py', 'geopandas', 'osmnx', 'networkx', 'folium', 'matplotlib', 'contextily', 'shapely', 'scipy']
+
+
+def load_command(command):
+    """Import the script of a subcommand (and nothing else) and return it as a module."""
+    module_name, folder, _ = COMMANDS[command]
+    for path in (SRC_DIR, folder):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    return importlib.import_module(module_name)
+
+
+def _measure_startup(argv):
+    """Wall time of `hca <argv>` in a fresh interpreter and the heavy modules it imported."""
+    probe = (
+        "import json, sys\n"
+        f"sys.path.insert(0, {SRC_DIR!r})\n"
+        "import hca\n"
+        "try:\n"
+        f"    hca.main({argv!r})\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]), file=sys.stderr)\n"
+    )
+    start_time = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True)
+    seconds = time.perf_counter() - start_time
+    return seconds, json.loads(completed.stderr.strip().splitlines()[-1])
+
+
+def startup_check(budget=DEFAULT_STARTUP_BUDGET, repeat=5):
+    """Time `hca evaluate --help` repeat times; return True if the fastest run is within budget and imports nothing heavy."""
+    runs = [_measure_startup(['evaluate', '--help']) for _ in range(repeat)]
+    seconds = sorted(run[0] for run in runs)
+    heavy = runs[0][1]
+    print(f"hca evaluate --help: best {seconds[0]:.2f} sec, median {seconds[len(seconds) // 2]:.2f} sec "
+          f"over {repeat} runs (budget {budget:.2f} sec)")
+    if heavy:
+        print(f"Heavy modules imported: {heavy}")
+    ok = seconds[0] <= budget and not heavy
+    print("Start-up check passed." if ok else "Start-up check FAILED.")
+    return ok
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(
+        prog='hca', description="Healthcare accessibility pipeline.",
+        epilog="Run 'hca <command> --help' for the options of a command.")
+    parser.add_argument('command', choices=list(COMMANDS) + ['startup-check'],
+                        help="; ".join(f"{name}: {description}" for name, (_, _, description) in COMMANDS.items())
+                             + "; startup-check: time 'hca evaluate --help' against a budget")
+    parser.add_argument('arguments', nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.command == 'startup-check':
+        check_parser = argparse.ArgumentParser(prog='hca startup-check',
+                                               description="Time 'hca evaluate --help' against a budget.")
+        check_parser.add_argument("--budget", type=float, default=DEFAULT_STARTUP_BUDGET,
+                                  help=f"Seconds allowed (default: {DEFAULT_STARTUP_BUDGET})")
+        check_parser.add_argument("--repeat", type=int, default=5, help="Number of timed runs (default: 5)")
+        check_args = check_parser.parse_args(args.arguments)
+        if not startup_check(check_args.budget, check_args.repeat):
+            raise SystemExit(1)
+        return
+    load_command(args.command).main(args.arguments, prog=f'hca {args.command}')
+
+
+if __name__ == '__main__':
+    main()
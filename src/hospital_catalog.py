@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Statewide hospital catalog, built once per state and queried by metric distance.
+
+The state hospital layer (state_data/{state}_Hospitals/Hospitals.shp) is read
+once, projected to CONUS Albers (EPSG:5070, metres) and saved next to the
+shapefile as hospital_catalog.parquet. Later loads read that file and only
+rebuild it when the shapefile is newer. An STRtree over the projected points
+answers "hospitals within N miles of these origins" for any county centre or
+origin set in one vectorised query, returning ids, coordinates and capacity
+attributes (hgenlic) together.
+
+ID is the hospital's row number in the shapefile + 1, the id used in
+hospitals_within_buffer.csv and by the routing step.
+
+    python src/hospital_catalog.py --state_name NC --rebuild
+    python src/hospital_catalog.py --state_name NC --latitude 34.6 --longitude -78.6 --miles 40
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import pyproj
+import shapely
+
+import input_loader
+
+GEOGRAPHIC_CRS = 'EPSG:4269'
+PROJECTED_CRS = 'EPSG:5070'
+METERS_PER_MILE = 1609.344
+ATTRIBUTE_COLUMNS = ['objectid', 'fcounty', 'hgenlic']
+CATALOG_COLUMNS = ['ID'] + ATTRIBUTE_COLUMNS + ['latitude', 'longitude', 'x', 'y']
+
+
+def source_path(state_name):
+    return f'state_data/{state_name}_Hospitals/Hospitals.shp'
+
+
+def default_catalog_path(state_name):
+    return f'state_data/{state_name}_Hospitals/hospital_catalog.parquet'
+
+
+def build_table(shapefile_path):
+    """One row per hospital with ID, attributes, geographic (EPSG:4269) and projected (EPSG:5070) coordinates."""
+    hospitals = input_loader.read_layer(shapefile_path, columns=ATTRIBUTE_COLUMNS)
+    geographic = hospitals.geometry.to_crs(GEOGRAPHIC_CRS)
+    projected = hospitals.geometry.to_crs(PROJECTED_CRS)
+    table = pd.DataFrame({'ID': hospitals.index.to_numpy() + 1})
+    for column in ATTRIBUTE_COLUMNS:
+        table[column] = hospitals[column].to_numpy() if column in hospitals.columns else None
+    table['latitude'] = geographic.y.to_numpy()
+    table['longitude'] = geographic.x.to_numpy()
+    table['x'] = projected.x.to_numpy()
+    table['y'] = projected.y.to_numpy()
+    return table
+
+
+class HospitalCatalog:
+    """Hospital table plus an STRtree of the projected points."""
+
+    def __init__(self, table):
+        self.table = table.reset_index(drop=True)
+        self.tree = shapely.STRtree(shapely.points(self.table['x'].to_numpy(), self.table['y'].to_numpy()))
+        self._to_projected = pyproj.Transformer.from_crs(GEOGRAPHIC_CRS, PROJECTED_CRS, always_xy=True)
+
+    @classmethod
+    def load(cls, state_name, path=None, rebuild=False):
+        """Read the persisted catalog of a state, (re)building it if missing, stale or rebuild is set."""
+        shapefile_path = source_path(state_name)
+        path = path or default_catalog_path(state_name)
+        if rebuild or not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(shapefile_path):
+            table = build_table(shapefile_path)
+            table.to_parquet(path, index=False)
+            print(f"Hospital catalog for {state_name} built with {len(table)} hospitals: {path}")
+        else:
+            table = pd.read_parquet(path)
+        return cls(table)
+
+    def __len__(self):
+        return len(self.table)
+
+    def within_distance(self, latitudes, longitudes, miles):
+        """Hospitals within miles (straight-line, in metres on EPSG:5070) of any of the given points.
+
+        latitudes/longitudes are scalars or arrays in EPSG:4269 (WGS84 is close
+        enough). Returns catalog rows ordered by ID.
+        """
+        x, y = self._to_projected.transform(np.atleast_1d(longitudes), np.atleast_1d(latitudes))
+        _, positions = self.tree.query(shapely.points(x, y), predicate='dwithin',
+                                       distance=miles * METERS_PER_MILE)
+        return self.table.iloc[np.unique(positions)].reset_index(drop=True)
+
+    def in_county(self, county_name):
+        """Hospitals whose fcounty attribute is county_name."""
+        return self.table[self.table['fcounty'] == county_name].reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the statewide hospital catalog or query it around a point.")
+    parser.add_argument("--state_name", type=str, required=True, help="Name of the state")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the catalog even if it is up to date")
+    parser.add_argument("--latitude", type=float, help="Latitude of the query point")
+    parser.add_argument("--longitude", type=float, help="Longitude of the query point")
+    parser.add_argument("--miles", type=float, default=40, help="Query radius in miles (default: 40)")
+    args = parser.parse_args()
+    catalog = HospitalCatalog.load(args.state_name, rebuild=args.rebuild)
+    print(f"{len(catalog)} hospitals in the {args.state_name} catalog")
+    if args.latitude is not None and args.longitude is not None:
+        print(catalog.within_distance(args.latitude, args.longitude, args.miles))
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""Shared loaders for the CSV inputs and outputs of the pipeline.
+
+Each file is read once, with the pyarrow CSV engine and explicit dtypes for
+coordinates. Encoding detection looks at a bounded sample of the file instead of
+the whole file, and the result is cached per file content hash in a small
+.encoding_cache.json next to the file, so repeated runs skip detection entirely.
+Point files become GeoDataFrames with vectorised points_from_xy.
+
+Shapefiles are read with read_layer (pyogrio, Arrow batches): attribute filters
+are passed down to OGR as a where clause, the bbox limits the features read, and
+only the requested columns are loaded.
+"""
+import functools
+import hashlib
+import json
+import os
+
+import chardet
+import pandas as pd
+
+ENCODING_SAMPLE_BYTES = 64 * 1024
+ENCODING_CACHE_FILE = '.encoding_cache.json'
+POINT_CRS = "EPSG:4269"
+
+
+def file_hash(file_path):
+    """SHA-1 of the file content, read in 1 MB blocks."""
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _detect_sample_encoding(file_path):
+    with open(file_path, 'rb') as f:
+        sample = f.read(ENCODING_SAMPLE_BYTES)
+    encoding = chardet.detect(sample)['encoding']
+    # A pure-ASCII sample says nothing about later bytes; UTF-8 is the safe superset
+    if encoding is None or encoding.lower() == 'ascii':
+        encoding = 'utf-8'
+    return encoding
+
+
+@functools.lru_cache(maxsize=None)
+def _cached_encoding(file_path, content_hash):
+    cache_path = os.path.join(os.path.dirname(os.path.abspath(file_path)), ENCODING_CACHE_FILE)
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        cache = {}
+    if content_hash not in cache:
+        cache[content_hash] = _detect_sample_encoding(file_path)
+        try:
+            with open(cache_path, 'w') as f:
+                json.dump(cache, f, indent=1)
+        except OSError:
+            pass  # read-only folder: detection still works, it just is not persisted
+    return cache[content_hash]
+
+
+def detect_encoding(file_path):
+    """Encoding of file_path, detected from its first 64 kB and cached per content hash."""
+    return _cached_encoding(os.path.abspath(file_path), file_hash(file_path))
+
+
+def _has_undecoded_bytes(df):
+    """The pyarrow engine returns raw bytes for cells that are invalid in the chosen encoding."""
+    return any(
+        pd.api.types.infer_dtype(df[column], skipna=True) in ('bytes', 'mixed')
+        for column in df.columns if df[column].dtype == object
+    )
+
+
+def _remember_encoding(file_path, encoding):
+    cache_path = os.path.join(os.path.dirname(os.path.abspath(file_path)), ENCODING_CACHE_FILE)
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+        cache[file_hash(file_path)] = encoding
+        with open(cache_path, 'w') as f:
+            json.dump(cache, f, indent=1)
+    except (OSError, json.JSONDecodeError):
+        pass
+    _cached_encoding.cache_clear()
+
+
+def read_csv(file_path, usecols=None, dtype=None):
+    """Read a CSV once with the detected encoding and the pyarrow engine."""
+    encoding = detect_encoding(file_path)
+    df = pd.read_csv(file_path, encoding=encoding, engine='pyarrow', usecols=usecols, dtype=dtype)
+    if encoding.lower() != 'latin-1' and _has_undecoded_bytes(df):
+        # The sample looked like UTF-8 but a later byte is not; latin-1 decodes anything
+        _remember_encoding(file_path, 'latin-1')
+        df = pd.read_csv(file_path, encoding='latin-1', engine='pyarrow', usecols=usecols, dtype=dtype)
+    return df
+
+
+def _as_integer_ids(ids):
+    """Ids such as 10001.0 written by older exports become int64 when they are all whole numbers."""
+    if pd.api.types.is_float_dtype(ids) and ids.notna().all() and (ids == ids.round()).all():
+        return ids.astype('int64')
+    return ids
+
+
+def read_points_csv(file_path, id_col, lat_col='latitude', lon_col='longitude'):
+    """Read id/latitude/longitude columns of a CSV into a GeoDataFrame with 'id' and point geometry."""
+    import geopandas
+    df = read_csv(file_path, usecols=[id_col, lat_col, lon_col], dtype={lat_col: 'float64', lon_col: 'float64'})
+    return geopandas.GeoDataFrame(
+        {'id': _as_integer_ids(df[id_col])},
+        geometry=geopandas.points_from_xy(df[lon_col], df[lat_col]),
+        crs=POINT_CRS,
+    )
+
+
+def layer_info(path):
+    """Feature count, field names and CRS of a vector layer, without reading its features."""
+    import pyogrio
+    info = pyogrio.read_info(path)
+    return {'features': info['features'], 'fields': list(info['fields']), 'crs': info['crs']}
+
+
+def sql_in(column, values):
+    """OGR SQL 'column IN (...)' clause for a list of string values."""
+    quoted = ", ".join("'" + str(value).replace("'", "''") + "'" for value in values)
+    return f"{column} IN ({quoted})"
+
+
+def read_layer(path, columns=None, where=None, bbox=None):
+    """Read a vector layer with only the given columns, features matching where and intersecting bbox.
+
+    Missing columns are skipped. The index holds the feature ids (the row numbers
+    of the unfiltered layer), as gpd.read_file would give when reading everything.
+    """
+    import pyogrio
+    if columns is not None:
+        fields = set(layer_info(path)['fields'])
+        columns = [column for column in columns if column in fields]
+    gdf = pyogrio.read_dataframe(path, columns=columns, where=where, bbox=bbox,
+                                 fid_as_index=True, use_arrow=True)
+    gdf.index.name = None
+    return gdf
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""Named spans timing the pipeline stages.
+
+    with instrumentation.span('sjoin', rows=len(points)):
+        ...
+
+    with instrumentation.span('routing') as routing:
+        travel_times = route(hospitals, origins)
+        routing.rows = len(travel_times)
+
+A span records wall time, CPU time of the process, the increase of peak
+resident memory over its start, and rows per second when it is given a row
+count. Spans nest; a nested span is named by its path ('county/sjoin'). Each
+finished span is printed as one line, kept for summary() (the end-of-run
+table printed by the scripts), and appended as a JSON line to the trace file
+set with configure(trace_path=...) (--trace in the scripts).
+
+Peak memory: on Linux the kernel's high-water mark (VmHWM) is restarted at
+the start of every span (/proc/self/clear_refs), so a span's peak is its own;
+open outer spans keep the peaks of their inner spans. The mark is process-wide,
+so before each restart the peak so far is folded into every open span of every
+thread (a registry under a lock), and spans in other threads keep their peaks.
+Where the mark cannot be
+restarted the process peak is used, and a span that does not raise it reports
+only its change in resident memory. Without /proc the memory fields are None.
+
+configure(profile=[names]) runs the spans with those names (or paths, or
+'all') under cProfile: the top functions are printed and the stats dumped to
+profile_dir/<span path>.<pid>.<n>.prof for snakeviz or pstats. Only the
+outermost profiled span is profiled when they nest. Spans nest per thread;
+spans running at the same time in several threads share the process's peak
+memory, so their peak increases overlap. The scripts take these
+settings as --trace [path], --profile SPAN ... and --profile_dir (see
+add_arguments), so a slow run can be profiled without editing code:
+
+    python src/geopandas_analysis.py --county_name Wake --state_name NC --trace --profile sjoin
+"""
+import contextlib
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+
+DEFAULT_TRACE_PATH = 'span_trace.jsonl'
+DEFAULT_PROFILE_DIR = 'profiles'
+PROFILE_TOP_FUNCTIONS = 20
+
+_settings = {'trace_path': None, 'profile': set(), 'profile_dir': DEFAULT_PROFILE_DIR}
+_thread_state = threading.local()
+# Open spans of all threads; resetting and reading the high-water mark happen under the lock
+_all_open_spans = set()
+_memory_lock = threading.Lock()
+_finished_spans = []
+_profile_count = [0]
+_peak_resettable = [os.path.exists('/proc/self/clear_refs')]
+
+
+class Span:
+    """One timed stage; rows and attributes may be set while it runs."""
+
+    def __init__(self, name, path, rows=None, attributes=None):
+        self.name = name
+        self.path = path
+        self.rows = rows
+        self.attributes = attributes or {}
+        self.record = None
+
+    def to_record(self, start, wall_seconds, cpu_seconds, rss_start_kb, peak_delta_kb):
+        record = {
+            'span': self.path,
+            'name': self.name,
+            'start': round(start, 3),
+            'wall_seconds': round(wall_seconds, 4),
+            'cpu_seconds': round(cpu_seconds, 4),
+            'rss_start_mb': None if rss_start_kb is None else round(rss_start_kb / 1024, 1),
+            'peak_rss_delta_mb': None if peak_delta_kb is None else round(peak_delta_kb / 1024, 1),
+            'rows': self.rows,
+            'rows_per_second': round(self.rows / wall_seconds, 1) if self.rows is not None and wall_seconds > 0 else None,
+            'pid': os.getpid(),
+        }
+        record.update(self.attributes)
+        return record
+
+
+def configure(trace_path=None, profile=(), profile_dir=DEFAULT_PROFILE_DIR):
+    """Set the JSON lines trace file and the span names to profile (names, paths or 'all')."""
+    _settings['trace_path'] = trace_path
+    _settings['profile'] = set(profile or ())
+    _settings['profile_dir'] = profile_dir
+
+
+def add_arguments(parser):
+    """Add the --trace, --profile and --profile_dir options of the scripts to an argparse parser."""
+    parser.add_argument("--trace", type=str, nargs='?', const=DEFAULT_TRACE_PATH, default=None,
+                        help=f"Append one JSON line per timed stage to this file (default path: {DEFAULT_TRACE_PATH})")
+    parser.add_argument("--profile", type=str, nargs='+', default=(), metavar='SPAN',
+                        help="Run these stages (e.g. sjoin routing, or all) under cProfile")
+    parser.add_argument("--profile_dir", type=str, default=DEFAULT_PROFILE_DIR,
+                        help=f"Folder for the .prof files of --profile (default: {DEFAULT_PROFILE_DIR})")
+
+
+def configure_from_args(args):
+    configure(args.trace, args.profile, args.profile_dir)
+
+
+def _memory_kb():
+    """Current and peak resident memory of this process in kB, (None, None) without /proc."""
+    current = peak = None
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    current = int(line.split()[1])
+                elif line.startswith('VmHWM:'):
+                    peak = int(line.split()[1])
+    except OSError:
+        pass
+    return current, peak
+
+
+def _open_spans():
+    """Spans currently open in this thread, outermost first."""
+    if not hasattr(_thread_state, 'open_spans'):
+        _thread_state.open_spans = []
+    return _thread_state.open_spans
+
+
+def _fold_peak(peak):
+    """Raise the recorded peak of the open spans of all threads to peak (call with _memory_lock held)."""
+    for open_span in _all_open_spans:
+        if open_span._peak_kb is not None:
+            open_span._peak_kb = max(open_span._peak_kb, peak or 0)
+
+
+def _restart_peak():
+    """Fold the current peak into the open spans and restart the kernel's high-water mark (lock held)."""
+    _, peak = _memory_kb()
+    _fold_peak(peak)
+    if _peak_resettable[0]:
+        try:
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')
+        except OSError:
+            _peak_resettable[0] = False
+
+
+def _profiled(span_object):
+    wanted = _settings['profile']
+    return bool(wanted) and ('all' in wanted or span_object.name in wanted or span_object.path in wanted)
+
+
+def _dump_profile(profiler, span_object):
+    os.makedirs(_settings['profile_dir'], exist_ok=True)
+    _profile_count[0] += 1
+    path = os.path.join(_settings['profile_dir'],
+                        f"{span_object.path.replace('/', '.')}.{os.getpid()}.{_profile_count[0]}.prof")
+    profiler.dump_stats(path)
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+    print(f"==Profile of {span_object.path} saved to {path}; top {PROFILE_TOP_FUNCTIONS} functions by cumulative time:")
+    print(report.getvalue())
+
+
+@contextlib.contextmanager
+def span(name, rows=None, **attributes):
+    """Time the enclosed block as the stage name; attributes (county, option, ...) go into its record."""
+    open_spans = _open_spans()
+    path = '/'.join([open_span.path for open_span in open_spans[-1:]] + [name])
+    span_object = Span(name, path, rows, attributes)
+    with _memory_lock:
+        _restart_peak()
+        rss_start_kb, peak_start_kb = _memory_kb()
+        span_object._peak_kb = rss_start_kb if _peak_resettable[0] else None
+        _all_open_spans.add(span_object)
+    profiler = None
+    if _profiled(span_object) and not any(getattr(open_span, '_profiler', None) for open_span in open_spans):
+        profiler = cProfile.Profile()
+    span_object._profiler = profiler
+    open_spans.append(span_object)
+    start = time.time()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield span_object
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        wall_seconds = time.perf_counter() - wall_start
+        cpu_seconds = time.process_time() - cpu_start
+        open_spans.pop()
+        with _memory_lock:
+            rss_end_kb, peak_end_kb = _memory_kb()
+            _all_open_spans.discard(span_object)
+            # Open spans of any thread were folded at every restart; the mark since the last one is left
+            _fold_peak(peak_end_kb)
+        if rss_start_kb is None:
+            peak_delta_kb = None
+        elif span_object._peak_kb is not None:
+            peak_delta_kb = max(span_object._peak_kb, peak_end_kb) - rss_start_kb
+        elif peak_end_kb > peak_start_kb:
+            peak_delta_kb = peak_end_kb - rss_start_kb
+        else:
+            peak_delta_kb = max(0, rss_end_kb - rss_start_kb)
+        span_object.record = span_object.to_record(start, wall_seconds, cpu_seconds, rss_start_kb, peak_delta_kb)
+        _finished_spans.append(span_object.record)
+        _report(span_object.record)
+        if profiler is not None:
+            _dump_profile(profiler, span_object)
+
+
+def _format_mb(value):
+    return 'n/a' if value is None else f"{value:.1f} MB"
+
+
+def _report(record):
+    rows = '' if record['rows'] is None else f", {record['rows']} rows ({record['rows_per_second']} rows/s)"
+    print(f"==[{record['span']}] {record['wall_seconds']:.2f} sec wall, {record['cpu_seconds']:.2f} sec CPU, "
+          f"peak RSS +{_format_mb(record['peak_rss_delta_mb'])}{rows}")
+    if _settings['trace_path']:
+        with open(_settings['trace_path'], 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+
+def finished_spans():
+    """Records of the spans finished in this process so far."""
+    return list(_finished_spans)
+
+
+def summary():
+    """Finished spans grouped by path: count, total wall and CPU seconds, largest peak RSS increase, rows, rows/s."""
+    grouped = {}
+    for record in _finished_spans:
+        group = grouped.setdefault(record['span'], {'span': record['span'], 'count': 0, 'wall_seconds': 0.0,
+                                                    'cpu_seconds': 0.0, 'peak_rss_delta_mb': None, 'rows': None})
+        group['count'] += 1
+        group['wall_seconds'] += record['wall_seconds']
+        group['cpu_seconds'] += record['cpu_seconds']
+        if record['peak_rss_delta_mb'] is not None:
+            group['peak_rss_delta_mb'] = max(group['peak_rss_delta_mb'] or 0, record['peak_rss_delta_mb'])
+        if record['rows'] is not None:
+            group['rows'] = (group['rows'] or 0) + record['rows']
+    for group in grouped.values():
+        group['rows_per_second'] = (round(group['rows'] / group['wall_seconds'], 1)
+                                    if group['rows'] is not None and group['wall_seconds'] > 0 else None)
+    return list(grouped.values())
+
+
+def print_summary():
+    """Print summary() as a table, in the order the spans first finished."""
+    groups = summary()
+    if not groups:
+        return
+    width = max(len('span'), *(len(group['span']) for group in groups))
+    print(f"\n{'span':<{width}} {'count':>5} {'wall s':>10} {'CPU s':>10} {'peak RSS +MB':>13} {'rows':>12} {'rows/s':>12}")
+    for group in groups:
+        peak = '' if group['peak_rss_delta_mb'] is None else f"{group['peak_rss_delta_mb']:.1f}"
+        rows = '' if group['rows'] is None else str(group['rows'])
+        rows_per_second = '' if group['rows_per_second'] is None else f"{group['rows_per_second']:.0f}"
+        print(f"{group['span']:<{width}} {group['count']:>5} {group['wall_seconds']:>10.2f} "
+              f"{group['cpu_seconds']:>10.2f} {peak:>13} {rows:>12} {rows_per_second:>12}")
+    if _settings['trace_path']:
+        print(f"Span records appended to {_settings['trace_path']}")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Route each distinct origin location once and broadcast the result to every origin sharing it.
+
+Condos, townhouse complexes and multi-family parcels often share one centroid.
+deduplicate_origins collapses origins with identical coordinates, which is
+lossless. With a snap tolerance it also collapses origins that fall in the same
+tolerance-sized cell of a metric grid (EPSG:5070), standing in for "snaps to
+the same street vertex". That step is lossy, so the distance from every
+collapsed origin to its representative is reported.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+METRIC_CRS = "EPSG:5070"  # Albers Equal Area (metres), as used for tract geometry
+
+
+def deduplicate_origins(origins, snap_tolerance_m=None):
+    """Collapse duplicate origin locations.
+
+    Returns (representatives, mapping, snap_error_m): representatives is the subset
+    of origins that will be routed; mapping has one row per origin with its
+    'origin_id' and the 'representative_id' it takes travel times from;
+    snap_error_m is each origin's distance to its representative (all zeros
+    without snapping).
+    """
+    if snap_tolerance_m:
+        projected = origins.geometry.to_crs(METRIC_CRS)
+        x, y = projected.x.to_numpy(), projected.y.to_numpy()
+        keys = pd.DataFrame({'x': np.floor(x / snap_tolerance_m), 'y': np.floor(y / snap_tolerance_m)})
+    else:
+        keys = pd.DataFrame({'x': origins.geometry.x.to_numpy(), 'y': origins.geometry.y.to_numpy()})
+    group = keys.groupby(['x', 'y'], sort=False).ngroup().to_numpy()
+    # The first origin of each group (in input order) represents it
+    first_positions = pd.Series(np.arange(len(origins))).groupby(group).transform('first').to_numpy()
+    representative_positions = np.unique(first_positions)
+
+    ids = origins['id'].to_numpy()
+    mapping = pd.DataFrame({'origin_id': ids, 'representative_id': ids[first_positions]})
+    if snap_tolerance_m:
+        snap_error_m = np.hypot(x - x[first_positions], y - y[first_positions])
+    else:
+        snap_error_m = np.zeros(len(origins))
+    return origins.iloc[representative_positions], mapping, snap_error_m
+
+
+def expand_travel_times(travel_times, mapping):
+    """Give every origin the travel times of its representative."""
+    expanded = travel_times.merge(mapping, left_on='to_id', right_on='representative_id', how='inner')
+    expanded['to_id'] = expanded['origin_id']
+    return expanded[travel_times.columns]
+
+
+def route_deduplicated(hospitals, origins, route, snap_tolerance_m=None):
+    """Route only distinct origin locations; same output schema as route(hospitals, origins)."""
+    start_time = time.time()
+    representatives, mapping, snap_error_m = deduplicate_origins(origins, snap_tolerance_m)
+    message = f"==Deduplication: routing {len(representatives)} distinct locations for {len(origins)} origins"
+    if snap_tolerance_m:
+        snapped = snap_error_m > 0
+        message += (f" (snap tolerance {snap_tolerance_m} m; {int(snapped.sum())} origins moved, "
+                    f"mean {snap_error_m.mean():.1f} m, max {snap_error_m.max(initial=0):.1f} m)")
+    print(f"{message}. Elapsed time {time.time()-start_time} sec.")
+    return expand_travel_times(route(hospitals, representatives), mapping)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""Persistent per-pair travel time cache, so reruns only route pairs that changed.
+
+Every (hospital, origin) travel time is stored in a SQLite file under a key made
+of the network (hash of the OSM file, transport modes and departure time) and
+the hospital and origin coordinates rounded to 1e-6 degrees. Ids are not part
+of the key, so renumbered parcels still hit the cache while moved parcels and
+new hospitals miss it. On a rerun only the missing pairs are routed:
+
+1. hospitals with no cached pair at all are routed against every origin;
+2. the remaining hospitals with any missing pair are routed against the
+   origins with any missing pair.
+
+The cache holds at most max_pairs rows; the least recently used pairs are
+evicted first. The row count is kept in pair_count by insert and delete
+triggers, so checking the limit never scans the table. Unreachable pairs are
+cached as NULL and count as hits.
+"""
+import functools
+import hashlib
+import os
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+import input_loader
+
+DEFAULT_CACHE_PATH = "county_data/pair_cache.sqlite"
+DEFAULT_MAX_PAIRS = 50_000_000  # roughly 3 GB on disk
+COORDINATE_SCALE = 1e6  # coordinates are keyed in micro-degrees (about 0.1 m)
+
+_SCHEMA = """
+BEGIN IMMEDIATE;
+CREATE TABLE IF NOT EXISTS networks (
+    id INTEGER PRIMARY KEY,
+    network_key TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pairs (
+    network INTEGER NOT NULL,
+    h_lon INTEGER NOT NULL,
+    h_lat INTEGER NOT NULL,
+    o_lon INTEGER NOT NULL,
+    o_lat INTEGER NOT NULL,
+    travel_time REAL,
+    last_used INTEGER NOT NULL,
+    UNIQUE (network, h_lon, h_lat, o_lon, o_lat)
+);
+CREATE INDEX IF NOT EXISTS pairs_last_used ON pairs (last_used);
+CREATE TABLE IF NOT EXISTS pair_count (pairs INTEGER NOT NULL);
+INSERT INTO pair_count SELECT COUNT(*) FROM pairs WHERE NOT EXISTS (SELECT 1 FROM pair_count);
+CREATE TRIGGER IF NOT EXISTS pairs_inserted AFTER INSERT ON pairs
+BEGIN UPDATE pair_count SET pairs = pairs + 1; END;
+CREATE TRIGGER IF NOT EXISTS pairs_deleted AFTER DELETE ON pairs
+BEGIN UPDATE pair_count SET pairs = pairs - 1; END;
+COMMIT;
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def _osm_hash(osm_path, size, mtime):
+    return input_loader.file_hash(osm_path)
+
+
+def _content_hash(path):
+    stat = os.stat(path)
+    return _osm_hash(os.path.abspath(path), stat.st_size, stat.st_mtime)
+
+
+def network_key(osm_path, transport_modes, departure, gtfs_paths=(), departure_time_window=None, percentiles=None):
+    """Key of a routing setup: OSM file content, transport modes and departure time.
+
+    GTFS file contents, the departure time window and the percentile are only
+    part of the key when given, so the keys of car runs are unchanged.
+    """
+    parts = [_content_hash(osm_path), ','.join(sorted(transport_modes)), departure.isoformat()]
+    parts.extend(_content_hash(gtfs_path) for gtfs_path in sorted(gtfs_paths))
+    if departure_time_window is not None:
+        parts.append(f"window={int(departure_time_window.total_seconds())}")
+    if percentiles:
+        parts.append('percentiles=' + ','.join(str(percentile) for percentile in percentiles))
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+
+def _coordinate_keys(points):
+    return (np.round(points.geometry.x.to_numpy() * COORDINATE_SCALE).astype(np.int64),
+            np.round(points.geometry.y.to_numpy() * COORDINATE_SCALE).astype(np.int64))
+
+
+class PairCache:
+    """SQLite store of per-pair travel times for one routing setup."""
+
+    def __init__(self, path, network_key, max_pairs=DEFAULT_MAX_PAIRS):
+        self.path = path
+        self.max_pairs = max_pairs
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(_SCHEMA)
+        self.connection.execute("INSERT OR IGNORE INTO networks (network_key) VALUES (?)", (network_key,))
+        self.network = self.connection.execute(
+            "SELECT id FROM networks WHERE network_key = ?", (network_key,)).fetchone()[0]
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def size(self):
+        return self.connection.execute("SELECT pairs FROM pair_count").fetchone()[0]
+
+    def lookup(self, hospitals, origins):
+        """Cached pairs as (hospital positions, origin positions, travel times); marks them as used."""
+        connection = self.connection
+        connection.execute("CREATE TEMP TABLE IF NOT EXISTS query_h (pos INTEGER, lon INTEGER, lat INTEGER)")
+        connection.execute("CREATE TEMP TABLE IF NOT EXISTS query_o (pos INTEGER, lon INTEGER, lat INTEGER)")
+        connection.execute("DELETE FROM query_h")
+        connection.execute("DELETE FROM query_o")
+        h_lon, h_lat = _coordinate_keys(hospitals)
+        o_lon, o_lat = _coordinate_keys(origins)
+        connection.executemany("INSERT INTO query_h VALUES (?, ?, ?)",
+                               zip(range(len(hospitals)), h_lon.tolist(), h_lat.tolist()))
+        connection.executemany("INSERT INTO query_o VALUES (?, ?, ?)",
+                               zip(range(len(origins)), o_lon.tolist(), o_lat.tolist()))
+        join = """FROM query_h h JOIN query_o o
+                  JOIN pairs p ON p.network = ? AND p.h_lon = h.lon AND p.h_lat = h.lat
+                              AND p.o_lon = o.lon AND p.o_lat = o.lat"""
+        rows = connection.execute(f"SELECT h.pos, o.pos, p.travel_time {join}", (self.network,)).fetchall()
+        if rows:
+            connection.execute(f"UPDATE pairs SET last_used = ? WHERE rowid IN (SELECT p.rowid {join})",
+                               (int(time.time()), self.network))
+        connection.commit()
+        if not rows:
+            return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0)
+        h_pos, o_pos, travel_times = zip(*rows)
+        return (np.array(h_pos, dtype=np.int64), np.array(o_pos, dtype=np.int64),
+                np.array(travel_times, dtype=float))
+
+    def store(self, hospitals, origins, travel_times):
+        """Add or update a routed (from_id, to_id, travel_time) matrix and evict the oldest pairs beyond max_pairs."""
+        h_lon, h_lat = _coordinate_keys(hospitals)
+        o_lon, o_lat = _coordinate_keys(origins)
+        h_pos = pd.Index(hospitals['id']).get_indexer(travel_times['from_id'])
+        o_pos = pd.Index(origins['id']).get_indexer(travel_times['to_id'])
+        values = travel_times['travel_time'].to_numpy(dtype=float)
+        now = int(time.time())
+        # An upsert rather than INSERT OR REPLACE: a replaced row would fire the insert trigger only
+        self.connection.executemany(
+            """INSERT INTO pairs VALUES (?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT (network, h_lon, h_lat, o_lon, o_lat)
+               DO UPDATE SET travel_time = excluded.travel_time, last_used = excluded.last_used""",
+            zip([self.network] * len(values), h_lon[h_pos].tolist(), h_lat[h_pos].tolist(),
+                o_lon[o_pos].tolist(), o_lat[o_pos].tolist(),
+                [None if np.isnan(v) else v for v in values], [now] * len(values)))
+        excess = self.size() - self.max_pairs
+        if excess > 0:
+            self.connection.execute(
+                "DELETE FROM pairs WHERE rowid IN (SELECT rowid FROM pairs ORDER BY last_used LIMIT ?)", (excess,))
+        self.connection.commit()
+        return max(excess, 0)
+
+
+def route_cached(hospitals, origins, route, cache):
+    """Route only pairs missing from the cache; same output schema as route(hospitals, origins)."""
+    start_time = time.time()
+    columns = ['from_id', 'to_id', 'travel_time']
+    h_pos, o_pos, cached_times = cache.lookup(hospitals, origins)
+    missing = np.ones((len(hospitals), len(origins)), dtype=bool)
+    missing[h_pos, o_pos] = False
+    total_pairs = missing.size
+
+    routed = []
+    new_hospitals = missing.all(axis=1) if len(origins) else np.zeros(len(hospitals), dtype=bool)
+    if new_hospitals.any():
+        routed.append(route(hospitals.iloc[np.flatnonzero(new_hospitals)], origins))
+        missing[new_hospitals] = False
+    if missing.any():
+        routed.append(route(hospitals.iloc[np.flatnonzero(missing.any(axis=1))],
+                            origins.iloc[np.flatnonzero(missing.any(axis=0))]))
+    routed = pd.concat(routed, ignore_index=True)[columns] if routed else pd.DataFrame(columns=columns)
+    evicted = cache.store(hospitals, origins, routed) if len(routed) else 0
+
+    # Pairs routed in the second step may also be cached; the cached value is dropped for them
+    cached = pd.DataFrame({
+        'from_id': hospitals['id'].to_numpy()[h_pos],
+        'to_id': origins['id'].to_numpy()[o_pos],
+        'travel_time': cached_times,
+    })
+    if len(routed):
+        cached = cached.merge(routed[['from_id', 'to_id']], how='left', indicator=True)
+        cached = cached[cached['_merge'] == 'left_only'][columns]
+    hits = len(h_pos)
+    print(f"==Pair cache: {hits} of {total_pairs} pairs cached "
+          f"({100 * hits / total_pairs if total_pairs else 0:.1f}%), routed {len(routed)} pairs, "
+          f"evicted {evicted}; cache holds {cache.size()} pairs. Elapsed time {time.time()-start_time} sec.")
+    return pd.concat([cached, routed], ignore_index=True)
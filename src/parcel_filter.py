@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Residential parcel selection driven by county_data/residential_use_codes.json.
+
+Every county's parcel file spells its land-use codes differently, so the
+residential codes live in a registry file rather than in code: adding a county
+means adding one entry there. The registry is validated when it is loaded, and
+the filter is a single categorical isin over the use-code column.
+"""
+import json
+
+import numpy as np
+
+import input_loader
+
+DEFAULT_REGISTRY_PATH = "county_data/residential_use_codes.json"
+
+
+def load_registry(path=DEFAULT_REGISTRY_PATH):
+    """Load and validate the registry; returns (column name, {county: [codes]})."""
+    with open(path, encoding='utf-8') as f:
+        registry = json.load(f)
+    column = registry.get('column')
+    counties = registry.get('counties')
+    if not isinstance(column, str) or not column:
+        raise ValueError(f"{path}: 'column' must name the parcel use-code column")
+    if not isinstance(counties, dict) or not counties:
+        raise ValueError(f"{path}: 'counties' must map county names to lists of use codes")
+    for county, codes in counties.items():
+        if not isinstance(codes, list) or not codes or not all(isinstance(code, str) for code in codes):
+            raise ValueError(f"{path}: county {county!r} must have a non-empty list of string codes")
+        duplicates = sorted({code for code in codes if codes.count(code) > 1})
+        if duplicates:
+            raise ValueError(f"{path}: county {county!r} lists {duplicates} more than once")
+    return column, counties
+
+
+def residential_mask(values, codes):
+    """Boolean mask of values in codes, computed on the categories instead of every row."""
+    categorical = values.astype('category')
+    keep = np.append(categorical.cat.categories.isin(codes), False)  # code -1 (missing) maps to False
+    return keep[categorical.cat.codes.to_numpy()]
+
+
+def residential_where(county_name, registry_path=DEFAULT_REGISTRY_PATH):
+    """OGR where clause selecting the residential parcels of county_name (KeyError if unregistered)."""
+    column, counties = load_registry(registry_path)
+    return input_loader.sql_in(column, counties[county_name])
+
+
+def filter_residential(points, county_name, registry_path=DEFAULT_REGISTRY_PATH):
+    """Keep the residential parcels of county_name and report codes that matched nothing.
+
+    Raises KeyError if the county has no registry entry.
+    """
+    column, counties = load_registry(registry_path)
+    if county_name not in counties:
+        raise KeyError(county_name)
+    codes = counties[county_name]
+    present = set(points[column].dropna().unique())
+    unmatched = [code for code in codes if code not in present]
+    if unmatched:
+        print(f"Warning: {len(unmatched)} residential codes for {county_name} do not occur in the parcel data: {unmatched}")
+    return points[residential_mask(points[column], codes)]
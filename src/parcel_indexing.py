@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""Per-tract parcel numbering (new_index, pt_idx) and Option 2 tract means in one grouped pass.
+
+Each parcel joined to a tract gets pt_idx = 1, 2, ... in its original order
+within the tract and new_index = poly_idx * 10000 + pt_idx; parcels are
+ordered by poly_idx and parcels outside every tract are dropped. This used to
+be a groupby().apply() that copied every tract's rows in Python;
+tests/test_parcel_indexing.py checks it against that version.
+"""
+import numpy as np
+
+
+def assign_parcel_indices(points_with_polygon_index, lat_col='p_latitude', lon_col='p_longitude'):
+    """Number parcels within each tract and average their coordinates per tract.
+
+    Returns (points_with_new_index, avg_coords): the points sorted by poly_idx with
+    'point_index_within_polygon' and 'new_index' columns, and one row per tract
+    with 'county_index', 'latitude', 'longitude'.
+    """
+    joined = points_with_polygon_index[points_with_polygon_index['poly_idx'].notna()]
+    # Stable sort keeps the original order of parcels within each tract
+    joined = joined.iloc[np.argsort(joined['poly_idx'].to_numpy(), kind='stable')].reset_index(drop=True)
+    grouped = joined.groupby('poly_idx', sort=False)
+    joined['point_index_within_polygon'] = grouped.cumcount().to_numpy() + 1
+    joined['new_index'] = joined['poly_idx'] * 10000 + joined['point_index_within_polygon']
+
+    avg_coords = grouped[[lat_col, lon_col]].mean().reset_index()
+    avg_coords.columns = ['county_index', 'latitude', 'longitude']
+    avg_coords['county_index'] = avg_coords['county_index'].astype(int)
+    return joined, avg_coords
@@ -1,35 +1,32 @@
 #!/usr/bin/env python3
-import geopandas
-import r5py
 import numpy as np
-import shapely
 import pandas as pd
 pd.set_option('display.max_columns', None)
-import folium
-import folium.plugins
 import matplotlib.pyplot as plt
-import datetime
-import os
-import time
-import random
-import osmnx as ox
-import warnings
-import networkx as nx
 import argparse
 import re
 import sys
 
-def plot_histogram(county_name, agg_filename):
-    # travel_times = pd.read_csv('travel_times_181916parcels_to_6hospitals_1719917624.csv')
-    result = pd.read_csv(f'county_data/{county_name}/{agg_filename}.csv')
-    # Extract Option # using regular expressions
-    match = re.search(r'Option(\d+)_', agg_filename)
-    if match:
-        x_value = match.group(1)
-        print(f"The value of Option extracted from '{agg_filename}' is: {x_value}")
+import result_io
+import results_store
+
+def plot_histogram(county_name, agg_filename=None, option=None, results_store_path=None):
+    if results_store_path:
+        # Latest completed run of the option in the results store
+        with results_store.ResultsStore(results_store_path) as store:
+            result = store.aggregates(county_name, option)
+        x_value = str(option)
     else:
-        print(f"No match found in '{agg_filename}'")
-        sys.exit(1)
+        # travel_times = pd.read_csv('travel_times_181916parcels_to_6hospitals_1719917624.csv')
+        result = result_io.read_table(result_io.resolve_result_path(f'county_data/{county_name}/{agg_filename}'))
+        # Extract Option # using regular expressions
+        match = re.search(r'Option(\d+)_', agg_filename)
+        if match:
+            x_value = match.group(1)
+            print(f"The value of Option extracted from '{agg_filename}' is: {x_value}")
+        else:
+            print(f"No match found in '{agg_filename}'")
+            sys.exit(1)
     
     print("Descriptive statistics are")
     print(result.columns.tolist())
@@ -55,7 +52,9 @@ def plot_histogram(county_name, agg_filename):
 
     # Calculate the range of the data and create bins
     min_val = result['min_travel_time'].min()
-    max_val = result['median_travel_time'].max()
+    # Candidate-pruned runs have no median over all hospitals (see candidate_pruning)
+    has_median = result['median_travel_time'].notna().any()
+    max_val = result['median_travel_time'].max() if has_median else result['min_travel_time'].max()
     bins = np.arange(0, np.ceil(max_val) + 5, 5)
 
     plt.hist(result['min_travel_time'], bins=bins, edgecolor='black', alpha=0.7)
@@ -68,6 +67,9 @@ def plot_histogram(county_name, agg_filename):
     # Show plot (optional, comment out if only exporting to PDF)
     plt.show()
 
+    if not has_median:
+        print("No median travel times (candidate-pruned run); the median histogram is skipped.")
+        return
     plt.figure(figsize=(10, 6))  # Adjust the figure size as needed
     plt.hist(result['median_travel_time'], bins=bins, edgecolor='black', alpha=0.7)
     plt.title('Histogram of Median Travel Times')
@@ -78,16 +80,27 @@ def plot_histogram(county_name, agg_filename):
     # Show plot (optional, comment out if only exporting to PDF)
     plt.show()
 
-if __name__=='__main__':
+def main(argv=None, prog=None):
     #arg parser
-    parser = argparse.ArgumentParser(description="A script that uses county name.")
+    parser = argparse.ArgumentParser(prog=prog, description="Plot travel time histograms of an aggregated result.")
     parser.add_argument("--county_name", type=str, required=True, 
                         help="Name of the county")
-    parser.add_argument("--file_name", type=str, required=True, 
-                        help="Aggregated TT file name (without csv)")
-    args = parser.parse_args()
+    parser.add_argument("--file_name", type=str,
+                        help="Aggregated TT file name (without .parquet/.csv)")
+    parser.add_argument("--results_store", type=str, nargs='?', const=results_store.DEFAULT_STORE_PATH, default=None,
+                        help="Plot the latest run of --option from this results store instead of --file_name "
+                             f"(default path: {results_store.DEFAULT_STORE_PATH})")
+    parser.add_argument("--option", type=int, choices=[1, 2, 3],
+                        help="Option to plot from the results store")
+    args = parser.parse_args(argv)
+    if args.results_store is None and args.file_name is None:
+        parser.error("--file_name is required unless --results_store is given")
+    if args.results_store is not None and args.option is None:
+        parser.error("--option is required with --results_store")
     # Convert county_name to have first letter capital and rest lowercase
     county_name = args.county_name.capitalize()
     # download_guilford_map_sp()
-    plot_histogram(county_name,  args.file_name)
+    plot_histogram(county_name,  args.file_name, option=args.option, results_store_path=args.results_store)
 
+if __name__=='__main__':
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Reading and writing of travel time result tables.
+
+find_tt_matrix writes its raw and aggregated tables either as Parquet (default;
+zstd-compressed, uint32 ids and float32 minutes) or as CSV for export. All
+readers go through read_table/find_result_files so they accept both formats.
+"""
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+import input_loader
+
+OUTPUT_FORMATS = ('parquet', 'csv')
+DEFAULT_OUTPUT_FORMAT = 'parquet'
+RESULT_EXTENSIONS = ('.parquet', '.csv')
+ID_COLUMNS = ('from_id', 'to_id')
+
+
+def _compact_id(values):
+    """Downcast an id column to uint32 when every value is a non-negative integer that fits."""
+    if not pd.api.types.is_numeric_dtype(values) or values.isna().any() or len(values) == 0:
+        return values
+    as_array = values.to_numpy()
+    if not np.array_equal(as_array, np.floor(as_array)):
+        return values
+    if as_array.min() < 0 or as_array.max() > np.iinfo(np.uint32).max:
+        return values
+    return values.astype(np.uint32)
+
+
+def compact_types(df):
+    """uint32 ids and float32 travel times; values in minutes are whole or few-decimal numbers."""
+    df = df.copy()
+    for column in df.columns:
+        if column in ID_COLUMNS:
+            df[column] = _compact_id(df[column])
+        elif column.endswith('_hospital_id'):
+            df[column] = df[column].astype('UInt32')
+        elif 'travel_time' in column and pd.api.types.is_float_dtype(df[column]):
+            df[column] = df[column].astype(np.float32)
+    return df
+
+
+def write_table(df, path_without_extension, output_format=DEFAULT_OUTPUT_FORMAT):
+    """Write df as <path>.parquet or <path>.csv and return the full path."""
+    if output_format == 'parquet':
+        path = f"{path_without_extension}.parquet"
+        compact_types(df).to_parquet(path, index=False, compression='zstd')
+    elif output_format == 'csv':
+        path = f"{path_without_extension}.csv"
+        df.to_csv(path, index=False)
+    else:
+        raise ValueError(f"Unknown output format {output_format!r}; use one of {OUTPUT_FORMATS}")
+    return path
+
+
+class TableAppender:
+    """Append batches of a table to one Parquet or CSV file (used for streamed raw matrices)."""
+
+    def __init__(self, path_without_extension, output_format=DEFAULT_OUTPUT_FORMAT):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format {output_format!r}; use one of {OUTPUT_FORMATS}")
+        self.output_format = output_format
+        self.path = f"{path_without_extension}.{output_format}"
+        self._parquet_writer = None
+        self._rows_written = 0
+
+    def append(self, df):
+        if self.output_format == 'csv':
+            df.to_csv(self.path, mode='a', header=self._rows_written == 0, index=False)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(compact_types(df), preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema, compression='zstd')
+            self._parquet_writer.write_table(table.cast(self._parquet_writer.schema))
+        self._rows_written += len(df)
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+
+
+class TeeAppender:
+    """Append the same batches to several appenders (e.g. a TableAppender and a results store)."""
+
+    def __init__(self, *appenders):
+        self.appenders = appenders
+        self.path = ", ".join(appender.path for appender in appenders)
+
+    def append(self, df):
+        for appender in self.appenders:
+            appender.append(df)
+
+    def close(self):
+        for appender in self.appenders:
+            appender.close()
+
+
+def read_table(path, columns=None):
+    """Read a result table written by write_table, choosing the reader from the extension."""
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path, columns=columns)
+    return input_loader.read_csv(path, usecols=columns)
+
+
+def find_result_files(folder, prefix):
+    """Result files in folder starting with prefix, in either format, sorted by name."""
+    matches = []
+    for extension in RESULT_EXTENSIONS:
+        matches.extend(glob.glob(os.path.join(folder, f"{prefix}*{extension}")))
+    return sorted(matches)
+
+
+def resolve_result_path(path_without_extension):
+    """Find <path>.parquet or <path>.csv (or path itself if it already has an extension)."""
+    if os.path.exists(path_without_extension):
+        return path_without_extension
+    for extension in RESULT_EXTENSIONS:
+        if os.path.exists(path_without_extension + extension):
+            return path_without_extension + extension
+    raise FileNotFoundError(f"No .parquet or .csv result found for {path_without_extension}")
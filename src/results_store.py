@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""Local SQLite store of travel time runs across counties and options.
+
+find_tt_matrix (with a results store path) records every run here besides the
+Parquet/CSV files:
+
+    runs        one row per find_tt_matrix call (county, option, sizes, epoch_time)
+    pairs       raw (from_id, to_id, travel_time) rows of a run
+    aggregates  per-origin statistics of a run, with the census tract (poly_idx)
+                each origin belongs to
+    tracts      Option 1 tract attributes (E_NOVEH, area, compactness, ...) per county
+
+Tables are indexed by county/option, run and tract, so the evaluation and
+plotting scripts read the latest run of a county and option with one query
+instead of picking files by name, and cross-county comparisons are a single
+join (see tract_comparison).
+"""
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_STORE_PATH = "county_data/results.sqlite"
+AGGREGATE_COLUMNS = ['min_travel_time', 'second_min_travel_time', 'third_min_travel_time', 'median_travel_time',
+                     'average_travel_time', 'q1_travel_time', 'q3_travel_time',
+                     'nearest_1_hospital_id', 'nearest_2_hospital_id', 'nearest_3_hospital_id']
+TRACT_COLUMNS = ['OBJECTID', 'latitude', 'longitude', 'E_NOVEH', 'M_NOVEH', 'area', 'perimeter',
+                 'pp_score_n', 'schwartz_n']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    county TEXT NOT NULL,
+    option INTEGER NOT NULL,
+    epoch_time INTEGER NOT NULL,
+    num_origins INTEGER,
+    num_hospitals INTEGER,
+    k_nearest INTEGER,
+    completed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS runs_county_option ON runs (county, option, completed);
+CREATE TABLE IF NOT EXISTS pairs (
+    run_id INTEGER NOT NULL,
+    from_id INTEGER NOT NULL,
+    to_id INTEGER NOT NULL,
+    travel_time REAL
+);
+CREATE INDEX IF NOT EXISTS pairs_run_to ON pairs (run_id, to_id);
+CREATE TABLE IF NOT EXISTS aggregates (
+    run_id INTEGER NOT NULL,
+    to_id INTEGER NOT NULL,
+    poly_idx INTEGER,
+    min_travel_time REAL,
+    second_min_travel_time REAL,
+    third_min_travel_time REAL,
+    median_travel_time REAL,
+    average_travel_time REAL,
+    q1_travel_time REAL,
+    q3_travel_time REAL,
+    nearest_1_hospital_id INTEGER,
+    nearest_2_hospital_id INTEGER,
+    nearest_3_hospital_id INTEGER,
+    PRIMARY KEY (run_id, to_id)
+);
+CREATE INDEX IF NOT EXISTS aggregates_run_tract ON aggregates (run_id, poly_idx);
+CREATE TABLE IF NOT EXISTS tracts (
+    county TEXT NOT NULL,
+    poly_idx INTEGER NOT NULL,
+    OBJECTID TEXT,
+    latitude REAL,
+    longitude REAL,
+    E_NOVEH REAL,
+    M_NOVEH REAL,
+    area REAL,
+    perimeter REAL,
+    pp_score_n REAL,
+    schwartz_n REAL,
+    PRIMARY KEY (county, poly_idx)
+);
+"""
+
+
+def tract_of(option, to_ids):
+    """Census tract (poly_idx) of Option 1/2 origins (the tract itself) or Option 3 parcels (new_index // 10000)."""
+    to_ids = np.asarray(to_ids, dtype=np.int64)
+    return to_ids // 10000 if option == 3 else to_ids
+
+
+def _rows(df, columns):
+    """DataFrame columns as a list of tuples with None for missing values (what sqlite3 expects)."""
+    return list(df[columns].astype(object).where(df[columns].notna(), None).itertuples(index=False, name=None))
+
+
+class ResultsStore:
+    """Connection to a results store file; creates the tables on first use."""
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(_SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start_run(self, county, option, epoch_time, num_origins=None, num_hospitals=None, k_nearest=None):
+        cursor = self.connection.execute(
+            "INSERT INTO runs (county, option, epoch_time, num_origins, num_hospitals, k_nearest) "
+            "VALUES (?, ?, ?, ?, ?, ?)", (county, option, epoch_time, num_origins, num_hospitals, k_nearest))
+        self.connection.commit()
+        return cursor.lastrowid
+
+    def add_pairs(self, run_id, travel_times):
+        rows = _rows(travel_times, ['from_id', 'to_id', 'travel_time'])
+        self.connection.executemany("INSERT INTO pairs VALUES (?, ?, ?, ?)", ((run_id, *row) for row in rows))
+        self.connection.commit()
+
+    def add_aggregates(self, run_id, option, aggregates):
+        """Store per-origin statistics; columns beyond the first three nearest are not kept."""
+        aggregates = aggregates.reindex(columns=['to_id'] + AGGREGATE_COLUMNS)
+        aggregates.insert(1, 'poly_idx', tract_of(option, aggregates['to_id']))
+        rows = _rows(aggregates, ['to_id', 'poly_idx'] + AGGREGATE_COLUMNS)
+        placeholders = ", ".join("?" * (len(AGGREGATE_COLUMNS) + 3))
+        self.connection.executemany(f"INSERT OR REPLACE INTO aggregates VALUES ({placeholders})",
+                                    ((run_id, *row) for row in rows))
+        self.connection.commit()
+
+    def finish_run(self, run_id):
+        self.connection.execute("UPDATE runs SET completed = 1 WHERE run_id = ?", (run_id,))
+        self.connection.commit()
+
+    def record_tracts(self, county, tracts):
+        """Insert or update the Option 1 tract attributes of a county (an Option1_county_centroids table)."""
+        tracts = tracts.reindex(columns=['poly_idx'] + TRACT_COLUMNS)
+        tracts['OBJECTID'] = tracts['OBJECTID'].astype(str)
+        rows = _rows(tracts, ['poly_idx'] + TRACT_COLUMNS)
+        placeholders = ", ".join("?" * (len(TRACT_COLUMNS) + 2))
+        self.connection.executemany(f"INSERT OR REPLACE INTO tracts VALUES ({placeholders})",
+                                    ((county, *row) for row in rows))
+        self.connection.commit()
+
+    def latest_run(self, county, option):
+        """run_id of the most recent completed run of a county and option, or None."""
+        row = self.connection.execute(
+            "SELECT MAX(run_id) FROM runs WHERE county = ? AND option = ? AND completed = 1",
+            (county, option)).fetchone()
+        return row[0]
+
+    def runs(self):
+        return pd.read_sql_query("SELECT * FROM runs ORDER BY run_id", self.connection)
+
+    def aggregates(self, county, option, run_id=None):
+        """Per-origin statistics of run_id (default: latest completed run of county/option), ordered by to_id."""
+        run_id = run_id if run_id is not None else self.latest_run(county, option)
+        if run_id is None:
+            raise LookupError(f"No completed Option {option} run for {county} in {self.path}")
+        return pd.read_sql_query("SELECT * FROM aggregates WHERE run_id = ? ORDER BY to_id", self.connection,
+                                 params=(run_id,)).drop(columns='run_id')
+
+    def pairs(self, run_id):
+        return pd.read_sql_query("SELECT from_id, to_id, travel_time FROM pairs WHERE run_id = ?",
+                                 self.connection, params=(run_id,))
+
+    def tract_comparison(self, option_a=3, option_b=1, statistic='min_travel_time'):
+        """One row per tract of every county with both options: mean statistic of each option and the difference.
+
+        Uses the latest completed run per county and option. Joined with the tract
+        attributes, so e.g. the median difference by county group is
+        tract_comparison().groupby(groups)['difference'].median().
+        """
+        if statistic not in AGGREGATE_COLUMNS:
+            raise ValueError(f"Unknown statistic {statistic!r}; use one of {AGGREGATE_COLUMNS}")
+        query = f"""
+            WITH latest AS (
+                SELECT county, option, MAX(run_id) AS run_id FROM runs
+                WHERE completed = 1 AND option IN (?, ?) GROUP BY county, option
+            ),
+            by_tract AS (
+                SELECT latest.county, latest.option, a.poly_idx, AVG(a.{statistic}) AS value
+                FROM latest JOIN aggregates a ON a.run_id = latest.run_id
+                GROUP BY latest.county, latest.option, a.poly_idx
+            )
+            SELECT a.county, a.poly_idx, a.value AS option_a, b.value AS option_b,
+                   a.value - b.value AS difference, t.E_NOVEH, t.area, t.pp_score_n, t.schwartz_n
+            FROM by_tract a
+            JOIN by_tract b ON b.county = a.county AND b.poly_idx = a.poly_idx AND b.option = ?
+            LEFT JOIN tracts t ON t.county = a.county AND t.poly_idx = a.poly_idx
+            WHERE a.option = ?
+            ORDER BY a.county, a.poly_idx
+        """
+        return pd.read_sql_query(query, self.connection, params=(option_a, option_b, option_b, option_a))
+
+
+class PairWriter:
+    """Appender for the raw pairs of one run, usable as a stream_travel_times raw_writer."""
+
+    def __init__(self, store, run_id):
+        self.store = store
+        self.run_id = run_id
+        self.path = f"{store.path} (run {run_id})"
+
+    def append(self, travel_times):
+        self.store.add_pairs(self.run_id, travel_times)
+
+    def close(self):
+        pass
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""Resident routing service that keeps r5py transport networks loaded between runs.
+
+Building a TransportNetwork from a statewide .osm.pbf takes a few minutes, so
+instead of paying that cost in every travel_time_analysis.py run, start the
+daemon once:
+
+    python src/routing_daemon.py --port 8765
+
+and every find_tt_matrix call (in any process) sends its origins/destinations
+to it over localhost HTTP. Networks are built on first use and kept in memory,
+keyed by their OSM/GTFS paths. If the daemon is not running, request_travel_times
+returns None and the caller routes in-process as before.
+
+Each request is handled in its own thread, so /status answers while jobs are
+routed and several runs (or the departures of a sweep) share the daemon's
+networks at the same time. A network is built once: jobs that need a network
+still being built wait for it. A daemon that accepts the connection but does
+not answer /status in time is reported as busy, not absent, so clients still
+send it their jobs rather than building the network themselves.
+"""
+import argparse
+import datetime
+import json
+import os
+import threading
+import socket
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# Set HCA_ROUTING_DAEMON=host:port to point clients at a non-default daemon
+DAEMON_ADDRESS_ENV = 'HCA_ROUTING_DAEMON'
+
+
+def daemon_url():
+    address = os.environ.get(DAEMON_ADDRESS_ENV, f'{DEFAULT_HOST}:{DEFAULT_PORT}')
+    return f'http://{address}'
+
+
+def _points_payload(gdf):
+    """Serialise a point GeoDataFrame with an 'id' column to plain JSON lists."""
+    return {
+        'id': gdf['id'].tolist(),
+        'latitude': gdf.geometry.y.tolist(),
+        'longitude': gdf.geometry.x.tolist(),
+    }
+
+
+def _points_from_payload(payload):
+    import geopandas
+    return geopandas.GeoDataFrame(
+        {'id': payload['id']},
+        geometry=geopandas.points_from_xy(payload['longitude'], payload['latitude']),
+        crs="EPSG:4269",
+    )
+
+
+def daemon_status(timeout=1.0):
+    """Return the daemon status dict, {'busy': True} if it is listening but slow to answer, or None if absent."""
+    try:
+        with urllib.request.urlopen(f'{daemon_url()}/status', timeout=timeout) as response:
+            return json.loads(response.read())
+    except (TimeoutError, socket.timeout):
+        return {'busy': True}
+    except urllib.error.URLError as e:
+        if isinstance(e.reason, (TimeoutError, socket.timeout)):
+            return {'busy': True}
+        return None
+    except ConnectionError:
+        return None
+
+
+def request_travel_times(osm_path, origins, destinations, gtfs_paths=(),
+                         departure=None, transport_modes=None, departure_time_window=None, percentiles=None):
+    """Ask a running daemon for the travel time matrix.
+
+    Returns the same long-format DataFrame as compute_travel_times
+    (from_id, to_id, travel_time), or None when no daemon is reachable so the
+    caller can fall back to in-process routing.
+    """
+    if daemon_status() is None:
+        return None
+    job = {
+        'osm_path': os.path.abspath(osm_path),
+        'gtfs_paths': [os.path.abspath(path) for path in gtfs_paths],
+        'origins': _points_payload(origins),
+        'destinations': _points_payload(destinations),
+    }
+    if departure is not None:
+        job['departure'] = departure.isoformat()
+    if transport_modes is not None:
+        job['transport_modes'] = list(transport_modes)
+    if departure_time_window is not None:
+        job['departure_time_window'] = departure_time_window.total_seconds()
+    if percentiles is not None:
+        job['percentiles'] = list(percentiles)
+    request = urllib.request.Request(
+        f'{daemon_url()}/travel_times',
+        data=json.dumps(job).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+    )
+    # Routing itself can take a long time, so no timeout on the job request
+    try:
+        with urllib.request.urlopen(request) as response:
+            result = json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        # Failed jobs come back as 4xx/5xx with the error in a JSON body
+        try:
+            result = json.loads(e.read())
+        except ValueError:
+            result = {'error': f'HTTP {e.code} {e.reason}'}
+        result.setdefault('error', f'HTTP {e.code} {e.reason}')
+    if 'error' in result:
+        raise RuntimeError(f"Routing daemon failed: {result['error']}")
+    return pd.DataFrame(result)
+
+
+class NetworkCache:
+    """Transport networks built so far, keyed by (osm_path, gtfs_paths).
+
+    Each network has its own build lock: concurrent jobs for one network wait
+    for a single build, while jobs for networks already built are not held up.
+    """
+
+    def __init__(self):
+        self.networks = {}
+        self.build_seconds = {}
+        self.building = set()
+        self.lock = threading.Lock()
+        self.build_locks = {}
+
+    def get(self, osm_path, gtfs_paths):
+        import travel_time_analysis
+        key = (osm_path, tuple(gtfs_paths))
+        with self.lock:
+            if key in self.networks:
+                return self.networks[key]
+            build_lock = self.build_locks.setdefault(key, threading.Lock())
+        with build_lock:
+            if key not in self.networks:
+                self.building.add(key)
+                try:
+                    start_time = time.time()
+                    print(f"Building transport network for {osm_path} (GTFS: {list(gtfs_paths)})")
+                    network = travel_time_analysis.build_transport_network(osm_path, gtfs_paths)
+                finally:
+                    self.building.discard(key)
+                with self.lock:
+                    self.networks[key] = network
+                    self.build_seconds[key] = time.time() - start_time
+                print(f"==Network ready. Elapsed time {self.build_seconds[key]} sec.")
+            return self.networks[key]
+
+
+def make_handler(cache):
+    active_jobs = [0]
+    jobs_lock = threading.Lock()
+
+    class RoutingRequestHandler(BaseHTTPRequestHandler):
+        def _send_json(self, payload, status=200):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path != '/status':
+                self._send_json({'error': f'Unknown path {self.path}'}, status=404)
+                return
+            self._send_json({
+                'pid': os.getpid(),
+                'active_jobs': active_jobs[0],
+                'networks': [
+                    {'osm_path': osm_path, 'gtfs_paths': list(gtfs_paths), 'build_seconds': seconds}
+                    for (osm_path, gtfs_paths), seconds in list(cache.build_seconds.items())
+                ],
+                'building': [{'osm_path': osm_path, 'gtfs_paths': list(gtfs_paths)}
+                             for osm_path, gtfs_paths in list(cache.building)],
+            })
+
+        def do_POST(self):
+            if self.path != '/travel_times':
+                self._send_json({'error': f'Unknown path {self.path}'}, status=404)
+                return
+            import travel_time_analysis
+            with jobs_lock:
+                active_jobs[0] += 1
+            try:
+                job = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                start_time = time.time()
+                transport_network = cache.get(job['osm_path'], job.get('gtfs_paths', []))
+                kwargs = {}
+                if 'departure' in job:
+                    kwargs['departure'] = datetime.datetime.fromisoformat(job['departure'])
+                if 'transport_modes' in job:
+                    kwargs['transport_modes'] = tuple(job['transport_modes'])
+                if 'departure_time_window' in job:
+                    kwargs['departure_time_window'] = datetime.timedelta(seconds=job['departure_time_window'])
+                if 'percentiles' in job:
+                    kwargs['percentiles'] = tuple(job['percentiles'])
+                travel_times = travel_time_analysis.compute_travel_times(
+                    transport_network,
+                    _points_from_payload(job['origins']),
+                    _points_from_payload(job['destinations']),
+                    **kwargs,
+                )
+                print(f"==Routed {len(job['origins']['id'])} x {len(job['destinations']['id'])} pairs "
+                      f"in {time.time()-start_time} sec.")
+                # NaN (unreachable) is not valid JSON, send it as null
+                travel_times = travel_times.astype(object).where(travel_times.notna(), None)
+                self._send_json(travel_times.to_dict(orient='list'))
+            except Exception as e:
+                self._send_json({'error': repr(e)}, status=500)
+            finally:
+                with jobs_lock:
+                    active_jobs[0] -= 1
+
+    return RoutingRequestHandler
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, preload=()):
+    cache = NetworkCache()
+    for osm_path in preload:
+        cache.get(os.path.abspath(osm_path), ())
+    # One thread per request: /status stays responsive while jobs are routed (see NetworkCache for builds)
+    server = ThreadingHTTPServer((host, port), make_handler(cache))
+    server.daemon_threads = True
+    print(f"Routing daemon listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Routing daemon stopped.")
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Keep r5py transport networks loaded and serve travel time jobs.")
+    parser.add_argument("--host", type=str, default=DEFAULT_HOST,
+                        help="Interface to listen on (localhost only by default)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help="Port to listen on")
+    parser.add_argument("--osm", type=str, nargs='*', default=[],
+                        help="OSM files (without extension) in state_data/osm/ to load at start-up")
+    args = parser.parse_args()
+    serve(args.host, args.port, preload=[f"state_data/osm/{osm}.osm.pbf" for osm in args.osm])
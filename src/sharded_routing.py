@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Sharded travel time computation for large origin sets (Option 3 parcels).
+
+The parcel set is ordered along a Z-order (Morton) curve so that every chunk is
+spatially coherent, split into chunks of a configurable size, and each chunk is
+routed against all hospitals either sequentially on one transport network or in
+a pool of worker processes, each with its own r5 JVM and network. Chunk results
+are concatenated in chunk order, so the output has the same
+(from_id, to_id, travel_time) schema as a single compute_travel_times call.
+"""
+import concurrent.futures
+import multiprocessing
+import time
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CHUNK_SIZE = 20000
+
+# Transport network of a pool worker, built once by _init_worker
+_worker_network = None
+
+
+def morton_order(longitude, latitude, bits=16):
+    """Return the indices that sort points along a Z-order curve."""
+    longitude = np.asarray(longitude, dtype=float)
+    latitude = np.asarray(latitude, dtype=float)
+    scale = (1 << bits) - 1
+
+    def quantize(values):
+        span = values.max() - values.min()
+        if span == 0:
+            return np.zeros(len(values), dtype=np.uint64)
+        return ((values - values.min()) / span * scale).astype(np.uint64)
+
+    def spread_bits(values):
+        # Insert a zero bit between every bit of a 16-bit integer
+        values = (values | (values << np.uint64(8))) & np.uint64(0x00FF00FF)
+        values = (values | (values << np.uint64(4))) & np.uint64(0x0F0F0F0F)
+        values = (values | (values << np.uint64(2))) & np.uint64(0x33333333)
+        values = (values | (values << np.uint64(1))) & np.uint64(0x55555555)
+        return values
+
+    codes = spread_bits(quantize(longitude)) | (spread_bits(quantize(latitude)) << np.uint64(1))
+    return np.argsort(codes, kind='stable')
+
+
+def spatial_chunks(points, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Split a point GeoDataFrame into spatially coherent chunks of at most chunk_size rows."""
+    if len(points) == 0:
+        return []
+    order = morton_order(points.geometry.x.to_numpy(), points.geometry.y.to_numpy())
+    ordered = points.iloc[order]
+    return [ordered.iloc[start:start + chunk_size] for start in range(0, len(ordered), chunk_size)]
+
+
+def _init_worker(osm_path, gtfs_paths):
+    global _worker_network
+    import travel_time_analysis
+    _worker_network = travel_time_analysis.build_transport_network(osm_path, gtfs_paths)
+
+
+def _route_chunk(origins, destinations, travel_options):
+    import travel_time_analysis
+    return travel_time_analysis.compute_travel_times(_worker_network, origins, destinations, **travel_options)
+
+
+def open_worker_pool(osm_path, workers, gtfs_paths=()):
+    """Start worker processes that each load the transport network once.
+
+    Every worker holds its own copy of the network in its own JVM, so memory use
+    grows with the number of workers. Workers are spawned rather than forked
+    because a JVM does not survive fork().
+    """
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(osm_path, tuple(gtfs_paths)),
+    )
+
+
+def compute_travel_times_sharded(origins, destinations, chunk_size=DEFAULT_CHUNK_SIZE,
+                                 worker_pool=None, transport_network=None, travel_options=None):
+    """Route origins to destinations, splitting destinations into spatial chunks.
+
+    find_tt_matrix routes from hospitals (origins) to parcels (destinations), so
+    the large parcel set is the one that gets sharded. Chunks go to worker_pool
+    when given, otherwise they are routed one after another on transport_network,
+    which bounds the peak size of a single r5 request. travel_options are the
+    compute_travel_times keyword arguments (departure, transport modes, ...).
+    """
+    start_time = time.time()
+    travel_options = travel_options or {}
+    chunks = spatial_chunks(destinations, chunk_size)
+    print(f"Routing {len(destinations)} destinations in {len(chunks)} chunks of up to {chunk_size}.")
+    if worker_pool is not None:
+        futures = [worker_pool.submit(_route_chunk, origins, chunk, travel_options) for chunk in chunks]
+        results = []
+        for chunk_number, future in enumerate(futures, start=1):
+            results.append(future.result())
+            print(f"==Chunk {chunk_number}/{len(chunks)} finished. Elapsed time {time.time()-start_time} sec.")
+    else:
+        import travel_time_analysis
+        results = []
+        for chunk_number, chunk in enumerate(chunks, start=1):
+            results.append(travel_time_analysis.compute_travel_times(transport_network, origins, chunk,
+                                                                     **travel_options))
+            print(f"==Chunk {chunk_number}/{len(chunks)} finished. Elapsed time {time.time()-start_time} sec.")
+    if not results:
+        return pd.DataFrame(columns=['from_id', 'to_id', 'travel_time'])
+    return pd.concat(results, ignore_index=True)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Point-in-polygon assignment of parcels to census tracts, chunked and optionally parallel.
+
+Parcels are ordered along a Z-order curve (as in sharded_routing) and split
+into spatially coherent chunks. Each chunk is matched against an STRtree of
+the tract polygons, either in this process or in a pool of worker processes
+that each build the tree once. Results are written back by parcel position,
+so the output order does not depend on the number of workers.
+
+A parcel strictly inside a tract gets that tract. A parcel exactly on a tract
+edge (or vertex) is inside neither tract, so it is explicitly given the
+touching tract with the lowest poly_idx instead of being dropped. If tracts
+overlap, the lowest poly_idx wins as well, so every parcel appears once.
+"""
+import concurrent.futures
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+import shapely
+
+import sharded_routing
+
+DEFAULT_CHUNK_SIZE = 200000
+
+# Tract polygons of a pool worker and their STRtree, built once by _init_worker
+_worker_polygons = None
+_worker_tree = None
+
+
+def _lowest_match(num_points, point_positions, polygon_positions):
+    """Smallest matched polygon position per point, -1 where nothing matched."""
+    result = np.full(num_points, np.iinfo(np.int64).max)
+    np.minimum.at(result, point_positions, polygon_positions)
+    result[result == np.iinfo(np.int64).max] = -1
+    return result
+
+
+def match_points(tree, polygons, x, y):
+    """Position in polygons of the polygon containing each point (see module docstring for ties).
+
+    tree is an STRtree of polygons; candidates come from its bounding boxes and
+    are tested with the vectorised contains_xy on prepared polygons.
+    """
+    num_points = len(x)
+    point_positions, polygon_positions = tree.query(shapely.points(x, y))
+    x, y = x[point_positions], y[point_positions]
+    inside = shapely.contains_xy(polygons[polygon_positions], x, y)
+    matched = _lowest_match(num_points, point_positions[inside], polygon_positions[inside])
+    # A point on a shared edge is contained by no tract; it goes to the lowest touching one
+    tie = ~inside & (matched[point_positions] == -1)
+    tie[tie] = shapely.intersects_xy(polygons[polygon_positions[tie]], x[tie], y[tie])
+    ties = _lowest_match(num_points, point_positions[tie], polygon_positions[tie])
+    return np.where(matched == -1, ties, matched)
+
+
+def _init_worker(polygon_wkb):
+    global _worker_polygons, _worker_tree
+    _worker_polygons = shapely.from_wkb(polygon_wkb)
+    shapely.prepare(_worker_polygons)
+    _worker_tree = shapely.STRtree(_worker_polygons)
+
+
+def _match_chunk(x, y):
+    return match_points(_worker_tree, _worker_polygons, x, y)
+
+
+def assign_polygons(points, polygons, id_col='poly_idx', workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Left-join polygons[id_col] onto point geometries, like gpd.sjoin(how='left', predicate='within').
+
+    Adds id_col (NaN for points outside every polygon) and 'index_right'. Points
+    and polygons must share a CRS.
+    """
+    # Sorting by id makes the lowest tree position the lowest id when breaking ties
+    polygons = polygons.sort_values(id_col, kind='stable')
+    x = points.geometry.x.to_numpy()
+    y = points.geometry.y.to_numpy()
+    matched = np.full(len(points), -1, dtype=np.int64)
+    if len(points) and len(polygons):
+        order = sharded_routing.morton_order(x, y)
+        chunks = [order[start:start + chunk_size] for start in range(0, len(order), chunk_size)]
+        if workers > 1 and len(chunks) > 1:
+            with concurrent.futures.ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(shapely.to_wkb(polygons.geometry.to_numpy()),)) as pool:
+                results = pool.map(_match_chunk, [x[chunk] for chunk in chunks], [y[chunk] for chunk in chunks])
+                for chunk, result in zip(chunks, results):
+                    matched[chunk] = result
+        else:
+            geometries = polygons.geometry.to_numpy()
+            shapely.prepare(geometries)
+            tree = shapely.STRtree(geometries)
+            for chunk in chunks:
+                matched[chunk] = match_points(tree, geometries, x[chunk], y[chunk])
+
+    joined = points.copy()
+    # -1 (no tract) becomes NaN, as in a left sjoin
+    joined['index_right'] = pd.api.extensions.take(polygons.index.to_numpy(), matched, allow_fill=True)
+    joined[id_col] = pd.api.extensions.take(polygons[id_col].to_numpy(), matched, allow_fill=True)
+    return joined
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""Deterministic synthetic inputs for one county, laid out as the pipeline expects them.
+
+generate() writes, under a working directory:
+
+    state_data/SVI_{state}_SHP.shp              rectangular tracts with COUNTY, E_NOVEH, M_NOVEH,
+                                                OBJECTID, GEOID, FIPS (plus a neighbouring county)
+    state_data/{state}_Hospitals/Hospitals.shp  hospitals with objectid, fcounty, hgenlic
+    state_data/osm/{osm}.osm.pbf                a road grid (primary/secondary every 10th line,
+                                                residential/tertiary otherwise), written with pyosmium
+    county_data/{county}/nc_{county}_parcels_pt.shp
+                                                parcel points (NC State Plane) with PARUSEDESC,
+                                                ALTPARNO, NPARNO
+    county_data/residential_use_codes.json      the county's residential codes
+
+The same seed and sizes always give the same files, so timings of different
+commits are comparable. Used by benchmark_suite; can also be run directly:
+
+    python src/synthetic_county.py --work_dir /tmp/synthetic --num_parcels 100000
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+DEFAULT_COUNTY = 'Synthia'
+DEFAULT_STATE = 'Synthetic'
+DEFAULT_OSM = 'Synthetic'
+PARCEL_CRS = 'EPSG:2264'  # NC State Plane (US feet), as in the county parcel files
+# County extent (lon/lat) and the margin that holds the surrounding hospitals and roads
+COUNTY_BOUNDS = (-79.0, 34.4, -78.4, 34.9)
+MARGIN_DEGREES = 0.7
+ROAD_SPACING_DEGREES = 0.01
+PARCELS_PER_TRACT = 2000
+NUM_HOSPITALS = 25
+RESIDENTIAL_CODES = ['RESIDENTIAL IMPROVED', 'RURAL IMPROVED', 'TOWNHOUSE']
+OTHER_CODES = ['COMMERCIAL', 'VACANT', 'INDUSTRIAL']
+
+
+# --- Roads ---------------------------------------------------------------------------------------
+
+def write_road_grid(path, bounds, spacing=ROAD_SPACING_DEGREES):
+    """Write a grid of drivable ways over bounds (lon/lat) as an .osm.pbf file."""
+    import osmium
+
+    min_lon, min_lat, max_lon, max_lat = bounds
+    longitudes = np.arange(min_lon, max_lon + spacing / 2, spacing)
+    latitudes = np.arange(min_lat, max_lat + spacing / 2, spacing)
+    num_columns = len(longitudes)
+    node_ids = np.arange(len(latitudes) * num_columns, dtype=np.int64).reshape(len(latitudes), num_columns) + 1
+
+    ways = [({'highway': 'primary', 'maxspeed': '55 mph'} if row % 10 == 0 else {'highway': 'residential'},
+             node_ids[row]) for row in range(len(latitudes))]
+    ways += [({'highway': 'secondary', 'maxspeed': '45 mph'} if column % 10 == 0 else {'highway': 'tertiary'},
+              node_ids[:, column]) for column in range(num_columns)]
+    if os.path.exists(path):
+        os.remove(path)
+    writer = osmium.SimpleWriter(path)
+    try:
+        for row, latitude in enumerate(latitudes):
+            for column, longitude in enumerate(longitudes):
+                writer.add_node(osmium.osm.mutable.Node(id=int(node_ids[row, column]),
+                                                        location=(float(longitude), float(latitude))))
+        for way_id, (tags, refs) in enumerate(ways, start=1):
+            writer.add_way(osmium.osm.mutable.Way(id=way_id, nodes=refs.tolist(), tags=tags))
+    finally:
+        writer.close()
+    return node_ids.size, len(ways)
+
+
+# --- Layers --------------------------------------------------------------------------------------
+
+def _tract_grid(bounds, num_tracts):
+    min_lon, min_lat, max_lon, max_lat = bounds
+    columns = int(np.ceil(np.sqrt(num_tracts * (max_lon - min_lon) / (max_lat - min_lat))))
+    rows = int(np.ceil(num_tracts / columns))
+    lon_edges = np.linspace(min_lon, max_lon, columns + 1)
+    lat_edges = np.linspace(min_lat, max_lat, rows + 1)
+    return [(lon_edges[c], lat_edges[r], lon_edges[c + 1], lat_edges[r + 1])
+            for r in range(rows) for c in range(columns)]
+
+
+def generate(work_dir, num_parcels, seed=0, county_name=DEFAULT_COUNTY, state_name=DEFAULT_STATE,
+             osm_name=DEFAULT_OSM):
+    """Write the synthetic inputs of one county under work_dir and return their sizes."""
+    import geopandas
+    import shapely
+
+    rng = np.random.default_rng(seed)
+    min_lon, min_lat, max_lon, max_lat = COUNTY_BOUNDS
+    for folder in ['state_data/osm', f'state_data/{state_name}_Hospitals', f'county_data/{county_name}']:
+        os.makedirs(os.path.join(work_dir, folder), exist_ok=True)
+
+    # Tracts of the county, followed by a neighbouring county to the east
+    num_tracts = max(4, num_parcels // PARCELS_PER_TRACT)
+    boxes = _tract_grid(COUNTY_BOUNDS, num_tracts)
+    neighbour = _tract_grid((max_lon, min_lat, max_lon + 0.3, max_lat), 4)
+    fips = [f"37999{index:06d}" for index in range(len(boxes) + len(neighbour))]
+    tracts = geopandas.GeoDataFrame({
+        'COUNTY': [f"{county_name} County"] * len(boxes) + ["Neighbour County"] * len(neighbour),
+        'E_NOVEH': rng.integers(0, 500, len(fips)),
+        'M_NOVEH': rng.integers(5, 60, len(fips)),
+        'OBJECTID': np.arange(1, len(fips) + 1),
+        'GEOID': fips,
+        'FIPS': fips,
+    }, geometry=shapely.box(*np.array(boxes + neighbour).T), crs='EPSG:4269')
+    tracts.to_file(os.path.join(work_dir, f'state_data/SVI_{state_name}_SHP.shp'))
+
+    # Parcels, a few of them outside the county's tracts
+    longitude = rng.uniform(min_lon - 0.01, max_lon + 0.01, num_parcels)
+    latitude = rng.uniform(min_lat - 0.01, max_lat + 0.01, num_parcels)
+    codes = RESIDENTIAL_CODES + OTHER_CODES
+    parcels = geopandas.GeoDataFrame({
+        'PARUSEDESC': rng.choice(codes, num_parcels, p=[0.55, 0.2, 0.05, 0.1, 0.07, 0.03]),
+        'ALTPARNO': [f"A{index}" for index in range(num_parcels)],
+        'NPARNO': np.arange(num_parcels),
+    }, geometry=geopandas.points_from_xy(longitude, latitude), crs='EPSG:4269').to_crs(PARCEL_CRS)
+    parcels.to_file(os.path.join(work_dir, f'county_data/{county_name}/nc_{county_name.lower()}_parcels_pt.shp'))
+
+    # Hospitals around the county
+    longitude = rng.uniform(min_lon - MARGIN_DEGREES + 0.1, max_lon + MARGIN_DEGREES - 0.1, NUM_HOSPITALS)
+    latitude = rng.uniform(min_lat - MARGIN_DEGREES + 0.1, max_lat + MARGIN_DEGREES - 0.1, NUM_HOSPITALS)
+    inside = (longitude >= min_lon) & (longitude <= max_lon) & (latitude >= min_lat) & (latitude <= max_lat)
+    hospitals = geopandas.GeoDataFrame({
+        'objectid': np.arange(NUM_HOSPITALS),
+        'fcounty': np.where(inside, county_name, 'Other'),
+        'hgenlic': rng.integers(10, 500, NUM_HOSPITALS),
+    }, geometry=geopandas.points_from_xy(longitude, latitude), crs='EPSG:4269')
+    hospitals.to_file(os.path.join(work_dir, f'state_data/{state_name}_Hospitals/Hospitals.shp'))
+
+    with open(os.path.join(work_dir, 'county_data/residential_use_codes.json'), 'w', encoding='utf-8') as f:
+        json.dump({'column': 'PARUSEDESC', 'counties': {county_name: RESIDENTIAL_CODES}}, f, indent=2)
+
+    road_bounds = (min_lon - MARGIN_DEGREES, min_lat - MARGIN_DEGREES,
+                   max_lon + MARGIN_DEGREES, max_lat + MARGIN_DEGREES)
+    num_nodes, num_ways = write_road_grid(os.path.join(work_dir, f'state_data/osm/{osm_name}.osm.pbf'), road_bounds)
+    return {'num_parcels': num_parcels, 'num_tracts': len(boxes), 'num_hospitals': NUM_HOSPITALS,
+            'num_road_nodes': num_nodes, 'num_roads': num_ways}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write deterministic synthetic inputs for one county.")
+    parser.add_argument("--work_dir", type=str, required=True, help="Folder to write state_data/ and county_data/ into")
+    parser.add_argument("--num_parcels", type=int, default=100000, help="Number of parcel points (default: 100000)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    args = parser.parse_args()
+    print(generate(args.work_dir, args.num_parcels, seed=args.seed))
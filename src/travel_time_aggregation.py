@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Per-origin aggregation of long-format travel time matrices.
+
+aggregate_travel_times replaces the groupby/lambda aggregation that used to sit
+at the end of find_tt_matrix. It sorts the matrix once by (to_id, travel_time)
+and reads every statistic (k smallest, median, mean, quartiles) straight out of
+the sorted arrays, so the cost no longer grows with the number of Python calls
+per origin. tests/test_travel_time_aggregation.py checks it against the
+original pandas version.
+"""
+import numpy as np
+import pandas as pd
+
+ORDINAL_NAMES = {2: 'second', 3: 'third'}
+# Statistics over every hospital, which a candidate-pruned matrix cannot give (see candidate_pruning)
+ALL_HOSPITAL_COLUMNS = ['median_travel_time', 'average_travel_time', 'q1_travel_time', 'q3_travel_time']
+
+
+def kth_min_column(n):
+    """Column name of the n-th smallest travel time (n >= 2)."""
+    return f"{ORDINAL_NAMES.get(n, f'{n}th')}_min_travel_time"
+
+
+def _interpolated_quantile(sorted_values, starts, n_valid, q):
+    """Linear-interpolation quantile (pandas default) of each sorted segment."""
+    result = np.full(len(starts), np.nan)
+    has_values = n_valid > 0
+    position = q * (n_valid[has_values] - 1)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.ceil(position).astype(np.int64)
+    lower_values = sorted_values[starts[has_values] + lower]
+    upper_values = sorted_values[starts[has_values] + upper]
+    result[has_values] = lower_values + (upper_values - lower_values) * (position - lower)
+    return result
+
+
+def aggregate_travel_times(travel_times, k=3, pruned=False):
+    """Aggregate a (from_id, to_id, travel_time) matrix to one row per to_id.
+
+    Produces the same min/second/third/median/average/q1/q3 columns as the
+    previous pandas aggregation (for k > 3 further n-th minimum columns are
+    added) plus nearest_{n}_hospital_id for the k nearest hospitals, and
+    min_travel_time_p{p} for every travel_time_p{p} percentile column.
+    Unreachable pairs (NaN travel time) sort after every reachable one and are
+    ignored by the mean and quantiles; as before, the n-th minimum is only
+    reported for origins with at least n rows.
+
+    pruned marks a matrix holding only the candidate hospitals of each origin
+    (candidate_pruning): the k nearest stay exact, but the median, mean and
+    quartiles would be biased towards close hospitals, so they are written as
+    NaN and their candidate-only values go to *_pruned columns instead.
+    """
+    to_codes, to_ids = pd.factorize(travel_times['to_id'], sort=True)
+    values = travel_times['travel_time'].to_numpy(dtype=float)
+    from_ids = travel_times['from_id'].to_numpy()
+    valid = ~np.isnan(values)
+
+    # One sort: grouped by origin, ascending travel time, unreachable pairs last
+    order = np.lexsort((np.where(valid, values, np.inf), to_codes))
+    sorted_values = values[order]
+    sorted_from_ids = from_ids[order]
+
+    num_groups = len(to_ids)
+    n_total = np.bincount(to_codes, minlength=num_groups)
+    n_valid = np.bincount(to_codes, weights=valid, minlength=num_groups).astype(np.int64)
+    starts = (np.cumsum(n_total) - n_total).astype(np.int64)
+    has_values = n_valid > 0
+
+    result = pd.DataFrame({'to_id': to_ids})
+    min_travel_time = np.full(num_groups, np.nan)
+    min_travel_time[has_values] = sorted_values[starts[has_values]]
+    result['min_travel_time'] = min_travel_time
+    for n in range(2, k + 1):
+        # Matches nsmallest(n).iloc[-1], which sorts unreachable pairs last
+        reported = n_total >= n
+        kth_values = np.full(num_groups, np.nan)
+        kth_values[reported] = sorted_values[starts[reported] + n - 1]
+        result[kth_min_column(n)] = kth_values
+    result['median_travel_time'] = _interpolated_quantile(sorted_values, starts, n_valid, 0.5)
+    sums = np.bincount(to_codes, weights=np.where(valid, values, 0.0), minlength=num_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result['average_travel_time'] = np.where(has_values, sums / n_valid, np.nan)
+    result['q1_travel_time'] = _interpolated_quantile(sorted_values, starts, n_valid, 0.25)
+    result['q3_travel_time'] = _interpolated_quantile(sorted_values, starts, n_valid, 0.75)
+    if pruned:
+        for column in ALL_HOSPITAL_COLUMNS:
+            result[f'{column}_pruned'] = result[column]
+            result[column] = np.nan
+
+    for n in range(1, k + 1):
+        reachable = n_valid >= n
+        nearest_ids = pd.Series(sorted_from_ids[np.minimum(starts + n - 1, len(order) - 1)]).convert_dtypes()
+        result[f'nearest_{n}_hospital_id'] = nearest_ids.where(reachable)
+
+    # Departure-window percentiles routed besides travel_time: nearest-hospital time at each
+    for column in percentile_columns(travel_times):
+        minimums = pd.Series(travel_times[column].to_numpy(dtype=float)).groupby(to_codes).min()
+        result[f'min_{column}'] = minimums.reindex(range(num_groups)).to_numpy()
+    return result
+
+
+def percentile_columns(travel_times):
+    """travel_time_p{p} columns of a matrix routed with several departure-window percentiles."""
+    return [column for column in travel_times.columns if column.startswith('travel_time_p')]
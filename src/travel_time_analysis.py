@@ -1,28 +1,252 @@
 #!/usr/bin/env python3
-import geopandas
-import r5py
-import numpy as np
-import shapely
 import pandas as pd
 pd.set_option('display.max_columns', None)
-import folium
-import folium.plugins
-import matplotlib.pyplot as plt
+import concurrent.futures
+import contextlib
 import datetime
+import functools
+import glob
 import os
 import time
-import random
-import osmnx as ox
-import warnings
-import networkx as nx
 import argparse
-import chardet
 
-def detect_encoding(file_path):
-    with open(file_path, 'rb') as f:
-        result = chardet.detect(f.read())
-        return result['encoding']
-def find_tt_matrix(county_name, state_name, option, osm_filename):
+import routing_daemon
+import sharded_routing
+import travel_time_aggregation
+import result_io
+import input_loader
+import instrumentation
+import candidate_pruning
+import origin_dedup
+import pair_cache
+import results_store
+import graph_routing
+import travel_time_surface
+import departure_sweep
+
+# Car-only routing at a fixed Sunday afternoon departure, as used in the paper
+DEFAULT_DEPARTURE = datetime.datetime(2024, 6, 9, 15, 30)
+DEFAULT_TRANSPORT_MODES = ('CAR',)
+ROUTING_BACKENDS = ('r5', 'csr')
+# --mode presets as r5py.TransportMode names; transit and rail trips walk to and from the stops
+TRANSPORT_MODE_PRESETS = {
+    'car': ('CAR',),
+    'transit': ('TRANSIT', 'WALK'),
+    'rail': ('RAIL', 'WALK'),
+    'walk': ('WALK',),
+}
+DEFAULT_DEPARTURE_WORKERS = 4
+
+
+def routing_key(osm_path, backend='r5', gtfs_paths=(), travel_options=None):
+    """Key of the routing setup whose travel times a pair cache or surface may reuse."""
+    travel_options = travel_options or {}
+    if backend == 'csr':
+        return pair_cache.network_key(osm_path, graph_routing.TRANSPORT_MODES, DEFAULT_DEPARTURE)
+    return pair_cache.network_key(osm_path, travel_options.get('transport_modes', DEFAULT_TRANSPORT_MODES),
+                                  travel_options.get('departure', DEFAULT_DEPARTURE), gtfs_paths=gtfs_paths,
+                                  departure_time_window=travel_options.get('departure_time_window'),
+                                  percentiles=travel_options.get('percentiles'))
+
+def county_gtfs_paths(county_name):
+    """GTFS zips of a county, kept in county_data/<county>/gtfs/."""
+    return sorted(glob.glob(f"county_data/{county_name}/gtfs/*.zip"))
+
+def origin_file(county_name, option):
+    """Origin CSV of a county and option and its id column."""
+    if option==1:
+        return f"county_data/{county_name}/Option1_county_centroids.csv", 'poly_idx'
+    elif option==2:
+        return f"county_data/{county_name}/Option2_county_centroids.csv", 'county_index'
+    #file_path = f"county_data/{county_name}/guilford_rev.csv"
+    #file_path = f"county_data/{county_name}/guilford_low_ppscore.csv"
+    #file_path = f"county_data/{county_name}/bladen.csv"
+    #id_col = 'TARGET_FID'
+    #id_col = 'OBJECTID'
+    return f"county_data/{county_name}/Option3_residential_parcel_centroids.csv", 'new_index'
+
+def build_transport_network(osm_path, gtfs_paths=()):
+    """Load the OSM (and optional GTFS) files into an r5py transport network."""
+    with instrumentation.span('network_build'):
+        # r5py starts a JVM on import, so it is only imported where a network is built or used
+        import r5py
+        return r5py.TransportNetwork(osm_path, list(gtfs_paths))
+
+def compute_travel_times(transport_network, origins, destinations,
+                         departure=DEFAULT_DEPARTURE, transport_modes=DEFAULT_TRANSPORT_MODES,
+                         departure_time_window=None, percentiles=None):
+    """Route every origin to every destination and return the long-format travel time matrix.
+
+    transport_modes holds r5py.TransportMode names (e.g. 'CAR') so that the same
+    arguments can be sent to the routing daemon as JSON. departure_time_window
+    (a timedelta) and percentiles are passed to r5 when given: trips are
+    started every minute of the window and the percentiles of their travel
+    times reported. travel_time is then the median (or the only or first
+    percentile), and with several percentiles the matrix also has a
+    travel_time_p{p} column for each of them.
+    """
+    import r5py
+    window_options = {}
+    if departure_time_window is not None:
+        window_options['departure_time_window'] = departure_time_window
+    if percentiles:
+        window_options['percentiles'] = list(percentiles)
+    travel_time_matrix_computer = r5py.TravelTimeMatrixComputer(
+        transport_network,
+        origins=origins,
+        destinations=destinations,
+        departure=departure,
+        transport_modes=[r5py.TransportMode[mode] for mode in transport_modes],
+        **window_options,
+    )
+    travel_times = travel_time_matrix_computer.compute_travel_times()
+    if percentiles and 'travel_time' not in travel_times.columns:
+        reported = 50 if 50 in percentiles else percentiles[0]
+        travel_times['travel_time'] = travel_times[f'travel_time_p{reported}']
+        if len(percentiles) == 1:
+            travel_times = travel_times.drop(columns=f'travel_time_p{reported}')
+    return travel_times
+
+def route_hospitals_to_origins(osm_path, hospitals, origins, use_daemon=True, transport_network=None,
+                               workers=1, chunk_size=None, worker_pool=None, gtfs_paths=(), travel_options=None):
+    """Pick the routing path for one job: sharded chunks, the routing daemon, or a single in-process call.
+
+    Routing goes from hospitals to origins, so the r5 origins are the hospitals.
+    travel_options are compute_travel_times keyword arguments (departure,
+    transport_modes, departure_time_window, percentiles).
+    """
+    start_time = time.time()
+    travel_options = travel_options or {}
+    if workers > 1 or worker_pool is not None or chunk_size is not None:
+        chunk_size = chunk_size or sharded_routing.DEFAULT_CHUNK_SIZE
+        own_pool = worker_pool is None and workers > 1
+        if own_pool:
+            worker_pool = sharded_routing.open_worker_pool(osm_path, workers, gtfs_paths)
+        elif worker_pool is None and transport_network is None:
+            transport_network = build_transport_network(osm_path, gtfs_paths)
+        print(f"Starting sharded travel time computations. Elapsed time {time.time()-start_time} sec.")
+        try:
+            return sharded_routing.compute_travel_times_sharded(
+                hospitals, origins, chunk_size, worker_pool=worker_pool, transport_network=transport_network,
+                travel_options=travel_options)
+        finally:
+            if own_pool:
+                worker_pool.shutdown()
+    if use_daemon and transport_network is None:
+        travel_times = routing_daemon.request_travel_times(osm_path, hospitals, origins, gtfs_paths,
+                                                           **travel_options)
+        if travel_times is not None:
+            print(f"Travel times computed by the routing daemon. Elapsed time {time.time()-start_time} sec.")
+            return travel_times
+    if transport_network is None:
+        transport_network = build_transport_network(osm_path, gtfs_paths)
+    print(f"Starting travel time computations. This could take a while! Elapsed time {time.time()-start_time} sec.")
+    return compute_travel_times(transport_network, hospitals, origins, **travel_options)
+
+@contextlib.contextmanager
+def routing_session(osm_path, use_daemon=True, transport_network=None, workers=1, chunk_size=None, worker_pool=None,
+                    backend='r5', gtfs_paths=(), travel_options=None):
+    """Load the network (or worker pool) once and yield route(hospitals, origins) for any number of jobs.
+
+    backend 'r5' routes with r5py; nothing is loaded when a routing daemon is
+    running and no pool is requested, and a worker pool opened here is shut down
+    when the session ends. gtfs_paths are loaded into the network and
+    travel_options (departure, transport_modes, departure_time_window,
+    percentiles) apply to every job. backend 'csr' routes on the drive graph of
+    the OSM file (see graph_routing) and ignores the r5 options; it is car-only.
+    """
+    if backend == 'csr':
+        if set((travel_options or {}).get('transport_modes', DEFAULT_TRANSPORT_MODES)) != {'CAR'}:
+            raise ValueError("The csr routing backend only routes cars")
+        with instrumentation.span('network_build'):
+            graph = graph_routing.load_drive_graph(osm_path)
+        yield graph.route
+        return
+    own_pool = worker_pool is None and workers > 1
+    if own_pool:
+        worker_pool = sharded_routing.open_worker_pool(osm_path, workers, gtfs_paths)
+    elif (worker_pool is None and transport_network is None
+          and not (use_daemon and routing_daemon.daemon_status() is not None)):
+        transport_network = build_transport_network(osm_path, gtfs_paths)
+
+    def route(hospitals, origins):
+        return route_hospitals_to_origins(osm_path, hospitals, origins, use_daemon=use_daemon,
+                                          transport_network=transport_network,
+                                          chunk_size=chunk_size, worker_pool=worker_pool,
+                                          gtfs_paths=gtfs_paths, travel_options=travel_options)
+    try:
+        yield route
+    finally:
+        if own_pool:
+            worker_pool.shutdown()
+
+def stream_travel_times(hospitals, origins, batch_size, route, raw_writer=None, k_nearest=3, pruned=False):
+    """Route and aggregate origins in spatially coherent batches of batch_size.
+
+    Every origin lives in exactly one batch, so its aggregate is complete once its
+    batch is routed and only the per-origin aggregates are kept. Peak memory is
+    set by batch_size x number of hospitals rather than by the county size.
+    pruned is passed on to aggregate_travel_times (route is candidate-pruned).
+    """
+    start_time = time.time()
+    batches = sharded_routing.spatial_chunks(origins, batch_size)
+    aggregates = []
+    try:
+        for batch_number, batch in enumerate(batches, start=1):
+            with instrumentation.span('routing') as routing:
+                travel_times = route(hospitals, batch)
+                routing.rows = len(travel_times)
+            if raw_writer is not None:
+                with instrumentation.span('write', rows=len(travel_times)):
+                    raw_writer.append(travel_times)
+            with instrumentation.span('aggregation', rows=len(travel_times)):
+                aggregates.append(travel_time_aggregation.aggregate_travel_times(travel_times, k=k_nearest,
+                                                                                  pruned=pruned))
+            print(f"==Batch {batch_number}/{len(batches)} routed and aggregated. Elapsed time {time.time()-start_time} sec.")
+    finally:
+        if raw_writer is not None:
+            raw_writer.close()
+    if raw_writer is not None:
+        print(f"DataFrame exported to '{raw_writer.path}' successfully.")
+    return pd.concat(aggregates, ignore_index=True).sort_values('to_id', ignore_index=True)
+
+def find_tt_matrix(county_name, state_name, option, osm_filename, use_daemon=True, transport_network=None,
+                   workers=1, chunk_size=None, worker_pool=None, k_nearest=3,
+                   stream_batch_size=None, write_raw=True, output_format=result_io.DEFAULT_OUTPUT_FORMAT,
+                   prune_candidates=False, exact_check=False, deduplicate_origins=False, snap_tolerance_m=None,
+                   pair_cache_path=None, pair_cache_max_pairs=pair_cache.DEFAULT_MAX_PAIRS, results_store_path=None,
+                   surfaces_path=None, routing_backend='r5', gtfs_paths=(), travel_options=None, output_dir=None):
+    """Compute and export the hospital-to-origin travel time matrix for one county and option.
+
+    With workers > 1 (or an already open worker_pool) the origins are split into
+    spatial chunks of chunk_size and routed in parallel worker processes; a
+    chunk_size with a single worker routes the chunks one after another.
+    k_nearest sets how many nearest hospitals (times and ids) are aggregated per origin.
+    With stream_batch_size the full matrix is never held in memory: origins are
+    routed and aggregated batch by batch, and the raw matrix (if write_raw) is
+    appended to its file as each batch finishes.
+    output_format is 'parquet' (compact, default) or 'csv'.
+    prune_candidates routes each origin only to hospitals that can be among its
+    k_nearest (see candidate_pruning); exact_check also routes the full matrix
+    and reports any difference in the k nearest travel times. The median, mean
+    and quartiles of a pruned run are NaN, with their candidate-only values in
+    *_pruned columns.
+    deduplicate_origins routes origins with identical coordinates once; a
+    snap_tolerance_m also merges origins within that grid distance (lossy,
+    the snapping error is reported).
+    pair_cache_path keeps every routed pair in a persistent cache so that a rerun
+    only routes pairs whose origin or hospital coordinates are new (see pair_cache).
+    results_store_path also records the run, its aggregates (and raw pairs if
+    write_raw) and the county's tract attributes in a results store (see results_store).
+    surfaces_path answers every pair from precomputed hospital travel time surfaces
+    instead of routing (see travel_time_surface); no network is loaded, and the
+    aggregated file gets each origin's snap distance in surface_snap_m.
+    routing_backend is 'r5' (r5py) or 'csr' (free-flow Dijkstra on the OSM drive
+    graph, see graph_routing).
+    gtfs_paths and travel_options (departure, transport_modes,
+    departure_time_window, percentiles) set up transit runs; see compute_travel_times.
+    output_dir is the folder of the output files (default: the county folder).
+    """
     start_time = time.time()
     # Get the directory where the current script is located
     #script_dir = os.path.dirname(os.path.realpath(__file__))
@@ -31,146 +255,354 @@ def find_tt_matrix(county_name, state_name, option, osm_filename):
     # print("GTFS path is ", gtfs_path)
     osm_path = f"state_data/osm/{osm_filename}.osm.pbf"
     # Path to the CSV file
-    if option==1:
-        file_path = f"county_data/{county_name}/Option1_county_centroids.csv"
-        id_col = 'poly_idx'
-    elif option==2:
-        file_path = f"county_data/{county_name}/Option2_county_centroids.csv"
-        id_col = 'county_index'
-    elif option==3:
-        #file_path = f"county_data/{county_name}/guilford_rev.csv"
-        #file_path = f"county_data/{county_name}/guilford_low_ppscore.csv"
-        #file_path = f"county_data/{county_name}/bladen.csv"
-        #id_col = 'TARGET_FID'
-        #id_col = 'OBJECTID'
-    #else:
-        file_path = f"county_data/{county_name}/Option3_residential_parcel_centroids.csv"
-        id_col = 'new_index'
-    df = pd.read_csv(file_path, encoding='utf-8')
-    # Detect encoding of the file
-    encoding = detect_encoding(file_path)
-    print(f"Detected encoding for {file_path}: {encoding}")
-
-    # Read the CSV file with detected encoding
-    df = pd.read_csv(file_path, encoding=encoding)
-    
-    num_random_points = len(df)
-    # Create the list of tuples
-    coordinates = list(zip(df['latitude'], df['longitude']))
-    #coordinates = list(zip(df['MEAN_Centroidlat'], df['MEAN_CentroidLon']))
-    #coordinates = list(zip(df['MEAN_LAT'], df['MEAN_LON']))
-    #coordinates = list(zip(df['Centroid_LAT'], df['Centroid_LON']))
-    # ids = list(zip(df[id_col]))
-    ids = [item[0] for item in list(zip(df[id_col]))]
-    # print("Intended ids for origins", ids)
-    # Create a list of Shapely Point objects
-    points = [shapely.Point(lon, lat) for lat, lon in coordinates]
-    # Create a GeoDataFrame
-    origins = geopandas.GeoDataFrame(
-        {
-            "id": ids,  #range(1, len(coordinates) + 1),  # Assign IDs to each point
-            "geometry": points
-        },
-        crs="EPSG:4269" #previously 4326
-    )
+    file_path, id_col = origin_file(county_name, option)
+    # Read the origins once (encoding detected from a cached sample) as a point GeoDataFrame
+    with instrumentation.span('read_origins', county=county_name, option=option) as read_origins:
+        origins = input_loader.read_points_csv(file_path, id_col)
+        read_origins.rows = len(origins)
+    num_random_points = len(origins)
     print(f"=={len(origins)} origins read. Elapsed time {time.time()-start_time} sec since code start.")
     # Path to the CSV file
     file_path = f"county_data/{county_name}/hospitals_within_buffer.csv"
-    # Read the CSV file
-    df = pd.read_csv(file_path)
-    # Create the list of tuples
-    coordinates_2 = [(row['latitude'], row['longitude']) for index, row in df.iterrows()]
-    # ids = list(zip(df['ID']))
-    ids = [item[0] for item in list(zip(df['ID']))]
-    # print("Intended ids for destinations", ids)
-    points = [shapely.Point(lon, lat) for lat, lon in coordinates_2]
-    # dest = shapely.Point(-78.904472, 35.99325)
-    destinations = geopandas.GeoDataFrame(
-            {
-                "id": ids, #range(len(coordinates)+1, len(coordinates)+len(coordinates_2) + 1),
-                "geometry": points
-            },
-            crs="EPSG:4269",
-    )
+    with instrumentation.span('read_hospitals', county=county_name, option=option) as read_hospitals:
+        destinations = input_loader.read_points_csv(file_path, 'ID')
+        read_hospitals.rows = len(destinations)
+    num_hospitals = len(destinations)
     print(f"=={len(destinations)} destinations read. Elapsed time {time.time()-start_time} sec since code start.")
     # print("origins = ",origins)
     # print("dest = ", destinations)
 
-    transport_network = r5py.TransportNetwork(
-        osm_path,
-        [
-            # gtfs_path,
-            # gtfs_path1,
-            # gtfs_path3
-        ]
-    )
-    
-    travel_time_matrix_computer = r5py.TravelTimeMatrixComputer(
-        # transport_network_from_dir,
-        transport_network,
-        origins=destinations, #origins,
-        destinations=origins, #destinations,
-        departure=datetime.datetime(2024, 6, 9, 15, 30),
-        # access_modes=[r5py.TransportMode.CAR], #before
-        transport_modes=[
-            # r5py.TransportMode.TRANSIT,
-            # r5py.TransportMode.WALK,
-            r5py.TransportMode.CAR,
-            # r5py.TransportMode.SUBWAY,
-            # r5py.TransportMode.RAIL,
-            # r5py.TransportMode.BICYCLE,
-
-        ],
-        # access_modes = []
-
-    )
-    print(f"Starting travel time computations. This could take a while! Elapsed time {time.time()-start_time} sec since code start.")
-    # travel_time_matrix_computer.request.access_modes = [r5py.TransportMode.CAR]
-    travel_times = travel_time_matrix_computer.compute_travel_times()
-    print(f"Travel time computations finished. Elapsed time {time.time()-start_time} sec since code start.")
-    print(travel_times.head(15))
     # Generate a unique epoch identifier for the filename
     epoch_time = int(time.time())  # Current epoch time in seconds
+    output_dir = output_dir or f"county_data/{county_name}"
+    os.makedirs(output_dir, exist_ok=True)
     # Construct the filename with the unique epoch identifier
-    filename = f"county_data/{county_name}/Option{option}_travel_times_{num_random_points}locations_to_{len(coordinates_2)}hospitals_{epoch_time}.csv"
-    # Export the DataFrame to CSV with the unique filename
-    travel_times.to_csv(filename, index=False)
-    print(f"DataFrame exported to '{filename}' successfully.")
-
-    # Assuming you have your travel_times DataFrame
-    print(f"Starting aggregation by origin. This could take a while! Elapsed time {time.time()-start_time} sec since code start.")
-    result = travel_times.groupby('to_id')['travel_time'].agg([
-        ('min_travel_time', 'min'),
-        ('second_min_travel_time', lambda x: x.nsmallest(2).iloc[-1] if len(x) >= 2 else None),
-        ('third_min_travel_time', lambda x: x.nsmallest(3).iloc[-1] if len(x) >= 3 else None),
-        ('median_travel_time', 'median'),
-        ('average_travel_time', 'mean'),
-        ('q1_travel_time', lambda x: x.quantile(0.25)),  # 25th percentile
-        ('q3_travel_time', lambda x: x.quantile(0.75))   # 75th percentile
-    ]).reset_index()
+    filename = f"{output_dir}/Option{option}_travel_times_{num_random_points}locations_to_{num_hospitals}hospitals_{epoch_time}"
+    if surfaces_path:
+        surfaces = travel_time_surface.TravelTimeSurfaces(surfaces_path)
+        surfaces.check_network(routing_key(osm_path, routing_backend, gtfs_paths, travel_options))
+        session = contextlib.nullcontext(surfaces.route)
+        print(f"==Travel times are looked up in the surfaces at {surfaces_path}. Elapsed time {time.time()-start_time} sec since code start.")
+    else:
+        session = routing_session(osm_path, use_daemon=use_daemon, transport_network=transport_network,
+                                  workers=workers, chunk_size=chunk_size, worker_pool=worker_pool,
+                                  backend=routing_backend, gtfs_paths=gtfs_paths, travel_options=travel_options)
+    with session as route, contextlib.ExitStack() as cleanup:
+        if pair_cache_path:
+            cache = cleanup.enter_context(pair_cache.PairCache(
+                pair_cache_path, routing_key(osm_path, routing_backend, gtfs_paths, travel_options),
+                max_pairs=pair_cache_max_pairs))
+            route = functools.partial(pair_cache.route_cached, route=route, cache=cache)
+        if prune_candidates:
+            route = functools.partial(candidate_pruning.route_pruned, route=route, k=k_nearest,
+                                      exact_check=exact_check)
+        if deduplicate_origins or snap_tolerance_m:
+            route = functools.partial(origin_dedup.route_deduplicated, route=route,
+                                      snap_tolerance_m=snap_tolerance_m)
+        store = None
+        if results_store_path:
+            store = cleanup.enter_context(results_store.ResultsStore(results_store_path))
+            run_id = store.start_run(county_name, option, epoch_time, num_random_points, num_hospitals, k_nearest)
+        if stream_batch_size:
+            print(f"Starting streamed travel time computations in batches of {stream_batch_size} origins. Elapsed time {time.time()-start_time} sec since code start.")
+            raw_writers = [result_io.TableAppender(filename, output_format)] if write_raw else []
+            if store is not None and write_raw:
+                raw_writers.append(results_store.PairWriter(store, run_id))
+            with instrumentation.span('stream', rows=len(origins), county=county_name, option=option):
+                result = stream_travel_times(destinations, origins, stream_batch_size, route,
+                                             raw_writer=result_io.TeeAppender(*raw_writers) if raw_writers else None,
+                                             k_nearest=k_nearest, pruned=prune_candidates)
+            print(f"Streamed travel time computations and aggregation finished. Elapsed time {time.time()-start_time} sec since code start.")
+        else:
+            with instrumentation.span('routing', county=county_name, option=option) as routing:
+                travel_times = route(destinations, origins)
+                routing.rows = len(travel_times)
+            print(f"Travel time computations finished. Elapsed time {time.time()-start_time} sec since code start.")
+            print(travel_times.head(15))
+            if write_raw:
+                # Export the DataFrame with the unique filename
+                with instrumentation.span('write', rows=len(travel_times), county=county_name, option=option):
+                    filename = result_io.write_table(travel_times, filename, output_format)
+                    print(f"DataFrame exported to '{filename}' successfully.")
+                    if store is not None:
+                        store.add_pairs(run_id, travel_times)
 
+            print(f"Starting aggregation by origin. Elapsed time {time.time()-start_time} sec since code start.")
+            with instrumentation.span('aggregation', rows=len(travel_times), county=county_name, option=option):
+                result = travel_time_aggregation.aggregate_travel_times(travel_times, k=k_nearest,
+                                                                        pruned=prune_candidates)
+        if surfaces_path:
+            # Each origin's distance to the surface point it took its travel times from
+            _, snap_m = surfaces.snap(origins)
+            result['surface_snap_m'] = result['to_id'].map(pd.Series(snap_m.round(1), index=origins['id'].to_numpy()))
+        if store is not None:
+            store.add_aggregates(run_id, option, result)
+            tracts_file = f"county_data/{county_name}/Option1_county_centroids.csv"
+            if os.path.exists(tracts_file):
+                store.record_tracts(county_name, input_loader.read_csv(tracts_file))
+            store.finish_run(run_id)
+            print(f"==Run {run_id} recorded in results store {results_store_path}. Elapsed time {time.time()-start_time} sec since code start.")
     print(result)
-    filename = f"county_data/{county_name}/Option{option}_aggregated_information_{num_random_points}locations_to_{len(coordinates_2)}hospitals__{epoch_time}.csv"
-    # Export the DataFrame to CSV with the unique filename
-    result.to_csv(filename, index=False)
+    filename = f"{output_dir}/Option{option}_aggregated_information_{num_random_points}locations_to_{num_hospitals}hospitals__{epoch_time}"
+    # Export the DataFrame with the unique filename
+    with instrumentation.span('write', rows=len(result), county=county_name, option=option):
+        filename = result_io.write_table(result, filename, output_format)
     print(f"DataFrame exported to '{filename}' successfully.")
     print(f"Finished aggregation by origin and exporting files. Elapsed time {time.time()-start_time} sec since code start.")
+    return {'num_origins': num_random_points, 'num_hospitals': num_hospitals, 'epoch_time': epoch_time,
+            'aggregated_path': filename}
 
-if __name__=='__main__':
+def list_prepared_counties():
+    """Counties under county_data/ that already have the geopandas_analysis.py outputs."""
+    return sorted(
+        name for name in os.listdir('county_data')
+        if os.path.isfile(f"county_data/{name}/hospitals_within_buffer.csv")
+    )
+
+def load_shared_network(osm_path, use_daemon=True, workers=1, gtfs_paths=(), surfaces_path=None,
+                        routing_backend='r5'):
+    """Load what several jobs route on once; returns (transport_network, worker_pool), either may be None.
+
+    Nothing is loaded for surfaces or a running routing daemon; the drive graph
+    of the csr backend is cached by graph_routing.
+    """
+    start_time = time.time()
+    transport_network = None
+    worker_pool = None
+    if surfaces_path:
+        print("==Travel times are looked up in precomputed surfaces; no network is loaded for the batch.")
+    elif routing_backend == 'csr':
+        with instrumentation.span('network_build'):
+            graph_routing.load_drive_graph(osm_path)
+        print(f"==Drive graph loaded once for the batch. Elapsed time {time.time()-start_time} sec since code start.")
+    elif workers > 1:
+        # Each worker loads the network once and is reused by every job
+        worker_pool = sharded_routing.open_worker_pool(osm_path, workers, gtfs_paths)
+    elif not (use_daemon and routing_daemon.daemon_status() is not None):
+        transport_network = build_transport_network(osm_path, gtfs_paths)
+        print(f"==Transport network built once for the batch. Elapsed time {time.time()-start_time} sec since code start.")
+    return transport_network, worker_pool
+
+def find_tt_matrix_batch(county_names, state_name, options, osm_filename, use_daemon=True, workers=1,
+                         gtfs_paths=(), **job_options):
+    """Run find_tt_matrix for every county/option pair against a single transport network.
+
+    The network is built once (or the routing daemon is used when running) instead of
+    once per job. job_options are passed on to every find_tt_matrix call.
+    A per-job timing summary is written to county_data/.
+    """
+    start_time = time.time()
+    osm_path = f"state_data/osm/{osm_filename}.osm.pbf"
+    transport_network, worker_pool = load_shared_network(
+        osm_path, use_daemon, workers, gtfs_paths, job_options.get('surfaces_path'),
+        job_options.get('routing_backend', 'r5'))
+    network_seconds = time.time() - start_time
+
+    timings = []
+    for county_name in county_names:
+        for option in options:
+            job_start = time.time()
+            print(f"\n==Batch job: {county_name}, Option {option}")
+            try:
+                summary = find_tt_matrix(county_name, state_name, option, osm_filename,
+                                         use_daemon=use_daemon, transport_network=transport_network,
+                                         worker_pool=worker_pool, gtfs_paths=gtfs_paths, **job_options)
+                status = 'ok'
+            except Exception as e:
+                print(f"Batch job {county_name}, Option {option} failed: {e!r}")
+                summary = {}
+                status = f'failed: {e!r}'
+            timings.append({
+                'county_name': county_name,
+                'option': option,
+                'num_origins': summary.get('num_origins'),
+                'num_hospitals': summary.get('num_hospitals'),
+                'seconds': time.time() - job_start,
+                'status': status,
+            })
+
+    if worker_pool is not None:
+        worker_pool.shutdown()
+    timing_df = pd.DataFrame(timings)
+    print(f"\nNetwork build: {network_seconds:.1f} sec")
+    print(timing_df)
+    filename = f"county_data/batch_timing_summary_{int(time.time())}.csv"
+    timing_df.to_csv(filename, index=False)
+    print(f"Timing summary exported to '{filename}'. Elapsed time {time.time()-start_time} sec since code start.")
+    return timing_df
+
+def find_tt_matrix_sweep(county_names, state_name, options, osm_filename, departures, use_daemon=True, workers=1,
+                         gtfs_paths=(), travel_options=None, departure_workers=DEFAULT_DEPARTURE_WORKERS,
+                         **job_options):
+    """Run find_tt_matrix for every county, option and departure against one network and write day profiles.
+
+    The network (or worker pool, or routing daemon) is shared by every job, and
+    up to departure_workers departures are routed at the same time in threads:
+    r5py calls into the JVM, which routes without holding the Python lock, so
+    the departures overlap instead of queueing. Each departure's files go to
+    county_data/<county>/departure_sweep_<epoch>/<departure>/, and the day
+    profile of every option (see departure_sweep.write_day_profile) next to them.
+    """
+    start_time = time.time()
+    osm_path = f"state_data/osm/{osm_filename}.osm.pbf"
+    transport_network, worker_pool = load_shared_network(osm_path, use_daemon, workers, gtfs_paths)
+    epoch_time = int(time.time())
+    jobs = [(county_name, option, departure) for county_name in county_names for option in options
+            for departure in departures]
+    print(f"=={len(jobs)} sweep jobs: {len(county_names)} counties x {len(options)} options x "
+          f"{len(departures)} departures. Elapsed time {time.time()-start_time} sec since code start.")
+
+    def run_job(county_name, option, departure):
+        return find_tt_matrix(
+            county_name, state_name, option, osm_filename, use_daemon=use_daemon,
+            transport_network=transport_network, worker_pool=worker_pool, gtfs_paths=gtfs_paths,
+            travel_options=dict(travel_options or {}, departure=departure),
+            output_dir=f"county_data/{county_name}/departure_sweep_{epoch_time}/"
+                       f"{departure_sweep.departure_folder_name(departure)}",
+            **job_options)
+
+    aggregated_paths = {}
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, departure_workers)) as executor:
+            futures = {executor.submit(run_job, *job): job for job in jobs}
+            for finished, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+                county_name, option, departure = futures[future]
+                aggregated_paths.setdefault((county_name, option), {})[departure] = future.result()['aggregated_path']
+                print(f"==Sweep job {finished}/{len(jobs)} finished: {county_name}, Option {option}, {departure}. "
+                      f"Elapsed time {time.time()-start_time} sec since code start.")
+    finally:
+        if worker_pool is not None:
+            worker_pool.shutdown()
+
+    summaries = {}
+    for (county_name, option), paths in sorted(aggregated_paths.items()):
+        folder = f"county_data/{county_name}/departure_sweep_{epoch_time}"
+        summaries[(county_name, option)] = departure_sweep.write_day_profile(
+            folder, option, paths, job_options.get('output_format', result_io.DEFAULT_OUTPUT_FORMAT))
+        print(f"\n==Day profile of {county_name}, Option {option} written to {folder}:")
+        print(summaries[(county_name, option)])
+    print(f"Departure sweep finished. Elapsed time {time.time()-start_time} sec since code start.")
+    return summaries
+
+def main(argv=None, prog=None):
     #arg parser
-    parser = argparse.ArgumentParser(description="A script that uses county name.")
-    parser.add_argument("--county_name", type=str, required=True, 
-                        help="Name of the county")
+    parser = argparse.ArgumentParser(prog=prog, description="Compute hospital travel times for counties and options.")
+    parser.add_argument("--county_name", type=str, nargs='+', required=True,
+                        help="Name of the county, several names, or 'all' for every prepared county in county_data/")
     parser.add_argument("--state_name", type=str, required=True, 
                         help="Name of the state")
-    parser.add_argument("--option", type=int, required=True, 
-                        help="Which analysis to run")
+    parser.add_argument("--option", type=int, nargs='+', required=True, choices=[1, 2, 3],
+                        help="Which analysis to run (several options run as a batch)")
     parser.add_argument("--osm", type=str, required=True, 
                         help="Which osm file to use (without extension)")
-    args = parser.parse_args()
-    # Convert county_name to have first letter capital and rest lowercase
-    county_name = args.county_name.capitalize()
+    parser.add_argument("--no_daemon", action="store_true",
+                        help="Always route in-process, even if a routing daemon is running")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of routing worker processes (each loads its own copy of the network)")
+    parser.add_argument("--chunk_size", type=int, default=None,
+                        help=f"Origins per routing chunk (default {sharded_routing.DEFAULT_CHUNK_SIZE} when --workers > 1)")
+    parser.add_argument("--k_nearest", type=int, default=3,
+                        help="Number of nearest hospitals to report per origin (at least 3)")
+    parser.add_argument("--stream_batch_size", type=int, default=None,
+                        help="Route and aggregate origins in batches of this size instead of holding the full matrix in memory")
+    parser.add_argument("--no_raw_output", action="store_true",
+                        help="Do not write the raw Option{X}_travel_times_* matrix, only the aggregated file")
+    parser.add_argument("--output_format", type=str, default=result_io.DEFAULT_OUTPUT_FORMAT, choices=result_io.OUTPUT_FORMATS,
+                        help="Format of the travel time and aggregated files (parquet is much smaller and faster to reload)")
+    parser.add_argument("--prune_candidates", action="store_true",
+                        help="Route each origin only to hospitals that can be among its k nearest")
+    parser.add_argument("--exact_check", action="store_true",
+                        help="With --prune_candidates, also route the full matrix and verify the k nearest match")
+    parser.add_argument("--deduplicate_origins", action="store_true",
+                        help="Route origins with identical coordinates once and copy the result to each of them")
+    parser.add_argument("--snap_tolerance_m", type=float, default=None,
+                        help="Also merge origins within this many metres (grid snapping; implies --deduplicate_origins)")
+    parser.add_argument("--pair_cache", type=str, nargs='?', const=pair_cache.DEFAULT_CACHE_PATH, default=None,
+                        help="Cache routed pairs in this SQLite file and route only new or moved origins/hospitals "
+                             f"on reruns (default path: {pair_cache.DEFAULT_CACHE_PATH})")
+    parser.add_argument("--results_store", type=str, nargs='?', const=results_store.DEFAULT_STORE_PATH, default=None,
+                        help="Also record the run in this SQLite results store, queried by file_evaluator.py and the "
+                             f"plotting scripts (default path: {results_store.DEFAULT_STORE_PATH})")
+    parser.add_argument("--pair_cache_max_pairs", type=int, default=pair_cache.DEFAULT_MAX_PAIRS,
+                        help="Evict the least recently used pairs beyond this many cached pairs")
+    parser.add_argument("--routing_backend", type=str, choices=ROUTING_BACKENDS, default='r5',
+                        help="Route with r5py (default) or with free-flow Dijkstra on the OSM drive graph (csr)")
+    parser.add_argument("--surfaces", type=str, default=None,
+                        help="Look travel times up in surfaces built by travel_time_surface.py instead of routing")
+    parser.add_argument("--mode", type=str, choices=list(TRANSPORT_MODE_PRESETS), default='car',
+                        help="Travel mode (default: car); transit and rail need GTFS feeds")
+    parser.add_argument("--gtfs", type=str, nargs='+', default=None,
+                        help="GTFS zip files (default for transit and rail: county_data/<county>/gtfs/*.zip)")
+    parser.add_argument("--departure", type=str, nargs='+', default=None,
+                        help="Departure time(s): weekday_am_peak, weekday_midday, weekday_pm_peak, weekday_evening, "
+                             "weekend, HH:MM, HH:MM-HH:MM/MINUTES or YYYY-MM-DDTHH:MM; several run as a departure "
+                             f"sweep (default: {DEFAULT_DEPARTURE.isoformat()})")
+    parser.add_argument("--service_date", type=datetime.date.fromisoformat, default=None,
+                        help="Weekday (YYYY-MM-DD) within the GTFS calendar that named and HH:MM departures fall on")
+    parser.add_argument("--departure_window", type=int, default=None,
+                        help="Start a trip every minute of this many minutes after each departure")
+    parser.add_argument("--percentiles", type=int, nargs='+', default=None,
+                        help="Travel time percentiles over the departure window (travel_time is the median, or the "
+                             "first percentile without 50)")
+    parser.add_argument("--departure_workers", type=int, default=DEFAULT_DEPARTURE_WORKERS,
+                        help=f"Departures routed at the same time in a sweep (default: {DEFAULT_DEPARTURE_WORKERS})")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+    instrumentation.configure_from_args(args)
+    if args.k_nearest < 3:
+        # second_min/third_min columns are read by post_process.py
+        parser.error("--k_nearest must be at least 3")
+    try:
+        departures = departure_sweep.parse_departures(args.departure, args.service_date) if args.departure else []
+    except ValueError as e:
+        parser.error(str(e))
+    transit_run = args.mode != 'car' or departures or args.departure_window or args.percentiles
+    if transit_run and (args.routing_backend == 'csr' or args.surfaces):
+        parser.error("--mode, --departure, --departure_window and --percentiles need the r5 routing backend")
+    if args.percentiles and len(args.percentiles) > 1 and (args.prune_candidates or args.pair_cache):
+        parser.error("Several --percentiles cannot be combined with --prune_candidates or --pair_cache")
+    if len(departures) > 1 and (args.pair_cache or args.results_store):
+        parser.error("A departure sweep writes its own files; --pair_cache and --results_store are not supported")
+    if [name.lower() for name in args.county_name] == ['all']:
+        county_names = list_prepared_counties()
+    else:
+        # Convert county_name to have first letter capital and rest lowercase
+        county_names = [name.capitalize() for name in args.county_name]
     state_name = args.state_name
+    gtfs_paths = args.gtfs
+    if gtfs_paths is None and args.mode in ('transit', 'rail'):
+        gtfs_paths = [path for county_name in county_names for path in county_gtfs_paths(county_name)]
+        if not gtfs_paths:
+            parser.error(f"--mode {args.mode} needs GTFS feeds: pass --gtfs or put them in county_data/<county>/gtfs/")
+    travel_options = {}
+    if args.mode != 'car':
+        travel_options['transport_modes'] = TRANSPORT_MODE_PRESETS[args.mode]
+    if args.departure_window:
+        travel_options['departure_time_window'] = datetime.timedelta(minutes=args.departure_window)
+    if args.percentiles:
+        travel_options['percentiles'] = tuple(args.percentiles)
+    if len(departures) == 1:
+        travel_options['departure'] = departures[0]
     # download_guilford_map_sp()
-    find_tt_matrix(county_name, state_name, args.option, args.osm)
+    run_options = dict(
+        use_daemon=not args.no_daemon, workers=args.workers, chunk_size=args.chunk_size, k_nearest=args.k_nearest,
+        stream_batch_size=args.stream_batch_size, write_raw=not args.no_raw_output,
+        output_format=args.output_format, prune_candidates=args.prune_candidates, exact_check=args.exact_check,
+        deduplicate_origins=args.deduplicate_origins, snap_tolerance_m=args.snap_tolerance_m,
+        pair_cache_path=args.pair_cache, pair_cache_max_pairs=args.pair_cache_max_pairs,
+        results_store_path=args.results_store, surfaces_path=args.surfaces, routing_backend=args.routing_backend,
+        gtfs_paths=tuple(gtfs_paths or ()),
+    )
+    if len(departures) > 1:
+        find_tt_matrix_sweep(county_names, state_name, args.option, args.osm, departures,
+                             travel_options=travel_options, departure_workers=args.departure_workers, **run_options)
+    elif len(county_names) == 1 and len(args.option) == 1:
+        find_tt_matrix(county_names[0], state_name, args.option[0], args.osm, travel_options=travel_options,
+                       **run_options)
+    else:
+        find_tt_matrix_batch(county_names, state_name, args.option, args.osm, travel_options=travel_options,
+                             **run_options)
+    instrumentation.print_summary()
 
+if __name__=='__main__':
+    main()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""One-to-all travel time surfaces from each hospital, memory-mapped for lookups without r5.
+
+Hospitals are few and origins are many, so the travel times from every
+hospital to a dense set of network points are routed once per network and
+reused for any origin set (Option 1-3 files, a new zone system, any county
+inside the surface). With the csr backend the points are the drive graph's own
+snappable nodes inside the study area (see graph_routing), so a lookup snaps
+an origin exactly as routing it would. r5py does not expose its street
+vertices, so r5 surfaces use a regular grid of spacing_m metres (EPSG:5070)
+instead; grid points that no hospital reaches (off the road network) are
+dropped. A surface directory holds
+
+    travel_times.npy   float32 [points x hospitals], opened with mmap_mode='r'
+    vertices.npy       projected x/y of the kept points
+    vertex_tree.pkl    scipy cKDTree over vertices.npy
+    hospitals.csv      ID, latitude, longitude of the hospital columns
+    surface.json       network key, kind of points, snap limit and sizes
+
+An origin gets the travel times of its nearest point: one KD-tree query and
+one array gather. Origins farther than max_snap_m from any kept point get no
+travel time, as if the network could not reach them: by default spacing_m /
+sqrt(2) for a grid (the farthest a point of a kept grid cell can be from it)
+and graph_routing.MAX_SNAP_M for graph nodes, the limit of direct csr routing.
+Every lookup prints its snap distances and a warning when origins are beyond
+the limit, and find_tt_matrix writes each origin's distance to its surface
+point in the surface_snap_m column of the aggregated file.
+
+    python src/travel_time_surface.py --osm NC --county_name Bladen Robeson --routing_backend csr
+"""
+import argparse
+import json
+import os
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+import pyproj
+import scipy.spatial
+
+import graph_routing
+import input_loader
+import pair_cache
+import sharded_routing
+
+DEFAULT_SPACING_M = 250
+DEFAULT_BATCH_SIZE = 50000
+PROJECTED_CRS = 'EPSG:5070'
+
+
+def default_surface_path(osm_filename):
+    return f"state_data/surfaces/{osm_filename}"
+
+
+def _coordinate_keys(points):
+    """(lon, lat) of each point in micro-degrees, as keyed by pair_cache."""
+    longitude = np.round(points.geometry.x.to_numpy() * pair_cache.COORDINATE_SCALE).astype(np.int64)
+    latitude = np.round(points.geometry.y.to_numpy() * pair_cache.COORDINATE_SCALE).astype(np.int64)
+    return list(zip(longitude.tolist(), latitude.tolist()))
+
+
+def grid_points(bounds, spacing_m=DEFAULT_SPACING_M):
+    """Regular grid over (min_lon, min_lat, max_lon, max_lat) as a point GeoDataFrame with 'id' and projected x/y."""
+    import geopandas
+    to_projected = pyproj.Transformer.from_crs(input_loader.POINT_CRS, PROJECTED_CRS, always_xy=True)
+    min_x, min_y, max_x, max_y = to_projected.transform_bounds(*bounds)
+    xs = np.arange(min_x, max_x + spacing_m, spacing_m)
+    ys = np.arange(min_y, max_y + spacing_m, spacing_m)
+    x, y = (values.ravel() for values in np.meshgrid(xs, ys))
+    longitude, latitude = to_projected.transform(x, y, direction='INVERSE')
+    return geopandas.GeoDataFrame({'id': np.arange(len(x)), 'x': x, 'y': y},
+                                  geometry=geopandas.points_from_xy(longitude, latitude),
+                                  crs=input_loader.POINT_CRS)
+
+
+def graph_points(graph, bounds):
+    """Snappable nodes of a DriveGraph inside (min_lon, min_lat, max_lon, max_lat), as grid_points returns them."""
+    import geopandas
+    min_lon, min_lat, max_lon, max_lat = bounds
+    longitude = graph.longitude[graph.snap_nodes]
+    latitude = graph.latitude[graph.snap_nodes]
+    inside = (longitude >= min_lon) & (longitude <= max_lon) & (latitude >= min_lat) & (latitude <= max_lat)
+    longitude, latitude = longitude[inside], latitude[inside]
+    to_projected = pyproj.Transformer.from_crs(input_loader.POINT_CRS, PROJECTED_CRS, always_xy=True)
+    x, y = to_projected.transform(longitude, latitude)
+    return geopandas.GeoDataFrame({'id': np.arange(len(x)), 'x': x, 'y': y},
+                                  geometry=geopandas.points_from_xy(longitude, latitude),
+                                  crs=input_loader.POINT_CRS)
+
+
+def build_surfaces(path, route, hospitals, bounds, network_key, spacing_m=DEFAULT_SPACING_M,
+                   batch_size=DEFAULT_BATCH_SIZE, points=None, max_snap_m=None):
+    """Route every hospital to the surface points with route(hospitals, points) and write a surface directory.
+
+    points are the graph_points of the csr backend; without them a grid of
+    spacing_m over bounds is routed. max_snap_m defaults to spacing_m / sqrt(2)
+    for a grid and graph_routing.MAX_SNAP_M for graph nodes.
+    """
+    start_time = time.time()
+    os.makedirs(path, exist_ok=True)
+    if points is None:
+        kind = 'grid'
+        grid = grid_points(bounds, spacing_m)
+        max_snap_m = max_snap_m or spacing_m / np.sqrt(2)
+        print(f"=={len(grid)} grid points at {spacing_m} m for {len(hospitals)} hospitals. Elapsed time {time.time()-start_time} sec.")
+    else:
+        kind, grid, spacing_m = 'graph_nodes', points, None
+        max_snap_m = max_snap_m or graph_routing.MAX_SNAP_M
+        print(f"=={len(grid)} drive graph nodes for {len(hospitals)} hospitals. Elapsed time {time.time()-start_time} sec.")
+    hospital_positions = pd.Index(hospitals['id'])
+    full_path = os.path.join(path, 'travel_times.full.npy')
+    full = np.lib.format.open_memmap(full_path, mode='w+', dtype=np.float32, shape=(len(grid), len(hospitals)))
+    full[:] = np.nan
+    batches = sharded_routing.spatial_chunks(grid, batch_size)
+    for batch_number, batch in enumerate(batches, start=1):
+        travel_times = route(hospitals, batch)
+        rows = travel_times['to_id'].to_numpy(dtype=np.int64)
+        columns = hospital_positions.get_indexer(travel_times['from_id'])
+        full[rows, columns] = travel_times['travel_time'].to_numpy(dtype=np.float32)
+        print(f"==Batch {batch_number}/{len(batches)} routed. Elapsed time {time.time()-start_time} sec.")
+
+    reachable = np.flatnonzero(~np.isnan(full).all(axis=1))
+    travel_times = np.lib.format.open_memmap(os.path.join(path, 'travel_times.npy'), mode='w+',
+                                             dtype=np.float32, shape=(len(reachable), len(hospitals)))
+    for start in range(0, len(reachable), batch_size):
+        travel_times[start:start + batch_size] = full[reachable[start:start + batch_size]]
+    travel_times.flush()
+    del full, travel_times
+    os.remove(full_path)
+
+    vertices = np.column_stack([grid['x'].to_numpy()[reachable], grid['y'].to_numpy()[reachable]])
+    np.save(os.path.join(path, 'vertices.npy'), vertices)
+    with open(os.path.join(path, 'vertex_tree.pkl'), 'wb') as f:
+        pickle.dump(scipy.spatial.cKDTree(vertices), f)
+    pd.DataFrame({'ID': hospitals['id'].to_numpy(), 'latitude': hospitals.geometry.y.to_numpy(),
+                  'longitude': hospitals.geometry.x.to_numpy()}).to_csv(
+        os.path.join(path, 'hospitals.csv'), index=False)
+    with open(os.path.join(path, 'surface.json'), 'w') as f:
+        json.dump({'network_key': network_key, 'points': kind, 'spacing_m': spacing_m,
+                   'max_snap_m': float(max_snap_m), 'bounds': list(bounds), 'num_vertices': len(reachable),
+                   'num_points': len(grid), 'num_hospitals': len(hospitals)}, f, indent=2)
+    print(f"==Surfaces written to {path}: {len(reachable)} of {len(grid)} points reachable. "
+          f"Elapsed time {time.time()-start_time} sec.")
+
+
+class TravelTimeSurfaces:
+    """A surface directory opened for lookups; travel_times stays on disk (memory-mapped)."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'surface.json')) as f:
+            self.metadata = json.load(f)
+        self.travel_times = np.load(os.path.join(path, 'travel_times.npy'), mmap_mode='r')
+        with open(os.path.join(path, 'vertex_tree.pkl'), 'rb') as f:
+            self.tree = pickle.load(f)
+        hospitals = input_loader.read_points_csv(os.path.join(path, 'hospitals.csv'), 'ID')
+        self.hospital_columns = {key: column for column, key in enumerate(_coordinate_keys(hospitals))}
+        self.max_snap_m = self.metadata.get('max_snap_m') or self.metadata['spacing_m'] / np.sqrt(2)
+        self._to_projected = pyproj.Transformer.from_crs(input_loader.POINT_CRS, PROJECTED_CRS, always_xy=True)
+
+    def check_network(self, network_key):
+        if network_key != self.metadata['network_key']:
+            raise ValueError(f"Surfaces in {self.path} were built for a different network or routing setup; "
+                             "rebuild them with travel_time_surface.py")
+
+    def snap(self, origins):
+        """Nearest surface point of each origin and the distance to it in metres."""
+        x, y = self._to_projected.transform(origins.geometry.x.to_numpy(), origins.geometry.y.to_numpy())
+        distances, vertices = self.tree.query(np.column_stack([x, y]))
+        return vertices, distances
+
+    def route(self, hospitals, origins):
+        """Travel times from hospitals to origins, same long format as a routed matrix (from_id, to_id, travel_time).
+
+        Hospitals are matched to surface columns by coordinates; a hospital without
+        a surface raises KeyError. The snap distances of the origins are printed.
+        """
+        keys = _coordinate_keys(hospitals)
+        missing = [hospital_id for hospital_id, key in zip(hospitals['id'], keys) if key not in self.hospital_columns]
+        if missing:
+            raise KeyError(f"Hospitals {missing} have no surface in {self.path}; rebuild the surfaces with them")
+        columns = np.array([self.hospital_columns[key] for key in keys], dtype=np.int64)
+
+        vertices, distances = self.snap(origins)
+        times = self.travel_times[vertices][:, columns].astype(float)
+        too_far = distances > self.max_snap_m
+        times[too_far] = np.nan
+        if len(origins):
+            print(f"==Surface lookup of {len(origins)} origins: snap distance median {np.median(distances):.0f} m, "
+                  f"max {distances.max():.0f} m.")
+        if too_far.any():
+            print(f"Warning: {too_far.sum()} of {len(origins)} origins are farther than {self.max_snap_m:.0f} m "
+                  f"from every surface point and get no travel time.")
+        return pd.DataFrame({
+            'from_id': np.repeat(hospitals['id'].to_numpy(), len(origins)),
+            'to_id': np.tile(origins['id'].to_numpy(), len(hospitals)),
+            'travel_time': times.T.ravel(),
+        })
+
+
+def county_bounds(county_names, padding_m):
+    """Bounds (lon/lat) of the origin and hospital files of the counties, padded by padding_m."""
+    frames = []
+    for county_name in county_names:
+        for file_name in ['Option1_county_centroids.csv', 'Option2_county_centroids.csv',
+                          'Option3_residential_parcel_centroids.csv', 'hospitals_within_buffer.csv']:
+            file_path = f"county_data/{county_name}/{file_name}"
+            if os.path.exists(file_path):
+                frames.append(input_loader.read_csv(file_path, usecols=['latitude', 'longitude']))
+    points = pd.concat(frames, ignore_index=True)
+    to_projected = pyproj.Transformer.from_crs(input_loader.POINT_CRS, PROJECTED_CRS, always_xy=True)
+    x, y = to_projected.transform(points['longitude'].to_numpy(), points['latitude'].to_numpy())
+    return to_projected.transform_bounds(x.min() - padding_m, y.min() - padding_m,
+                                         x.max() + padding_m, y.max() + padding_m, direction='INVERSE')
+
+
+def county_hospitals(county_names):
+    """Union of the hospitals_within_buffer.csv files of the counties, one row per ID."""
+    hospitals = [input_loader.read_points_csv(f"county_data/{county_name}/hospitals_within_buffer.csv", 'ID')
+                 for county_name in county_names]
+    return pd.concat(hospitals, ignore_index=True).drop_duplicates('id', ignore_index=True)
+
+
+if __name__ == '__main__':
+    import travel_time_analysis
+
+    parser = argparse.ArgumentParser(description="Precompute hospital travel time surfaces for one or more counties.")
+    parser.add_argument("--county_name", type=str, nargs='+', required=True,
+                        help="Counties whose hospitals and area the surfaces cover (prepared with geopandas_analysis.py)")
+    parser.add_argument("--osm", type=str, required=True, help="Name of the OSM file (without .osm.pbf)")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Surface directory (default: state_data/surfaces/<osm>)")
+    parser.add_argument("--spacing", type=float, default=DEFAULT_SPACING_M,
+                        help=f"Grid spacing in metres of r5 surfaces (default: {DEFAULT_SPACING_M})")
+    parser.add_argument("--max_snap", type=float, default=None,
+                        help="Metres beyond which an origin gets no travel time (default: spacing/sqrt(2) for r5, "
+                             f"{graph_routing.MAX_SNAP_M} for the csr graph nodes)")
+    parser.add_argument("--padding", type=float, default=5000,
+                        help="Metres added around the counties' origins and hospitals (default: 5000)")
+    parser.add_argument("--batch_size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"Surface points routed per batch (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument("--workers", type=int, default=1, help="Number of routing worker processes")
+    parser.add_argument("--no_daemon", action="store_true", help="Do not use a running routing daemon")
+    parser.add_argument("--routing_backend", type=str, choices=travel_time_analysis.ROUTING_BACKENDS, default='r5',
+                        help="Route with r5py (default) or on the OSM drive graph (csr)")
+    args = parser.parse_args()
+
+    county_names = [name.capitalize() for name in args.county_name]
+    osm_path = f"state_data/osm/{args.osm}.osm.pbf"
+    key = travel_time_analysis.routing_key(osm_path, args.routing_backend)
+    bounds = county_bounds(county_names, args.padding)
+    points = None
+    if args.routing_backend == 'csr':
+        points = graph_points(graph_routing.load_drive_graph(osm_path), bounds)
+    with travel_time_analysis.routing_session(osm_path, use_daemon=not args.no_daemon, workers=args.workers,
+                                              backend=args.routing_backend) as route:
+        build_surfaces(args.output or default_surface_path(args.osm), route, county_hospitals(county_names),
+                       bounds, key, spacing_m=args.spacing, batch_size=args.batch_size, points=points,
+                       max_snap_m=args.max_snap)
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""Mapbox Vector Tiles (MVT 2.1) for point and polygon layers, written to MBTiles or a tile folder.
+
+Coordinates are Web Mercator "world" coordinates in [0, 1) (see lonlat_to_world);
+a tile (z, x, y) covers [x, x + 1) / 2^z by [y, y + 1) / 2^z and its features use
+integer coordinates in [0, EXTENT). Layers are tiled independently, into
+{(z, x, y): encoded layer}, and merge_layers concatenates the layers of a tile
+(repeated protobuf fields concatenate).
+
+Zoom-dependent simplification:
+  - point_layer_tiles keeps every point from detail_zoom on; below it, points
+    falling into the same cell of cell_size tile units are merged into one
+    feature at the cell centre, with the mean of each attribute and a count.
+  - polygon_layer_tiles simplifies the polygons by simplify_units tile units at
+    every zoom (about one screen pixel), then clips them to each tile plus a
+    buffer and snaps them to the integer tile grid.
+
+Attribute quantization is done by the caller (rounded values also make the
+per-tile value tables small).
+"""
+import gzip
+import math
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import shapely
+
+EXTENT = 4096
+BUFFER_UNITS = 64  # tile units of neighbouring tiles included in each tile (avoids seams)
+GEOMETRY_POINT = 1
+GEOMETRY_POLYGON = 3
+
+
+# --- Protobuf encoding ---------------------------------------------------------------------------
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _bytes_field(number, data):
+    return _varint((number << 3) | 2) + _varint(len(data)) + data
+
+
+def _packed(values):
+    return b''.join(_varint(value) for value in values)
+
+
+def _encode_value(value):
+    """Tile Value message of a string, integer or float attribute."""
+    if isinstance(value, str):
+        return _bytes_field(1, value.encode())
+    if float(value).is_integer():
+        return _varint(6 << 3) + _varint(_zigzag(int(value)))
+    return _varint((3 << 3) | 1) + np.float64(value).astype('<f8').tobytes()
+
+
+def encode_layer(name, features):
+    """Encode one Layer message; features are (geometry type, geometry commands, {attribute: value})."""
+    keys, values = {}, {}
+    encoded = []
+    for geometry_type, commands, attributes in features:
+        tags = []
+        for key, value in attributes.items():
+            if value is None or value is pd.NA or (isinstance(value, float) and math.isnan(value)):
+                continue
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault(value, len(values)))
+        feature = _varint(3 << 3) + _varint(geometry_type) + _bytes_field(4, _packed(commands))
+        if tags:
+            feature = _bytes_field(2, _packed(tags)) + feature
+        encoded.append(_bytes_field(2, feature))
+    layer = (_varint(15 << 3) + _varint(2) + _bytes_field(1, name.encode()) + b''.join(encoded)
+             + b''.join(_bytes_field(3, key.encode()) for key in keys)
+             + b''.join(_bytes_field(4, _encode_value(value)) for value in values)
+             + _varint(5 << 3) + _varint(EXTENT))
+    return _bytes_field(3, layer)
+
+
+def merge_layers(*layer_tiles):
+    """Tiles of several layers ({(z, x, y): encoded layer}) merged into {(z, x, y): tile bytes}."""
+    tiles = {}
+    for layer in layer_tiles:
+        for key, data in layer.items():
+            tiles[key] = tiles.get(key, b'') + data
+    return tiles
+
+
+# --- Coordinates ---------------------------------------------------------------------------------
+
+def lonlat_to_world(longitude, latitude):
+    """Web Mercator world coordinates in [0, 1) of lon/lat degrees (arrays)."""
+    latitude = np.clip(np.asarray(latitude, dtype=float), -85.0511, 85.0511)
+    x = (np.asarray(longitude, dtype=float) + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(np.radians(latitude)) + 1.0 / np.cos(np.radians(latitude))) / np.pi) / 2.0
+    return x, y
+
+
+def geometries_to_world(geometries):
+    """Shapely geometries in lon/lat projected to world coordinates."""
+    return shapely.transform(geometries, lambda coordinates: np.column_stack(
+        lonlat_to_world(coordinates[:, 0], coordinates[:, 1])))
+
+
+# --- Points --------------------------------------------------------------------------------------
+
+def point_layer_tiles(name, x, y, attributes, zoom, detail_zoom, cell_size=32):
+    """Encoded tiles of a point layer at one zoom.
+
+    x, y are world coordinates and attributes a DataFrame of quantized numeric
+    columns (one row per point). Below detail_zoom points are merged per cell,
+    with mean attributes (rounded back to integers for integer columns) and a
+    'count' column.
+    """
+    scale = 2 ** zoom
+    tile_x = np.floor(x * scale).astype(np.int64)
+    tile_y = np.floor(y * scale).astype(np.int64)
+    local_x = np.minimum(((x * scale - tile_x) * EXTENT).astype(np.int64), EXTENT - 1)
+    local_y = np.minimum(((y * scale - tile_y) * EXTENT).astype(np.int64), EXTENT - 1)
+    points = attributes.reset_index(drop=True).assign(_tx=tile_x, _ty=tile_y, _lx=local_x, _ly=local_y)
+    if zoom < detail_zoom:
+        points['_lx'] = points['_lx'] // cell_size * cell_size + cell_size // 2
+        points['_ly'] = points['_ly'] // cell_size * cell_size + cell_size // 2
+        grouped = points.groupby(['_tx', '_ty', '_lx', '_ly'], sort=False)
+        means = grouped[list(attributes.columns)].mean()
+        for column in attributes.columns:
+            if pd.api.types.is_integer_dtype(attributes[column]):
+                means[column] = means[column].round(0).astype('Int64')
+        points = means.join(grouped.size().rename('count')).reset_index()
+    tiles = {}
+    columns = [column for column in points.columns if not column.startswith('_')]
+    for (tx, ty), tile_points in points.groupby(['_tx', '_ty'], sort=False):
+        records = tile_points[columns].to_dict('records')
+        features = [(GEOMETRY_POINT, (9, _zigzag(int(px)), _zigzag(int(py))), record)
+                    for px, py, record in zip(tile_points['_lx'], tile_points['_ly'], records)]
+        tiles[(zoom, int(tx), int(ty))] = encode_layer(name, features)
+    return tiles
+
+
+# --- Polygons ------------------------------------------------------------------------------------
+
+def _polygon_commands(geometry):
+    """MVT commands of a (multi)polygon in integer tile coordinates, exterior rings with positive area."""
+    commands = []
+    cursor_x = cursor_y = 0
+    polygons = geometry.geoms if geometry.geom_type == 'MultiPolygon' else [geometry]
+    for polygon in polygons:
+        polygon = shapely.orient_polygons(polygon, exterior_cw=False)
+        for ring in [polygon.exterior, *polygon.interiors]:
+            coordinates = np.asarray(ring.coords, dtype=np.int64)[:-1]
+            if len(coordinates) < 3:
+                continue
+            deltas = np.diff(coordinates, axis=0, prepend=[[cursor_x, cursor_y]])
+            cursor_x, cursor_y = (int(value) for value in coordinates[-1])
+            zigzags = [_zigzag(int(value)) for value in deltas.ravel()]
+            commands += [(1 << 3) | 1, *zigzags[:2], ((len(coordinates) - 1) << 3) | 2, *zigzags[2:], (1 << 3) | 7]
+    return commands
+
+
+def polygon_layer_tiles(name, geometries, attributes, zoom, simplify_units=8):
+    """Encoded tiles of a polygon layer at one zoom; geometries are in world coordinates."""
+    scale = 2 ** zoom
+    simplified = shapely.simplify(geometries, simplify_units / (EXTENT * scale), preserve_topology=True)
+    tree = shapely.STRtree(simplified)
+    records = attributes.reset_index(drop=True).to_dict('records')
+    min_x, min_y, max_x, max_y = shapely.total_bounds(simplified)
+    buffer = BUFFER_UNITS / EXTENT
+    tiles = {}
+    for tx in range(int(min_x * scale), int(max_x * scale) + 1):
+        for ty in range(int(min_y * scale), int(max_y * scale) + 1):
+            box = (tx - buffer, ty - buffer, tx + 1 + buffer, ty + 1 + buffer)
+            candidates = tree.query(shapely.box(*(value / scale for value in box)))
+            if len(candidates) == 0:
+                continue
+            local = shapely.transform(simplified[candidates], lambda c: (c * scale - [tx, ty]) * EXTENT)
+            clipped = shapely.set_precision(shapely.clip_by_rect(local, *(
+                (value - offset) * EXTENT for value, offset in zip(box, (tx, ty, tx, ty)))), 1.0)
+            features = []
+            for position, geometry in zip(candidates, clipped):
+                if geometry.is_empty:
+                    continue
+                if geometry.geom_type == 'GeometryCollection':
+                    geometry = shapely.MultiPolygon([part for part in geometry.geoms if part.geom_type == 'Polygon'])
+                if geometry.geom_type not in ('Polygon', 'MultiPolygon') or geometry.is_empty:
+                    continue
+                commands = _polygon_commands(geometry)
+                if commands:
+                    features.append((GEOMETRY_POLYGON, commands, records[position]))
+            if features:
+                tiles[(zoom, tx, ty)] = encode_layer(name, features)
+    return tiles
+
+
+# --- Output --------------------------------------------------------------------------------------
+
+def write_mbtiles(path, tiles, metadata):
+    """Write {(z, x, y): tile bytes} as gzipped tiles to a new MBTiles 1.3 file with the given metadata."""
+    if os.path.exists(path):
+        os.remove(path)
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute("CREATE TABLE metadata (name TEXT, value TEXT)")
+        connection.execute("CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, "
+                           "tile_data BLOB)")
+        connection.execute("CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)")
+        connection.executemany("INSERT INTO metadata VALUES (?, ?)", [(key, str(value)) for key, value in metadata.items()])
+        # MBTiles rows count from the south (TMS)
+        connection.executemany("INSERT INTO tiles VALUES (?, ?, ?, ?)", (
+            (z, x, 2 ** z - 1 - y, gzip.compress(data, mtime=0)) for (z, x, y), data in sorted(tiles.items())))
+    connection.close()
+
+
+def write_tile_folder(folder, tiles):
+    """Write {(z, x, y): tile bytes} uncompressed to folder/{z}/{x}/{y}.pbf."""
+    for (z, x, y), data in tiles.items():
+        os.makedirs(os.path.join(folder, str(z), str(x)), exist_ok=True)
+        with open(os.path.join(folder, str(z), str(x), f'{y}.pbf'), 'wb') as f:
+            f.write(data)
+
+
+def quantize(frame, decimals):
+    """Round the columns of frame to their number of decimals ({column: decimals}); 0 gives integers."""
+    quantized = pd.DataFrame(index=frame.index)
+    for column, places in decimals.items():
+        values = pd.to_numeric(frame[column], errors='coerce').round(places)
+        quantized[column] = values.astype('Int64') if places == 0 else values
+    return quantized
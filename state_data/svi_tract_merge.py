@@ -29,9 +29,11 @@ All outputs contain polygon geometries + all CSV attributes merged together.
 ================================================================================
 """
 
+import argparse
+import os
+
 import geopandas as gpd
 import pandas as pd
-import os
 
 # ============================================================================
 # CONFIGURATION SECTION - UPDATE THESE PATHS FOR YOUR DATA
@@ -285,19 +287,35 @@ def merge_shapefile_with_csv(shapefile_path, csv_path, output_dir,
 # EXECUTE THE SCRIPT
 # ============================================================================
 
-if __name__ == "__main__":
+def main(argv=None, prog=None):
+    # Command-line values override the configuration section above
+    parser = argparse.ArgumentParser(prog=prog, description="Merge a census tract shapefile with SVI CSV data.")
+    parser.add_argument("--shapefile", type=str, default=SHAPEFILE_PATH,
+                        help=f"Census tract shapefile (default: {SHAPEFILE_PATH})")
+    parser.add_argument("--csv", type=str, default=CSV_PATH,
+                        help=f"SVI CSV file (default: {CSV_PATH})")
+    parser.add_argument("--output_dir", type=str, default=OUTPUT_DIR,
+                        help=f"Output folder (default: {OUTPUT_DIR})")
+    parser.add_argument("--output_filename", type=str, default=OUTPUT_FILENAME,
+                        help=f"Output file name without extension (default: {OUTPUT_FILENAME})")
+    parser.add_argument("--shp_id_col", type=str, default=SHAPEFILE_ID_COLUMN,
+                        help=f"Identifier column of the shapefile (default: {SHAPEFILE_ID_COLUMN})")
+    parser.add_argument("--csv_id_col", type=str, default=CSV_ID_COLUMN,
+                        help=f"Identifier column of the CSV (default: {CSV_ID_COLUMN})")
+    args = parser.parse_args(argv)
+
     print("\n" + "="*80)
     print("STARTING MERGE PROCESS...")
     print("="*80)
     
     # Run the merge function
     result = merge_shapefile_with_csv(
-        shapefile_path=SHAPEFILE_PATH,
-        csv_path=CSV_PATH,
-        output_dir=OUTPUT_DIR,
-        output_filename=OUTPUT_FILENAME,
-        shp_id_col=SHAPEFILE_ID_COLUMN,
-        csv_id_col=CSV_ID_COLUMN
+        shapefile_path=args.shapefile,
+        csv_path=args.csv,
+        output_dir=args.output_dir,
+        output_filename=args.output_filename,
+        shp_id_col=args.shp_id_col,
+        csv_id_col=args.csv_id_col
     )
     
     if result is not None:
@@ -305,3 +323,7 @@ if __name__ == "__main__":
         print(f"📊 Final dataset: {len(result):,} tracts with {len(result.columns)} attributes")
     else:
         print("\n❌ MERGE FAILED - Please check the error messages above")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import file_evaluator
+
+
+def pick_top_x_and_stats(row):
+    """The row-wise function create_aggregated_file applied before top_x_statistics."""
+    min_travel_times = row['Option3_aggregated_min_travel_time_list']
+    x = row['E_NOVEH']
+    sorted_min_travel_times = sorted(min_travel_times, reverse=True)
+    if len(sorted_min_travel_times) >= x and x > 0:
+        top_x_values = sorted_min_travel_times[:x]
+        min_value = np.min(top_x_values)
+        max_value = np.max(top_x_values)
+        return pd.Series({
+            'top_x_values': top_x_values,
+            'min_top_x': min_value,
+            'max_top_x': max_value,
+            'avg_top_x': np.mean(top_x_values),
+            'median_top_x': np.median(top_x_values),
+            'range_top_x': max_value - min_value,
+            'std_dev_top_x': np.std(top_x_values),
+            'num_parcels': len(sorted_min_travel_times)
+        })
+    return pd.Series({
+        'top_x_values': [],
+        'min_top_x': np.nan,
+        'max_top_x': np.nan,
+        'avg_top_x': np.nan,
+        'median_top_x': np.nan,
+        'range_top_x': np.nan,
+        'std_dev_top_x': np.nan,
+        'num_parcels': len(sorted_min_travel_times)
+    })
+
+
+def tracts_and_parcels(seed, num_tracts=30, num_parcels=600):
+    """Tracts with E_NOVEH from 0 to more than their parcel count; parcel times with many ties, in random order."""
+    rng = np.random.default_rng(seed)
+    tract_ids = rng.permutation(np.arange(1, num_tracts + 1) * 7)
+    parcel_tract_ids = rng.choice(tract_ids, num_parcels, p=rng.dirichlet(np.ones(num_tracts)))
+    # Every tract has a parcel (the row-wise version raised on a tract without any)
+    parcel_tract_ids[5:5 + num_tracts] = tract_ids
+    times = rng.integers(5, 25, num_parcels).astype(float)
+    counts = pd.Series(parcel_tract_ids).value_counts().reindex(tract_ids, fill_value=0).to_numpy()
+    x = np.where(rng.random(num_tracts) < 0.3, counts + rng.integers(1, 4, num_tracts),
+                 rng.integers(0, counts + 1))
+    # Parcels of a tract not in the output are ignored
+    parcel_tract_ids[:5] = 9999
+    return tract_ids, parcel_tract_ids, times, x
+
+
+def expected_top_x(tract_ids, parcel_tract_ids, times, x):
+    grouped = pd.DataFrame({'poly_idx': parcel_tract_ids, 'min_travel_time': times}).groupby(
+        'poly_idx')['min_travel_time'].apply(list)
+    rows = pd.DataFrame({'Option3_aggregated_min_travel_time_list': grouped.reindex(tract_ids).tolist(),
+                         'E_NOVEH': x})
+    return rows.apply(pick_top_x_and_stats, axis=1)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_row_wise_version(seed):
+    tract_ids, parcel_tract_ids, times, x = tracts_and_parcels(seed)
+    expected = expected_top_x(tract_ids, parcel_tract_ids, times, x)
+    actual = file_evaluator.top_x_statistics(tract_ids, parcel_tract_ids, times, x)
+    assert list(actual.columns) == file_evaluator.TOP_X_COLUMNS
+    assert actual['top_x_values'].tolist() == expected['top_x_values'].tolist()
+    for column in file_evaluator.TOP_X_COLUMNS[1:]:
+        np.testing.assert_allclose(actual[column].astype(float), expected[column].astype(float),
+                                   equal_nan=True, err_msg=column)
+    # The cases the data is built to cover
+    assert (x == 0).any() and (actual['num_parcels'] < x).any() and actual['top_x_values'].map(len).gt(1).any()
+
+
+def test_ties_and_short_tracts():
+    tract_ids = np.array([3, 1, 2])
+    parcel_tract_ids = np.array([1, 3, 1, 1, 3, 1, 2])
+    times = np.array([10.0, 4.0, 30.0, 10.0, 4.0, 30.0, 8.0])
+    actual = file_evaluator.top_x_statistics(tract_ids, parcel_tract_ids, times, np.array([2, 3, 2]))
+    assert actual['top_x_values'].tolist() == [[4.0, 4.0], [30.0, 30.0, 10.0], []]
+    assert actual['num_parcels'].tolist() == [2, 4, 1]
+    np.testing.assert_allclose(actual['median_top_x'], [4.0, 30.0, np.nan])
+    np.testing.assert_allclose(actual['range_top_x'], [0.0, 20.0, np.nan])
+    np.testing.assert_allclose(actual['std_dev_top_x'], [0.0, np.std([30.0, 30.0, 10.0]), np.nan])
+
+
+def test_tract_without_parcels():
+    actual = file_evaluator.top_x_statistics(np.array([1, 2]), np.array([1, 1]), np.array([5.0, 6.0]),
+                                             np.array([1, 0]))
+    assert actual['top_x_values'].tolist() == [[6.0], []]
+    assert actual['num_parcels'].tolist() == [2, 0]
+    assert np.isnan(actual.loc[1, 'avg_top_x'])
+
+
+def test_grouped_lists_keep_the_parcel_order():
+    _, parcel_tract_ids, times, _ = tracts_and_parcels(0)
+    tract_ids = np.unique(parcel_tract_ids)
+    _, sorted_times, counts, _ = file_evaluator.group_parcels_by_tract(tract_ids, parcel_tract_ids, times)
+    expected = pd.DataFrame({'poly_idx': parcel_tract_ids, 'min_travel_time': times}).groupby(
+        'poly_idx')['min_travel_time'].apply(list)
+    assert [chunk.tolist() for chunk in np.split(sorted_times, np.cumsum(counts)[:-1])] == expected.tolist()
@@ -0,0 +1,61 @@
+import threading
+
+import numpy as np
+import pytest
+
+import instrumentation
+
+pytestmark = pytest.mark.skipif(not instrumentation._peak_resettable[0],
+                                reason="needs a resettable high-water mark (/proc/self/clear_refs)")
+ALLOCATION_MB = 200
+
+
+def allocate_and_free():
+    block = np.ones(ALLOCATION_MB * 2**20 // 8)
+    del block
+
+
+def peaks():
+    return {record['span']: record['peak_rss_delta_mb'] for record in instrumentation.finished_spans()}
+
+
+@pytest.fixture(autouse=True)
+def fresh_spans(capsys):
+    instrumentation._finished_spans.clear()
+    yield
+    instrumentation._finished_spans.clear()
+
+
+def test_outer_span_keeps_the_peak_of_an_inner_span():
+    with instrumentation.span('outer'):
+        with instrumentation.span('inner'):
+            allocate_and_free()
+        with instrumentation.span('after'):
+            pass
+    assert peaks()['outer/inner'] >= 0.9 * ALLOCATION_MB
+    assert peaks()['outer'] >= 0.9 * ALLOCATION_MB
+    assert peaks()['outer/after'] < 0.5 * ALLOCATION_MB
+
+
+def test_span_starting_in_another_thread_keeps_the_peak_of_an_open_span():
+    freed, other_started = threading.Event(), threading.Event()
+
+    def allocating():
+        with instrumentation.span('allocating'):
+            allocate_and_free()
+            freed.set()
+            other_started.wait()
+
+    def other():
+        freed.wait()
+        # Starting a span restarts the process-wide high-water mark
+        with instrumentation.span('other'):
+            other_started.set()
+
+    threads = [threading.Thread(target=allocating), threading.Thread(target=other)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peaks()['allocating'] >= 0.9 * ALLOCATION_MB
+    assert peaks()['other'] < 0.5 * ALLOCATION_MB
@@ -0,0 +1,73 @@
+import sqlite3
+
+import geopandas
+import numpy as np
+import pandas as pd
+
+import pair_cache
+
+
+def points(ids, longitude, latitude):
+    return geopandas.GeoDataFrame({'id': ids}, geometry=geopandas.points_from_xy(longitude, latitude),
+                                  crs='EPSG:4326')
+
+
+def matrix(hospitals, origins, seed):
+    rng = np.random.default_rng(seed)
+    times = rng.uniform(5, 90, (len(hospitals), len(origins))).round()
+    times[rng.random(times.shape) < 0.2] = np.nan
+    return pd.DataFrame({'from_id': np.repeat(hospitals['id'].to_numpy(), len(origins)),
+                         'to_id': np.tile(origins['id'].to_numpy(), len(hospitals)),
+                         'travel_time': times.ravel()})
+
+
+def table_count(path):
+    connection = sqlite3.connect(path)
+    count = connection.execute("SELECT COUNT(*) FROM pairs").fetchone()[0]
+    connection.close()
+    return count
+
+
+HOSPITALS = points([10, 11, 12], [-78.1, -78.2, -78.3], [34.1, 34.2, 34.3])
+ORIGINS = points(list(range(20)), np.linspace(-79.0, -78.0, 20), np.linspace(34.0, 35.0, 20))
+
+
+def test_counter_follows_inserts_updates_and_evictions(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    with pair_cache.PairCache(path, 'network', max_pairs=50) as cache:
+        assert cache.store(HOSPITALS.iloc[:2], ORIGINS.iloc[:10], matrix(HOSPITALS.iloc[:2], ORIGINS.iloc[:10], 0)) == 0
+        assert cache.size() == 20 == table_count(path)
+        # Overlapping pairs are updated in place and not counted twice
+        routed = matrix(HOSPITALS.iloc[:2], ORIGINS.iloc[5:15], 1)
+        assert cache.store(HOSPITALS.iloc[:2], ORIGINS.iloc[5:15], routed) == 0
+        assert cache.size() == 30 == table_count(path)
+        h_pos, o_pos, times = cache.lookup(HOSPITALS.iloc[:2], ORIGINS.iloc[5:15])
+        expected = routed.set_index(['from_id', 'to_id'])['travel_time']
+        found = pd.Series(times, index=pd.MultiIndex.from_arrays(
+            [HOSPITALS['id'].to_numpy()[h_pos], ORIGINS['id'].to_numpy()[5:15][o_pos]]))
+        pd.testing.assert_series_equal(found.sort_index(), expected.sort_index(), check_names=False)
+        assert cache.store(HOSPITALS, ORIGINS, matrix(HOSPITALS, ORIGINS, 2)) == 10
+        assert cache.size() == 50 == table_count(path)
+    # A reopened cache keeps its count
+    with pair_cache.PairCache(path, 'other network', max_pairs=50) as cache:
+        assert cache.size() == 50
+
+
+def test_lookup_refreshes_only_the_pairs_found(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    with pair_cache.PairCache(path, 'network') as cache:
+        cache.store(HOSPITALS, ORIGINS, matrix(HOSPITALS, ORIGINS, 3))
+        cache.connection.execute("UPDATE pairs SET last_used = 0")
+        cache.lookup(HOSPITALS.iloc[[1]], ORIGINS.iloc[[2, 7]])
+        used = cache.connection.execute("SELECT COUNT(*) FROM pairs WHERE last_used > 0").fetchone()[0]
+        assert used == 2
+
+
+def test_counter_initialized_on_a_cache_without_it(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    with pair_cache.PairCache(path, 'network') as cache:
+        cache.store(HOSPITALS, ORIGINS, matrix(HOSPITALS, ORIGINS, 4))
+        cache.connection.executescript("DROP TRIGGER pairs_inserted; DROP TRIGGER pairs_deleted; "
+                                       "DROP TABLE pair_count;")
+    with pair_cache.PairCache(path, 'network') as cache:
+        assert cache.size() == 60 == table_count(path)
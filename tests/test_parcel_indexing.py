@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import parcel_indexing
+
+
+def assign_parcel_indices_groupby(points_with_polygon_index, lat_col='p_latitude', lon_col='p_longitude'):
+    """The per-group copy version prep_spatial_csv_files used before assign_parcel_indices."""
+    def assign_new_index(df):
+        df = df.copy()
+        df['point_index_within_polygon'] = range(1, len(df) + 1)
+        df['new_index'] = df['poly_idx'] * 10000 + df['point_index_within_polygon']
+        return df
+
+    groups = [assign_new_index(df) for _, df in points_with_polygon_index.groupby('poly_idx')]
+    points_with_new_index = pd.concat(groups).reset_index(drop=True)
+    avg_coords = points_with_new_index.groupby('poly_idx').agg({lat_col: 'mean', lon_col: 'mean'}).reset_index()
+    avg_coords.columns = ['county_index', 'latitude', 'longitude']
+    avg_coords['county_index'] = avg_coords['county_index'].astype(int)
+    return points_with_new_index, avg_coords
+
+
+def joined_parcels(seed, num_parcels=400, num_tracts=12):
+    """Spatial join output: tracts in random order, parcels outside every tract, repeated coordinates."""
+    rng = np.random.default_rng(seed)
+    poly_idx = rng.integers(1, num_tracts + 1, num_parcels).astype(float)
+    poly_idx[rng.random(num_parcels) < 0.1] = np.nan
+    latitude = np.round(rng.uniform(34.0, 35.0, num_parcels), 4)
+    longitude = np.round(rng.uniform(-79.0, -78.0, num_parcels), 4)
+    # Condos and townhouses: several parcels share the coordinates of another parcel
+    shared = rng.random(num_parcels) < 0.2
+    source = rng.integers(0, num_parcels, num_parcels)
+    latitude[shared], longitude[shared] = latitude[source[shared]], longitude[source[shared]]
+    return pd.DataFrame({
+        'PARNO': np.arange(num_parcels),
+        'p_latitude': latitude,
+        'p_longitude': longitude,
+        'poly_idx': poly_idx,
+    }, index=rng.permutation(num_parcels) + 1000)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_groupby_version(seed):
+    parcels = joined_parcels(seed)
+    expected_points, expected_coords = assign_parcel_indices_groupby(parcels)
+    actual_points, actual_coords = parcel_indexing.assign_parcel_indices(parcels)
+    columns = ['PARNO', 'p_latitude', 'p_longitude', 'poly_idx', 'point_index_within_polygon', 'new_index']
+    pd.testing.assert_frame_equal(actual_points[columns], expected_points[columns])
+    pd.testing.assert_frame_equal(actual_coords, expected_coords)
+
+
+def test_numbering_follows_the_original_order_within_each_tract():
+    parcels = pd.DataFrame({
+        'PARNO': [10, 11, 12, 13, 14, 15],
+        'p_latitude': [34.1, 34.2, 34.1, 34.3, 34.1, 34.5],
+        'p_longitude': [-78.1, -78.2, -78.1, -78.3, -78.1, -78.5],
+        'poly_idx': [7.0, 2.0, 7.0, np.nan, 2.0, 7.0],
+    })
+    points, coords = parcel_indexing.assign_parcel_indices(parcels)
+    assert points['PARNO'].tolist() == [11, 14, 10, 12, 15]
+    assert points['point_index_within_polygon'].tolist() == [1, 2, 1, 2, 3]
+    assert points['new_index'].tolist() == [20001, 20002, 70001, 70002, 70003]
+    assert coords['county_index'].tolist() == [2, 7]
+    np.testing.assert_allclose(coords['latitude'], [34.15, (34.1 + 34.1 + 34.5) / 3])
+    np.testing.assert_allclose(coords['longitude'], [-78.15, (-78.1 - 78.1 - 78.5) / 3])
+
+
+def test_no_parcel_in_any_tract():
+    parcels = joined_parcels(0).assign(poly_idx=np.nan)
+    points, coords = parcel_indexing.assign_parcel_indices(parcels)
+    assert len(points) == 0 and len(coords) == 0
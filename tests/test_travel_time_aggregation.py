@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import travel_time_aggregation
+
+STATISTICS = ['min_travel_time', 'second_min_travel_time', 'third_min_travel_time', 'median_travel_time',
+              'average_travel_time', 'q1_travel_time', 'q3_travel_time']
+
+
+def aggregate_travel_times_pandas(travel_times):
+    """The groupby/lambda aggregation find_tt_matrix used before aggregate_travel_times."""
+    return travel_times.groupby('to_id')['travel_time'].agg([
+        ('min_travel_time', 'min'),
+        ('second_min_travel_time', lambda x: x.nsmallest(2).iloc[-1] if len(x) >= 2 else None),
+        ('third_min_travel_time', lambda x: x.nsmallest(3).iloc[-1] if len(x) >= 3 else None),
+        ('median_travel_time', 'median'),
+        ('average_travel_time', 'mean'),
+        ('q1_travel_time', lambda x: x.quantile(0.25)),
+        ('q3_travel_time', lambda x: x.quantile(0.75))
+    ]).reset_index()
+
+
+def random_matrix(seed, num_hospitals=7, num_origins=60, unreachable=0.15):
+    """Full matrix with whole-minute times (many ties), unreachable pairs and shuffled rows."""
+    rng = np.random.default_rng(seed)
+    travel_times = pd.DataFrame({
+        'from_id': np.repeat(np.arange(1, num_hospitals + 1), num_origins),
+        'to_id': np.tile(np.arange(10001, 10001 + num_origins), num_hospitals),
+        'travel_time': rng.integers(5, 20, num_hospitals * num_origins).astype(float),
+    })
+    travel_times.loc[rng.random(len(travel_times)) < unreachable, 'travel_time'] = np.nan
+    return travel_times.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def edge_cases():
+    """Origins with 1 or 2 routed hospitals, only unreachable hospitals, fewer than 3 reachable, and ties."""
+    return pd.DataFrame([
+        (1, 1, 12.0),
+        (1, 2, 7.0), (2, 2, 9.0),
+        (1, 3, np.nan), (2, 3, np.nan), (3, 3, np.nan),
+        (1, 4, 15.0), (2, 4, np.nan), (3, 4, 11.0), (4, 4, np.nan),
+        (1, 5, 8.0), (2, 5, 8.0), (3, 5, 8.0), (4, 5, 3.0),
+        (3, 6, 20.0), (1, 6, 20.0), (2, 6, 10.0),
+    ], columns=['from_id', 'to_id', 'travel_time'])
+
+
+def assert_matches_pandas(travel_times):
+    expected = aggregate_travel_times_pandas(travel_times)
+    actual = travel_time_aggregation.aggregate_travel_times(travel_times)
+    np.testing.assert_array_equal(actual['to_id'].to_numpy(), expected['to_id'].to_numpy())
+    for column in STATISTICS:
+        np.testing.assert_allclose(actual[column].astype(float), expected[column].astype(float),
+                                   equal_nan=True, err_msg=column)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_pandas_on_random_matrices(seed):
+    assert_matches_pandas(random_matrix(seed))
+
+
+def test_matches_pandas_on_edge_cases():
+    assert_matches_pandas(edge_cases())
+
+
+def test_matches_pandas_with_few_hospitals():
+    # Fewer hospitals than k: the third minimum is never reported
+    assert_matches_pandas(random_matrix(7, num_hospitals=2, num_origins=20, unreachable=0.3))
+
+
+def test_nearest_hospital_ids_point_at_the_kth_times():
+    travel_times = random_matrix(3)
+    result = travel_time_aggregation.aggregate_travel_times(travel_times, k=3).set_index('to_id')
+    lookup = travel_times.set_index(['from_id', 'to_id'])['travel_time']
+    for n, column in enumerate(['min_travel_time', 'second_min_travel_time', 'third_min_travel_time'], start=1):
+        for to_id, row in result.iterrows():
+            hospital_id = row[f'nearest_{n}_hospital_id']
+            if pd.isna(hospital_id):
+                assert (lookup.xs(to_id, level='to_id').notna().sum()) < n
+            else:
+                assert lookup[(hospital_id, to_id)] == row[column]
+
+
+def test_nearest_hospital_ids_are_distinct_under_ties():
+    result = travel_time_aggregation.aggregate_travel_times(edge_cases(), k=3).set_index('to_id')
+    tied = result.loc[5, ['nearest_1_hospital_id', 'nearest_2_hospital_id', 'nearest_3_hospital_id']].tolist()
+    # Hospital 4 is nearest; hospitals 1, 2 and 3 tie at 8 minutes and two of them follow
+    assert tied[0] == 4 and len(set(tied)) == 3 and set(tied[1:]) <= {1, 2, 3}
+    assert result.loc[3, 'nearest_1_hospital_id'] is pd.NA
+
+
+def test_more_than_three_nearest():
+    result = travel_time_aggregation.aggregate_travel_times(edge_cases(), k=4).set_index('to_id')
+    assert result.loc[5, '4th_min_travel_time'] == 8.0
+    assert np.isnan(result.loc[2, '4th_min_travel_time'])
+
+
+def test_pruned_leaves_all_hospital_statistics_empty():
+    travel_times = random_matrix(1)
+    full = travel_time_aggregation.aggregate_travel_times(travel_times)
+    pruned = travel_time_aggregation.aggregate_travel_times(travel_times, pruned=True)
+    for column in travel_time_aggregation.ALL_HOSPITAL_COLUMNS:
+        assert pruned[column].isna().all()
+        np.testing.assert_allclose(pruned[f'{column}_pruned'], full[column], equal_nan=True)
+    pd.testing.assert_frame_equal(pruned[['to_id', 'min_travel_time', 'nearest_1_hospital_id']],
+                                  full[['to_id', 'min_travel_time', 'nearest_1_hospital_id']])
+
+
+@pytest.mark.parametrize('pruned', [False, True])
+def test_empty_matrix_gives_an_empty_frame_with_every_column(pruned):
+    # A stream batch or exact check in which no pair was routed
+    travel_times = random_matrix(2).assign(travel_time_p50=1.0)
+    expected = travel_time_aggregation.aggregate_travel_times(travel_times, pruned=pruned)
+    empty = travel_time_aggregation.aggregate_travel_times(travel_times.iloc[:0], pruned=pruned)
+    assert len(empty) == 0
+    assert list(empty.columns) == list(expected.columns)
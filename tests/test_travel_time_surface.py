@@ -0,0 +1,38 @@
+import pandas as pd
+
+import geopandas_analysis
+import graph_routing
+import result_io
+import synthetic_county
+import travel_time_analysis
+import travel_time_surface
+
+COUNTY = synthetic_county.DEFAULT_COUNTY
+STATE = synthetic_county.DEFAULT_STATE
+OSM = synthetic_county.DEFAULT_OSM
+
+
+def test_csr_surface_lookup_matches_direct_csr_routing(tmp_path, monkeypatch, capsys):
+    synthetic_county.generate(str(tmp_path), 2000)
+    monkeypatch.chdir(tmp_path)
+    geopandas_analysis.prep_spatial_csv_files(COUNTY, STATE)
+    osm_path = f"state_data/osm/{OSM}.osm.pbf"
+    graph = graph_routing.DriveGraph.load(osm_path)
+    bounds = travel_time_surface.county_bounds([COUNTY], 5000)
+    travel_time_surface.build_surfaces('surfaces', graph.route, travel_time_surface.county_hospitals([COUNTY]),
+                                       bounds, travel_time_analysis.routing_key(osm_path, 'csr'),
+                                       points=travel_time_surface.graph_points(graph, bounds))
+
+    aggregates = {}
+    for surfaces_path in (None, 'surfaces'):
+        summary = travel_time_analysis.find_tt_matrix(COUNTY, STATE, 3, OSM, use_daemon=False, write_raw=False,
+                                                      routing_backend='csr', surfaces_path=surfaces_path,
+                                                      output_dir=f"out_{surfaces_path}")
+        aggregates[surfaces_path] = result_io.read_table(summary['aggregated_path'])
+    direct, looked_up = aggregates[None], aggregates['surfaces']
+
+    # Origins are far from the sparse synthetic road grid, yet within csr's own snap limit
+    assert looked_up['surface_snap_m'].max() > 250
+    assert looked_up['min_travel_time'].notna().all()
+    assert 'Warning' not in capsys.readouterr().out
+    pd.testing.assert_frame_equal(looked_up.drop(columns='surface_snap_m'), direct)